@@ -2,14 +2,32 @@
 # import time
 import csv
 import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from force_analysis import *
+from fast_redraw import ArtistCache
+from render_manifest import RenderManifest
+from checkpoint import BatchCheckpoint
+from instrumentation import add_profile_arguments, profile_run
+from event_log import log, events, configure, add_logging_arguments
+from trial_result import add_analysis_arguments, analysis_arguments
 from matplotlib.animation import FuncAnimation
-from matplotlib.backends.backend_pdf import PdfPages
+from pypdf import PdfWriter
+
+# single-page pdfs of the trials, concatenated into fig.pdf when the batch finishes
+PAGE_FOLDER = os.path.join('.traveler_cache', 'pages')
 
 class BasePlotter(TravelerAnalysisBase):
-    def __init__(self):
-        parser = self.init_argparse()
-        self.args = parser.parse_args()
+    def __init__(self, args=None, paths=None):
+        if (args is None):
+            parser = self.init_argparse()
+            args = parser.parse_args()
+        self.args = args
+        configure(self.args.quiet, self.args.verbose, self.args.events)
+        if (self.args.profile and self.args.jobs > 1):
+            # stages are only timed in this process
+            log.info('NOTICE: --profile renders with a single process')
+            self.args.jobs = 1
         if (self.args.single):
             self.mode = 's'
             bypass_selection = True
@@ -17,15 +35,20 @@ class BasePlotter(TravelerAnalysisBase):
             self.mode = 'b'
             bypass_selection = True
 
-        super().__init__(_bypass_selection=bypass_selection)
+        super().__init__(_bypass_selection=bypass_selection, _paths=paths)
         self.trimTrailingData = False
+        self.config.update(**analysis_arguments(self.args))
         # overwrite the axes definition in the base class
         self.fig, self.ax = plt.subplots(figsize=(12,6))
-        self.pdf = None
-
-        # self.csv_file = open(os.path.join(self.filepath, 'invalid_files.csv'), mode='w')
-        # create a csv writer
-        # self.csv_writer = csv.writer(self.csv_file, delimiter=',')
+        self.pages = [] # page files of fig.pdf, in path order
+        self.pdf_folder = None # figures directory the multi-page pdf is written to
+        self.pdf_needed = True
+        self.stale_pngs = set()
+        self.manifests = {}
+        self.checkpoint = None
+        if (self.args.fast and not self.args.compound):
+            self.artists = ArtistCache(self.fig)
+        self.open_registry(self.args.recheck)
 
     def init_argparse(self) -> argparse.ArgumentParser:
         parser = argparse.ArgumentParser(
@@ -54,62 +77,242 @@ class BasePlotter(TravelerAnalysisBase):
         parser.add_argument(
             '--xaxis', action='store', default=3, help='Input the x-limit upper bound (defaults to 3 cm)'
         )
+        parser.add_argument(
+            '-f', '--fast', action='store_true', help='Reuses the plot artists between trials instead of clearing the axes (faster batch plotting, ignored with --compound)'
+        )
+        parser.add_argument(
+            '-j', '--jobs', action='store', type=int, default=1, help='Number of worker processes used to render figures in batch mode (defaults to 1). Each trial is saved as its own .png'
+        )
+        parser.add_argument(
+            '--resume', action='store_true', help='Continues an interrupted batch from its last completed trial instead of starting over'
+        )
+        parser.add_argument(
+            '--recheck', action='store_true', help='Analyzes the trials found invalid by earlier runs again instead of skipping them'
+        )
+        add_analysis_arguments(parser)
+        add_profile_arguments(parser)
+        add_logging_arguments(parser)
 
         return parser
 
     def process_file(self):
         super().process_file()
         if (self.curr_file_valid == True):
-            # write self.path to csv file
             self.save_plot()
 
 
     
     def run(self):
-        for self.path in self.paths:
-            if ('valid' in self.path):
-                continue
-            if (not self.args.compound):
+        # trials found invalid by earlier runs are skipped by the invalid trial registry
+        paths = self.plan_renders(list(self.paths))
+        if (len(paths) == 0):
+            log.info('All figures are up to date.')
+            return
+
+        paths = self.resume_renders(paths)
+        if (self.args.jobs > 1 and not self.args.compound):
+            self.run_parallel(paths)
+            return
+
+        for self.path in paths:
+            if (not self.args.compound and self.artists is None):
                 self.ax.clear()
 
-            self.process_file()
+            self.process_file_isolated()
+            if (self.checkpoint is not None):
+                self.checkpoint.record(self.path, self.render_state())
 
             self.path_index += 1
             self.fig.show()
             # plt.show()
         
+        self.finish_renders()
         plt.show()
-        self.pdf.close()
 
+    def run_parallel(self, paths):
+        # Worker processes analyze and render trials with the Agg backend and save a .png and
+        # a pdf page per trial. The pages are concatenated here in path order when the batch
+        # finishes, so the pdf matches the one produced by a serial run.
+        log.info('Rendering %d files with %d worker processes...', len(paths), self.args.jobs)
+
+        tasks = [(path, path in self.stale_pngs, self.pdf_needed) for path in paths]
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.args.jobs, mp_context=context,
+                                 initializer=init_render_worker, initargs=(self.args,)) as executor:
+            for path, output_path, png_written, page_file, worker_events, status in executor.map(render_trial, tasks, chunksize=4):
+                events.merge(worker_events)
+                state = (output_path, png_written, page_file, status)
+                if (self.checkpoint is not None):
+                    self.checkpoint.record(path, state)
+                self.add_render(path, *state)
+                self.path_index += 1
+
+        self.finish_renders()
+        log.info('Rendering Complete!')
+
+    def add_render(self, path, output_path, png_written, page_file, status):
+        # adds a trial rendered elsewhere (by a worker process, or before an interrupted run stopped)
+        self.path = path
+        self.register_trial(path, *status)
+        if (png_written):
+            self.record_png(path)
+        if (page_file is not None):
+            self.add_page(output_path, page_file)
+
+    ## Checkpoints (see checkpoint.py)
+    def resume_renders(self, paths):
+        # restores the trials completed by an interrupted run (with --resume), returning the paths left
+        if (self.args.compound):
+            # the compound figure is drawn over all trials, so it can not be restored part way
+            return paths
+        settings = {'render': self.render_settings(), 'pdf': self.pdf_needed, 'pngs': sorted(self.stale_pngs)}
+        self.checkpoint = BatchCheckpoint('basic_plotter', paths, settings, self.args.resume)
+
+        # the pdf pages of the completed trials are kept in their page files until the batch finishes
+        missing = [page_file for path, (output_path, png_written, page_file, status) in self.checkpoint.completed
+                   if page_file is not None and not os.path.exists(page_file)]
+        if (len(missing) > 0):
+            log.warning('WARNING: Pdf page %s of a completed trial is missing... processing all files...', missing[0])
+            self.checkpoint.finish()
+            self.checkpoint = BatchCheckpoint('basic_plotter', paths, settings)
+
+        for path, state in self.checkpoint.completed:
+            self.add_render(path, *state)
+            self.path_index += 1
+        return paths[len(self.checkpoint.completed):]
+
+    def render_state(self):
+        # the checkpoint record of the current trial, as render_trial() returns it
+        status = (self.curr_file_valid, self.invalid_stage, self.invalid_reason)
+        if (self.curr_file_valid == False):
+            return None, False, None, status
+        page_file = self.page_file(self.path) if self.pdf_needed else None
+        return self.output_path, self.path in self.stale_pngs, page_file, status
+
+    ## Incremental rendering (see render_manifest.py)
+    def render_settings(self):
+        return {
+            'xaxis': str(self.args.xaxis),
+            'compound': self.args.compound,
+            'dpi': 300,
+            'config': self.config.config_hash()
+        }
+
+    def png_name(self, path):
+        # stable per-trial figure names (compound plots have one figure for all trials)
+        if (self.args.compound):
+            return 'compound.png'
+        return path.split('/')[-1].replace('.csv', '.png')
+
+    def get_manifest(self, path):
+        return self.folder_manifest(self.figure_folder(path))
+
+    def folder_manifest(self, folder):
+        if (folder not in self.manifests):
+            self.manifests[folder] = RenderManifest(folder)
+        return self.manifests[folder]
+
+    def plan_renders(self, paths):
+        # returns the paths that have to be processed to bring the figures up to date
+        if (len(paths) == 0):
+            return paths
+        self.render_paths = paths
+        settings = self.render_settings()
+
+        # the pdf is written next to the figures of the first valid trial
+        valid_paths = [path for path in paths if not self.known_invalid(path)]
+        pdf_manifest = self.get_manifest(valid_paths[0] if len(valid_paths) > 0 else paths[0])
+        self.pdf_needed = not pdf_manifest.is_fresh('fig.pdf', paths, settings)
+
+        if (self.args.compound):
+            if (self.pdf_needed or not pdf_manifest.is_fresh('compound.png', paths, settings)):
+                self.stale_pngs = set(paths)
+                return paths
+            return []
+
+        # trials known to be invalid have no figure, so they are not stale (--recheck analyzes them again)
+        self.stale_pngs = set(path for path in valid_paths if not self.get_manifest(path).is_fresh(self.png_name(path), [path], settings))
+        if (self.pdf_needed):
+            return paths
+
+        if (len(self.stale_pngs) > 0):
+            log.info('Multi-page pdf is up to date. Regenerating %d of %d figures...', len(self.stale_pngs), len(paths))
+        return [path for path in paths if path in self.stale_pngs]
+
+    def known_invalid(self, path):
+        return self.invalid_registry is not None and self.invalid_registry.lookup(path) is not None
+
+    def record_png(self, path):
+        if (not self.args.compound):
+            self.get_manifest(path).record(self.png_name(path), [path], self.render_settings())
+
+    def finish_renders(self):
+        settings = self.render_settings()
+        if (len(self.pages) > 0):
+            merge_pages(self.pages, os.path.join(self.pdf_folder, 'fig.pdf'))
+            for page_file in self.pages:
+                os.remove(page_file)
+            remove_empty_folders(self.pages)
+            self.folder_manifest(self.pdf_folder).record('fig.pdf', self.render_paths, settings)
+            if (self.args.compound):
+                self.folder_manifest(self.pdf_folder).record('compound.png', self.render_paths, settings)
+            self.pages = []
+
+        for manifest in self.manifests.values():
+            manifest.save()
+        self.save_registry()
+        if (self.checkpoint is not None):
+            self.checkpoint.finish()
+            self.checkpoint = None
+
+    ## Pdf pages
+    def page_file(self, path):
+        folder = os.path.join(os.path.dirname(os.path.abspath(path)), PAGE_FOLDER)
+        return os.path.join(folder, os.path.basename(path).replace('.csv', '.pdf'))
+
+    def save_page(self):
+        # writes the current figure as the trial's page of fig.pdf
+        page_file = self.page_file(self.path)
+        os.makedirs(os.path.dirname(page_file), exist_ok=True)
+        self.fig.savefig(page_file, format='pdf', bbox_inches='tight', dpi=300)
+        return page_file
+
+    def add_page(self, output_path, page_file):
+        # the multi-page pdf is written to the figures directory of the first valid trial
+        if (len(self.pages) == 0):
+            self.pdf_folder = output_path
+        self.pages.append(page_file)
 
     # called by super.process_file()
     def plot_force(self):
         # reinitialize vectors based on changes from minmax finder
-        pos = self.data_dict['trimmed_pos']
-        force = self.data_dict['trimmed_force']
-        time = self.data_dict['trimmed_time']
-        average_force = self.data_dict['average_force']
-        smooth_pos = self.data_dict['smoothed_pos']
-        smooth_force = self.data_dict['smoothed_force']
-        max_indices = self.data_dict['max_indices']
-        min_indices = self.data_dict['min_indices']
+        pos = self.record.trimmed_pos
+        force = self.record.trimmed_force
+        time = self.record.trimmed_time
+        average_force = self.record.average_force
+        smooth_pos = self.record.smoothed_pos
+        smooth_force = self.record.smoothed_force
+        max_indices = self.record.max_indices
+        min_indices = self.record.min_indices
         
-        if (average_force < 0 and self.data_dict['mode'] == 0):
-            print('WARNING: Irregular Force Profile Detected... skipping file...')
-            self.curr_file_valid = False
+        if (average_force < 0 and self.record.mode == 0 and self.curr_file_valid):
+            self.invalidate('plot_force', 'irregular force profile', 'WARNING: Irregular Force Profile Detected... skipping file...')
         
         if (self.curr_file_valid == False):
             return
 
+        # multiply pos by 100 to convert to cm (the trimmed position itself stays in meters)
+        pos = 100 * pos
 
-        # multiply pos by 100 to convert to cm
-        pos *= 100
+        if (self.artists is not None):
+            self.plot_force_fast(pos, force)
+            return
 
         self.ax.plot(pos, force, '-', label="Raw Force", linewidth=3)
         # self.ax.plot(smooth_pos[min_indices], smooth_force[min_indices], "v", label="Local Minima", markersize=10, markerfacecolor='r')
         # self.ax.plot(smooth_pos[max_indices], smooth_force[max_indices], "^", label="Local Maxima", markersize=10, markerfacecolor='g')
 
-        if (self.data_dict.get('mode') == 0):
+        if (self.record.mode == 0):
             self.ax.set_xlabel('Vertical Depth (cm)', fontsize=20)
             self.ax.set_ylabel('Penetration Force (N)', fontsize=20)
             self.ax.set_xlim(0, int(self.args.xaxis))
@@ -117,22 +320,100 @@ class BasePlotter(TravelerAnalysisBase):
             self.ax.set_xlabel('Shear Length (meters)', fontsize=18)
             self.ax.set_ylabel('Shear Force (N)', fontsize=18)
         
-        self.fig.suptitle(self.data_dict.get("suptitle"), fontsize=24)
-        self.ax.set_title(self.data_dict.get("notes"), fontsize=18)
+        self.fig.suptitle(self.record.suptitle, fontsize=24)
+        self.ax.set_title(self.record.notes, fontsize=18)
         self.ax.legend()
         self.ax.tick_params(labelsize=20)
 
+    def plot_force_fast(self, pos, force):
+        # same figure as plot_force(), updating the existing artists in place (pos in cm)
+        self.artists.begin()
+        self.artists.line(self.ax, 'force', pos, force, '-', label="Raw Force", linewidth=3)
+
+        if (self.record.mode == 0):
+            self.artists.xlabel(self.ax, 'Vertical Depth (cm)', fontsize=20)
+            self.artists.ylabel(self.ax, 'Penetration Force (N)', fontsize=20)
+            self.artists.set_xlim(self.ax, 0, int(self.args.xaxis))
+        else:
+            self.artists.xlabel(self.ax, 'Shear Length (meters)', fontsize=18)
+            self.artists.ylabel(self.ax, 'Shear Force (N)', fontsize=18)
+            self.artists.free_xlim(self.ax)
+
+        self.artists.suptitle(self.record.suptitle, fontsize=24)
+        self.artists.title(self.ax, self.record.notes, fontsize=18)
+        self.artists.legend(self.ax)
+        self.artists.tick_params(self.ax, labelsize=20)
+        self.artists.finish()
+
     def save_plot(self, fig_folder='figures'):
         super().save_plot()
-        if (self.pdf == None) :
-            pdf_save_name = 'fig.pdf'
-            self.pdf = PdfPages(os.path.join(self.output_path, pdf_save_name))
-        self.pdf.savefig(bbox_inches='tight',dpi=300)
+        if (self.pdf_needed):
+            self.add_page(self.output_path, self.save_page())
         
-        eps_save_name = 'fig.png'
-        self.fig.savefig(os.path.join(self.output_path, eps_save_name), format='png', bbox_inches='tight',dpi=300)
+        if (self.path in self.stale_pngs):
+            png_save_name = self.png_name(self.path)
+            self.fig.savefig(os.path.join(self.output_path, png_save_name), format='png', bbox_inches='tight',dpi=300)
+            self.record_png(self.path)
+
+
+## Parallel rendering (see BasePlotter.run_parallel)
+render_plotter = None
+
+def init_render_worker(args):
+    global render_plotter
+    plt.switch_backend('Agg')
+    render_plotter = BasePlotter(args=args, paths=[])
+
+def merge_pages(page_files, pdf_path):
+    # concatenates the single-page pdfs, in order, into pdf_path
+    writer = PdfWriter()
+    for page_file in page_files:
+        writer.append(page_file)
+    # every page embeds the same fonts; they are written once
+    writer.compress_identical_objects()
+    tmp_path = pdf_path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        writer.write(file)
+    os.replace(tmp_path, pdf_path)
+
+def remove_empty_folders(page_files):
+    for folder in set(os.path.dirname(page_file) for page_file in page_files):
+        if (os.path.isdir(folder) and len(os.listdir(folder)) == 0):
+            os.rmdir(folder)
+
+def render_trial(task):
+    # analyzes and renders one trial, saving its .png and pdf page
+    path, write_png, write_page = task
+    plotter = render_plotter
+    plotter.path = path
+    if (plotter.artists is None):
+        plotter.ax.clear()
+
+    page_file = None
+    plotter.begin_trial()
+    try:
+        TravelerAnalysisBase.process_file(plotter)
+        if (plotter.curr_file_valid):
+            TravelerAnalysisBase.save_plot(plotter)
+            if (write_png):
+                png_save_name = plotter.png_name(path)
+                plotter.fig.savefig(os.path.join(plotter.output_path, png_save_name), format='png', bbox_inches='tight', dpi=300)
+            if (write_page):
+                page_file = plotter.save_page()
+    except Exception as error:
+        plotter.trial_failed(error)
+
+    # the invalid trial registry is updated by the main process
+    status = (plotter.curr_file_valid, plotter.invalid_stage, plotter.invalid_reason)
+    if (plotter.curr_file_valid == False):
+        return path, None, False, None, events.drain(), status
+
+    return path, plotter.output_path, write_png, page_file, events.drain(), status
 
 
 if __name__ == "__main__":
     plotter = BasePlotter()
-    plotter.run()
\ No newline at end of file
+    if (plotter.args.profile):
+        profile_run(plotter, plotter.run, plotter.args.profile, plotter.args.cprofile)
+    else:
+        plotter.run()
\ No newline at end of file
@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import zlib
+import pickle
+import hashlib
+from event_log import log
+
+
+"""
+    Class: BatchCheckpoint
+    Description:
+        Append-only log of the trials completed by a batch run, so an
+        interrupted run (exception, Ctrl-C, exit()) can be resumed with
+        --resume instead of starting over. Each completed trial appends one
+        record (path, payload), where the payload is whatever the batch needs
+        to restore the trial's outputs without analyzing it again, e.g. the
+        files of its figures or its metrics.csv row. Records are compressed
+        and written in groups, every CHECKPOINT_EVERY trials or
+        CHECKPOINT_INTERVAL seconds, so an interruption loses at most the
+        trials since the last write; a record cut short by a crash is dropped
+        when the log is read.
+
+        The log is stored as .traveler_cache/<name>.checkpoint in the data
+        directory, and is keyed by the paths of the batch, their size and
+        modification time, and the settings of the run. It is only resumed if
+        the key matches, and is deleted once the batch finishes.
+
+        Usage:
+            checkpoint = BatchCheckpoint('basic_plotter', paths, settings, resume)
+            for path, payload in checkpoint.completed:
+                ... restore the outputs of path ...
+            for path in paths[len(checkpoint.completed):]:
+                ... process path ...
+                checkpoint.record(path, payload)
+            checkpoint.finish()
+"""
+
+CHECKPOINT_VERSION = 1
+CHECKPOINT_FOLDER = '.traveler_cache'
+CHECKPOINT_EVERY = 25      # trials between writes
+CHECKPOINT_INTERVAL = 10.0 # seconds between writes
+
+
+def checkpoint_key(paths, settings):
+    files = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            files.append([path, stat.st_size, stat.st_mtime_ns])
+        except OSError:
+            files.append([path, None, None])
+    text = json.dumps([CHECKPOINT_VERSION, files, settings], sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class BatchCheckpoint:
+    def __init__(self, name, paths, settings, resume=False):
+        folder = os.path.dirname(os.path.abspath(paths[0])) if len(paths) > 0 else os.getcwd()
+        self.file_path = os.path.join(folder, CHECKPOINT_FOLDER, name + '.checkpoint')
+        self.completed = [] # (path, payload) of the trials completed before the interruption, in order
+        self.pending = []   # records not written yet
+        self.last_write = time.monotonic()
+        self.file = None
+        self.key = checkpoint_key(paths, settings)
+
+        offset = 0
+        if (resume):
+            offset = self.load(paths)
+        self.open(offset)
+
+    def load(self, paths):
+        # reads the completed trials, returning the offset after the last complete record
+        if (not os.path.exists(self.file_path)):
+            log.info('No checkpoint to resume from... processing all %d files...', len(paths))
+            return 0
+
+        offset = 0
+        with open(self.file_path, 'rb') as file:
+            try:
+                if (pickle.load(file) != self.key):
+                    log.warning('WARNING: Checkpoint %s was written for other files or settings... processing all files...', self.file_path)
+                    return 0
+                offset = file.tell()
+                while True:
+                    self.completed.append(pickle.loads(zlib.decompress(pickle.load(file))))
+                    offset = file.tell()
+            except Exception:
+                # end of the log, or a last record cut short by the interruption
+                pass
+
+        # records are written in path order, so the completed trials are the first paths
+        count = len(self.completed)
+        if ([path for path, payload in self.completed] != list(paths[:count])):
+            log.warning('WARNING: Checkpoint %s does not match the files... processing all files...', self.file_path)
+            self.completed = []
+            return 0
+        log.info('Resuming: %d of %d files restored from the checkpoint...', count, len(paths))
+        return offset
+
+    def open(self, offset):
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        if (offset > 0):
+            self.file = open(self.file_path, 'r+b')
+            self.file.truncate(offset)
+            self.file.seek(offset)
+        else:
+            self.file = open(self.file_path, 'wb')
+            pickle.dump(self.key, self.file)
+            self.file.flush()
+
+    def record(self, path, payload):
+        self.pending.append(zlib.compress(pickle.dumps((path, payload), protocol=pickle.HIGHEST_PROTOCOL), 1))
+        if (len(self.pending) >= CHECKPOINT_EVERY or time.monotonic() - self.last_write >= CHECKPOINT_INTERVAL):
+            self.write()
+
+    def write(self):
+        for data in self.pending:
+            pickle.dump(data, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.file.flush()
+        self.pending = []
+        self.last_write = time.monotonic()
+
+    def finish(self):
+        # the batch completed, so there is nothing left to resume
+        self.file.close()
+        os.remove(self.file_path)
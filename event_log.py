@@ -0,0 +1,152 @@
+import sys
+import json
+import time
+import atexit
+import logging
+
+
+"""
+    Class: EventLog
+    Description:
+        Structured log of the analysis pipeline. Progress and per-trial detail
+        go through the 'traveler' logger with levels instead of print():
+
+            - DEBUG: per-trial detail (file name, trial type, trimming range)
+            - INFO: batch progress and results (the default level)
+            - WARNING: problems with a trial
+            - SUMMARY: the end-of-run summary, which is also printed with --quiet
+
+        Trial warnings (irregular force profiles, ranging errors, outlier
+        slopes, ...) are counted by category. Only the first few of each
+        category are printed; all of them are listed in a summary table at
+        the end of the run. With an events file, one JSON line is appended per
+        trial with its status, the reason it was skipped and its warnings, e.g.
+
+            {"time": 1700000000.0, "path": ".../MH23_L2_T1_P_F0_....csv",
+             "status": "invalid", "stage": "process_data",
+             "reason": "trimmed data too short", "warnings": []}
+
+        Usage:
+            configure(quiet=args.quiet, verbose=args.verbose, events_file=args.events)
+            log.info('...')
+            events.warn('outlier slope', 'Outlier Slope: 26000.0', path)
+            events.trial(path, valid, stage, reason)
+"""
+
+log = logging.getLogger('traveler')
+MAX_REPEATS = 3 # warnings of one category printed before they are only counted
+SUMMARY = logging.WARNING + 5
+logging.addLevelName(SUMMARY, 'SUMMARY')
+
+
+class EventLog:
+    def __init__(self, max_repeats=MAX_REPEATS):
+        self.max_repeats = max_repeats
+        self.counts = {} # category -> number of warnings
+        self.examples = {} # category -> first file with the warning
+        self.statuses = {} # trial status -> number of trials
+        self.pending = [] # warnings of the current trial
+        self.file = None
+
+    def open(self, path):
+        # appends to the events file, so a run can be split over several invocations (and
+        # worker processes can write to it too)
+        if (self.file is not None):
+            if (self.file.name == path):
+                return
+            self.file.close()
+        self.file = open(path, 'a', buffering=1)
+
+    def warn(self, category, message, path=None):
+        count = self.counts.get(category, 0) + 1
+        self.counts[category] = count
+        if (category not in self.examples and path is not None):
+            self.examples[category] = path
+        self.pending.append(category)
+
+        if (count <= self.max_repeats):
+            log.warning(message)
+        if (count == self.max_repeats):
+            log.warning('   (further "%s" warnings are counted in the summary)', category)
+
+    def trial(self, path, valid, stage=None, reason=None, **fields):
+        status = 'valid' if valid else 'invalid'
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if (self.file is not None):
+            event = {'time': time.time(), 'path': path, 'status': status,
+                     'stage': stage, 'reason': reason, 'warnings': self.pending}
+            event.update(fields)
+            self.file.write(json.dumps(event) + '\n')
+        self.pending = []
+
+    def drain(self):
+        # returns and clears the counts collected so far (sent from worker processes to the main process)
+        counts = {'counts': self.counts, 'examples': self.examples, 'statuses': self.statuses}
+        self.counts, self.examples, self.statuses = {}, {}, {}
+        return counts
+
+    def merge(self, counts):
+        for category, count in counts['counts'].items():
+            self.counts[category] = self.counts.get(category, 0) + count
+        for category, path in counts['examples'].items():
+            self.examples.setdefault(category, path)
+        for status, count in counts['statuses'].items():
+            self.statuses[status] = self.statuses.get(status, 0) + count
+
+    def summary(self):
+        if (len(self.statuses) == 0 and len(self.counts) == 0):
+            return
+        log.log(SUMMARY, '\nTrials: %d valid, %d invalid', self.statuses.get('valid', 0), self.statuses.get('invalid', 0))
+        if (len(self.counts) == 0):
+            return
+        log.log(SUMMARY, '  %-36s %8s   %s', 'warning', 'count', 'first file')
+        for category, count in sorted(self.counts.items(), key=lambda item: -item[1]):
+            log.log(SUMMARY, '  %-36s %8d   %s', category, count, self.examples.get(category, ''))
+
+    def close(self):
+        self.summary()
+        if (self.file is not None):
+            self.file.close()
+            self.file = None
+
+
+events = EventLog()
+_configured = False
+
+
+def configure(quiet=False, verbose=False, events_file=None):
+    # sets the log level and output, and prints the summary when the program exits.
+    # Only called by the command line scripts: importing this module does not add handlers
+    global _configured
+    if (quiet):
+        level = logging.WARNING
+    elif (verbose):
+        level = logging.DEBUG
+    else:
+        level = logging.INFO
+    log.setLevel(level)
+
+    if (not _configured):
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        log.addHandler(handler)
+        log.propagate = False
+        atexit.register(events.close)
+        _configured = True
+
+    if (events_file):
+        events.open(events_file)
+    return log
+
+
+def add_logging_arguments(parser):
+    parser.add_argument(
+        '-q', '--quiet', action='store_true', help='Only prints warnings and the end-of-run summary'
+    )
+    parser.add_argument(
+        '--verbose', action='store_true', help='Also prints the per-trial detail (file names, trimming ranges, ...)'
+    )
+    parser.add_argument(
+        '--events', action='store', default=None, metavar='FILE', help='Appends one JSON line per trial (status, skip reason, warnings) to FILE'
+    )
+
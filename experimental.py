@@ -1,4 +1,5 @@
 from force_analysis import *
+from fast_redraw import ArtistCache
 import numpy as np
 from scipy.fft import fft
 from scipy.signal import find_peaks
@@ -9,21 +10,25 @@ from scipy.interpolate import Akima1DInterpolator
 
 
 class Experimental(TravelerAnalysisBase):
-    def __init__(self):
+    def __init__(self, fast_redraw=False, recheck=False):
         super().__init__(_bypass_selection=False)
         # overwrite the axes definition in the base class
         self.fig, (self.ax, self.ax2, self.ax3) = plt.subplots(3, 1, figsize=(12,9))
         # self.fig.tight_layout(pad=10.0)
         self.force_detrended = None
         self.pdf = None
+        if (fast_redraw):
+            self.artists = ArtistCache(self.fig)
+        self.open_registry(recheck)
 
     def run(self):
         for self.path in self.paths:
             if ('valid' in self.path):
                 continue
-            self.ax.clear()
-            self.ax2.clear()
-            self.ax3.clear()
+            if (self.artists is None):
+                self.ax.clear()
+                self.ax2.clear()
+                self.ax3.clear()
 
             self.process_file()
 
@@ -31,6 +36,7 @@ class Experimental(TravelerAnalysisBase):
             self.fig.show()
             # plt.show()
         
+        self.save_registry()
         plt.show()
         self.pdf.close()
 
@@ -52,6 +58,12 @@ class Experimental(TravelerAnalysisBase):
             # write self.path to csv file
             self.save_plot()    
     
+    def plot_force(self):
+        # findVel() replaces the force plot, so it is only drawn when the axes are cleared
+        # for every trial (invalid force profiles are already flagged by minmax_finder)
+        if (self.artists is None):
+            super().plot_force()
+
     def findVel(self):
         t = self.data_dict['time']
         pos_x = self.data_dict['position_x']
@@ -71,6 +83,14 @@ class Experimental(TravelerAnalysisBase):
 
         self.data_dict['velocity'] = vel
 
+        # plot vertical lines where smoothed_position is equal to self.groundHeight
+        idx = self.find_closest_index(smoothed_positions, self.groundHeight)
+        line_pos = t[idx]
+
+        if (self.artists is not None):
+            self.plot_vel_fast(t, smoothed_positions, vel, smoothed_vel, force_vector, line_pos)
+            return
+
         self.ax.clear()
         self.ax2.clear()
         self.ax3.clear()
@@ -79,9 +99,6 @@ class Experimental(TravelerAnalysisBase):
         self.ax.set_xlabel('Time(s)')
         self.ax.set_ylabel('Depth (m)')
 
-        # plot vertical lines where smoothed_position is equal to self.groundHeight
-        idx = self.find_closest_index(smoothed_positions, self.groundHeight)
-        line_pos = t[idx]
         self.ax.axvline(x=line_pos, color='r', linestyle='-')
         self.ax2.axvline(x=line_pos, color='r', linestyle='-')
         self.ax3.axvline(x=line_pos, color='r', linestyle='-')
@@ -95,6 +112,22 @@ class Experimental(TravelerAnalysisBase):
         self.ax3.set_xlabel('Time(s)')
         self.ax3.set_ylabel('Force (N)')
 
+    def plot_vel_fast(self, t, smoothed_positions, vel, smoothed_vel, force_vector, line_pos):
+        # same three-axes figure as findVel(), updating the existing artists in place
+        self.artists.begin()
+        self.artists.line(self.ax, 'depth', t, smoothed_positions, label='Depth vs Time')
+        self.artists.line(self.ax2, 'vel', t, vel, label='vel vs Time')
+        self.artists.line(self.ax2, 'smoothed_vel', t, smoothed_vel, label='smoothed Velocity vs Time')
+        self.artists.line(self.ax3, 'force', t, force_vector, label='Force vs Time')
+
+        for ax in [self.ax, self.ax2, self.ax3]:
+            self.artists.vline(ax, 'contact', line_pos, color='r', linestyle='-')
+            self.artists.xlabel(ax, 'Time(s)')
+        self.artists.ylabel(self.ax, 'Depth (m)')
+        self.artists.ylabel(self.ax2, 'dx (m)')
+        self.artists.ylabel(self.ax3, 'Force (N)')
+        self.artists.finish()
+
     def detrend_data(self):
         x = self.data_dict['smoothed_pos']
         y = self.data_dict['smoothed_force']
@@ -210,5 +243,10 @@ def scipy_linregress(x, y):
 
 
 if __name__ == "__main__":
-    plotter = Experimental()
+    parser = argparse.ArgumentParser(description='Experimental velocity analysis of traveler data.')
+    parser.add_argument('-f', '--fast', action='store_true', help='Reuses the plot artists between trials instead of clearing the axes')
+    args = parser.parse_args()
+    configure()
+
+    plotter = Experimental(fast_redraw=args.fast)
     plotter.run()
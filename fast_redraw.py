@@ -0,0 +1,223 @@
+import time
+import argparse
+import numpy as np
+import matplotlib.pyplot as plt
+
+
+"""
+    Class: ArtistCache
+    Description:
+        Fast redraw path for per-trial plots. Instead of calling ax.clear() and
+        re-plotting for every trial (which rebuilds the axis, ticks, labels,
+        legend and title), the Line2D and Text artists are created once per
+        axes and then updated in place with set_data()/set_text().
+
+        Usage (per trial):
+            artists.begin()
+            artists.line(ax, 'force', pos, force, '-', label='Raw Force')
+            artists.vline(ax, 'contact', x)
+            artists.title(ax, 'notes')
+            artists.finish()
+
+        Lines that are not updated between begin() and finish() are hidden, so
+        a trial with fewer series than the last one does not show stale data.
+        Axis limits are only recomputed when the data bounds of an axes change.
+"""
+
+class ArtistCache:
+    def __init__(self, fig, margin=0.05):
+        self.fig = fig
+        self.margin = margin
+        self.lines = {}      # (ax, key) -> Line2D
+        self.vlines = {}     # (ax, key) -> Line2D
+        self.used = set()
+        self.bounds = {}     # ax -> last data bounds used to set the limits
+        self.fixed_xlim = {} # ax -> fixed x limits
+        self.legends = set()
+        self.labels = {}     # (ax, 'x'/'y'/'title'/'ticks') -> last value set
+        self.suptitle_text = None # Text returned by fig.suptitle()
+
+    def begin(self):
+        self.used = set()
+
+    def line(self, ax, key, x, y, *args, **kwargs):
+        # creates the line on first use, afterwards only its data is updated
+        artist = self.lines.get((ax, key))
+        if (artist is None):
+            artist, = ax.plot(x, y, *args, **kwargs)
+            self.lines[(ax, key)] = artist
+        else:
+            artist.set_data(x, y)
+            artist.set_visible(True)
+        self.used.add((ax, key))
+        return artist
+
+    def vline(self, ax, key, x, **kwargs):
+        artist = self.vlines.get((ax, key))
+        if (artist is None):
+            artist = ax.axvline(x=x, **kwargs)
+            self.vlines[(ax, key)] = artist
+        else:
+            artist.set_xdata([x, x])
+            artist.set_visible(True)
+        self.used.add((ax, key))
+        return artist
+
+    def title(self, ax, text, **kwargs):
+        if (self.labels.get((ax, 'title')) != text):
+            ax.set_title(text, **kwargs)
+            self.labels[(ax, 'title')] = text
+
+    def suptitle(self, text, **kwargs):
+        if (self.suptitle_text is None):
+            self.suptitle_text = self.fig.suptitle(text, **kwargs)
+        elif (self.suptitle_text.get_text() != text):
+            self.suptitle_text.set_text(text)
+
+    def xlabel(self, ax, text, **kwargs):
+        if (self.labels.get((ax, 'x')) != text):
+            ax.set_xlabel(text, **kwargs)
+            self.labels[(ax, 'x')] = text
+
+    def ylabel(self, ax, text, **kwargs):
+        if (self.labels.get((ax, 'y')) != text):
+            ax.set_ylabel(text, **kwargs)
+            self.labels[(ax, 'y')] = text
+
+    def legend(self, ax, **kwargs):
+        # the legend only depends on the line labels, which do not change between trials
+        if (ax not in self.legends):
+            ax.legend(**kwargs)
+            self.legends.add(ax)
+
+    def set_xlim(self, ax, left, right):
+        # fixed x limits are kept and excluded from the autoscaling in finish()
+        if (self.fixed_xlim.get(ax) != (left, right)):
+            ax.set_xlim(left, right)
+            self.fixed_xlim[ax] = (left, right)
+
+    def free_xlim(self, ax):
+        # returns the x axis to autoscaling
+        if (ax in self.fixed_xlim):
+            del self.fixed_xlim[ax]
+            self.bounds.pop(ax, None)
+
+    def tick_params(self, ax, **kwargs):
+        if (self.labels.get((ax, 'ticks')) != kwargs):
+            ax.tick_params(**kwargs)
+            self.labels[(ax, 'ticks')] = kwargs
+
+    def finish(self):
+        # hide unused artists and rescale the axes whose data bounds changed
+        axes = set()
+        for (ax, key), artist in list(self.lines.items()) + list(self.vlines.items()):
+            if ((ax, key) not in self.used):
+                artist.set_visible(False)
+            axes.add(ax)
+
+        for ax in axes:
+            self.autoscale(ax)
+
+    def autoscale(self, ax):
+        x_min, x_max, y_min, y_max = np.inf, -np.inf, np.inf, -np.inf
+        for (line_ax, key), artist in self.lines.items():
+            if (line_ax is not ax or not artist.get_visible()):
+                continue
+            x = np.asarray(artist.get_xdata(), dtype=float)
+            y = np.asarray(artist.get_ydata(), dtype=float)
+            if (x.size == 0):
+                continue
+            x_min = min(x_min, np.nanmin(x))
+            x_max = max(x_max, np.nanmax(x))
+            y_min = min(y_min, np.nanmin(y))
+            y_max = max(y_max, np.nanmax(y))
+        for (line_ax, key), artist in self.vlines.items():
+            if (line_ax is ax and artist.get_visible()):
+                x = artist.get_xdata()[0]
+                x_min = min(x_min, x)
+                x_max = max(x_max, x)
+
+        bounds = (x_min, x_max, y_min, y_max)
+        if (not np.all(np.isfinite(bounds)) or self.bounds.get(ax) == bounds):
+            return
+        self.bounds[ax] = bounds
+
+        if (ax not in self.fixed_xlim):
+            ax.set_xlim(*self.padded(x_min, x_max))
+        ax.set_ylim(*self.padded(y_min, y_max))
+
+    def padded(self, low, high):
+        span = high - low
+        if (span == 0):
+            span = abs(low) if low != 0 else 1.0
+        return low - self.margin * span, high + self.margin * span
+
+
+## Timing comparison between ax.clear() and the artist cache
+def synthetic_trial(rng, n=2000):
+    pos = np.linspace(0, rng.uniform(0.02, 0.04), n)
+    force = 200 * pos + np.sin(pos * rng.uniform(1000, 3000)) + rng.normal(0, 0.1, n)
+    extrema = np.sort(rng.choice(n, 20, replace=False))
+    return pos, force, extrema
+
+def draw_clear(fig, ax, trial, index):
+    pos, force, extrema = trial
+    ax.clear()
+    ax.plot(pos * 100, force, '-', label="Raw Force", linewidth=3)
+    ax.plot(pos[extrema] * 100, force[extrema], "^", label="Local Maxima", markersize=10, markerfacecolor='g')
+    ax.set_xlabel('Vertical Depth (cm)', fontsize=20)
+    ax.set_ylabel('Penetration Force (N)', fontsize=20)
+    ax.set_xlim(0, 3)
+    fig.suptitle('Trial ' + str(index), fontsize=24)
+    ax.set_title('notes ' + str(index), fontsize=18)
+    ax.legend()
+    ax.tick_params(labelsize=20)
+
+def draw_fast(artists, ax, trial, index):
+    pos, force, extrema = trial
+    artists.begin()
+    artists.line(ax, 'force', pos * 100, force, '-', label="Raw Force", linewidth=3)
+    artists.line(ax, 'max', pos[extrema] * 100, force[extrema], "^", label="Local Maxima", markersize=10, markerfacecolor='g')
+    artists.xlabel(ax, 'Vertical Depth (cm)', fontsize=20)
+    artists.ylabel(ax, 'Penetration Force (N)', fontsize=20)
+    artists.set_xlim(ax, 0, 3)
+    artists.suptitle('Trial ' + str(index), fontsize=24)
+    artists.title(ax, 'notes ' + str(index), fontsize=18)
+    artists.legend(ax)
+    artists.tick_params(ax, labelsize=20)
+    artists.finish()
+
+def benchmark(num_trials=1000, render=True):
+    plt.switch_backend('Agg')
+    rng = np.random.default_rng(0)
+    trials = [synthetic_trial(rng) for i in range(num_trials)]
+
+    results = {}
+    for mode in ['clear', 'fast']:
+        fig, ax = plt.subplots(figsize=(12,6))
+        artists = ArtistCache(fig)
+        start = time.perf_counter()
+        for i, trial in enumerate(trials):
+            if (mode == 'clear'):
+                draw_clear(fig, ax, trial, i)
+            else:
+                draw_fast(artists, ax, trial, i)
+            if (render):
+                fig.canvas.draw()
+        results[mode] = time.perf_counter() - start
+        plt.close(fig)
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Times ax.clear() redraws against the artist cache on synthetic trials.')
+    parser.add_argument('-n', '--trials', action='store', type=int, default=1000)
+    parser.add_argument('--no-render', action='store_true', help='Only time the artist updates (no canvas draw)')
+    args = parser.parse_args()
+
+    results = benchmark(args.trials, render=not args.no_render)
+    print('{} trials, render={}'.format(args.trials, not args.no_render))
+    print('  ax.clear() redraw: {:.2f} s ({:.2f} ms/trial)'.format(results['clear'], 1000 * results['clear'] / args.trials))
+    print('  artist cache:      {:.2f} s ({:.2f} ms/trial)'.format(results['fast'], 1000 * results['fast'] / args.trials))
+    print('  speedup:           {:.1f}x'.format(results['clear'] / results['fast']))
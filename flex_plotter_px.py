@@ -14,12 +14,24 @@
 from force_analysis import *
 from pick import pick
 import csv
+import json
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import plotly.io as pio
 import matplotlib.patches as mpatches
 import matplotlib.cm as cm
 import matplotlib.colors as colorNorm
 import plotly.express as px
 from plotly.express.colors import sample_colorscale
 import plotly.graph_objects as go
+from workspace import DatasetWorkspace
+from render_manifest import RenderManifest
+from checkpoint import BatchCheckpoint
+from html_report import HtmlReport
+from instrumentation import add_profile_arguments, profile_run
+from event_log import log, configure, add_logging_arguments
+from trial_result import add_analysis_arguments, analysis_arguments
 
 
 
@@ -65,8 +77,15 @@ import plotly.graph_objects as go
 """
 
 class FlexPlotter(TravelerAnalysisBase):
-    def __init__(self):
+    def __init__(self, args=None):
+        if (args is None):
+            parser = self.init_argparse()
+            args = parser.parse_args()
+        self.args = args
+        configure(self.args.quiet, self.args.verbose, self.args.events)
+
         super().__init__()
+        self.config.update(**analysis_arguments(self.args))
         
         # plt.ion()
         # self.fig, self.ax = plt.subplots(figsize=(12,6))
@@ -89,9 +108,20 @@ class FlexPlotter(TravelerAnalysisBase):
         self.filenames = np.array([])
         
         self.feature_dict = {}
+        self.feature_raw_dict = {}
         self.highlight = 'None'
         self.intersection_IDs = []
         self.penetration_vs_shear = False
+
+        # named, cached datasets (see workspace.py)
+        self.workspace = DatasetWorkspace()
+        self.metrics_rows = []
+        self.comparison_dataset = None
+        self.open_registry(self.args.recheck)
+        self.open_result_cache()
+
+        # figures collected with 'Add Plot to Report' (see html_report.py)
+        self.report = None
         
         self.continuous_options = ['Position', 'Time', 'Force', 'Velocity']
         self.continuous_option_units = [' (meters)',
@@ -131,34 +161,76 @@ class FlexPlotter(TravelerAnalysisBase):
         # create a csv writer
         self.csv_writer = csv.writer(self.csv_file, delimiter=',')
         # [trial_ID, location, transect, flag_number, avg_force, np.mean(stiffness), np.mean(stick_slip), average_yield, max_drop, max_drop_slope, deformation]
-        self.csv_writer.writerow(['filename', 'trial_ID', 'avg_force', 'avg_stiffness', 'avg_stick_slip', 'avg_yield', 'max_drop', 'max_drop_slope', 'deformation', 'first_rupture_displacement_ratio', 'peak_force', 'max_depth', 'first_yield', '1 cm slope', '2 mm slope'])
+        self.csv_writer.writerow(['filename', 'trial_ID', 'avg_force', 'avg_stiffness', 'avg_stick_slip', 'avg_yield', 'max_drop', 'max_drop_slope', 'deformation', 'first_rupture_displacement_ratio', 'peak_force', 'max_depth', 'first_yield', '1 cm slope', '2 mm slope', 'config_hash'])
+
+    def init_argparse(self) -> argparse.ArgumentParser:
+        parser = argparse.ArgumentParser(
+            usage="%(prog)s [OPTIONS]",
+            description="Interactive plotter for aggregate and continuous traveler data. \
+                        With --export or --export-all, figures are exported without the menus."
+        )
+        parser.add_argument(
+            '-d', '--dir', action='store', default=None, help='Data directory to process (skips the directory dialog)'
+        )
+        parser.add_argument(
+            '--features', action='store', nargs='+', default=[], help='Feature .csv files to load'
+        )
+        parser.add_argument(
+            '--export', action='store', default=None, help='.json file with a list of plots to export, e.g. [{"mode": "Aggregate", "x": "Average Force", "y": "Average Yield", "highlight": "None"}]'
+        )
+        parser.add_argument(
+            '--export-all', action='store_true', help='Exports a figure for every pair of aggregate axes'
+        )
+        parser.add_argument(
+            '-j', '--jobs', action='store', type=int, default=1, help='Number of image export worker processes (defaults to 1)'
+        )
+        parser.add_argument(
+            '--report', action='store', default=None, help='.html file to write the exported figures to as one report (instead of .png images)'
+        )
+        parser.add_argument(
+            '--report-js', action='store', default='inline', choices=['inline', 'directory', 'cdn'], help='How the report includes plotly.js (defaults to inline)'
+        )
+        parser.add_argument(
+            '--resume', action='store_true', help='Continues an interrupted analysis of the dataset from its last completed trial'
+        )
+        parser.add_argument(
+            '--recheck', action='store_true', help='Analyzes the trials found invalid by earlier runs again instead of skipping them'
+        )
+        add_analysis_arguments(parser)
+        add_profile_arguments(parser)
+        add_logging_arguments(parser)
+        return parser
 
     def user_selection(self):
-        self.filepath = self.select_directory()
+        if (self.args.dir):
+            self.filepath = self.args.dir
+        else:
+            self.filepath = self.select_directory()
         self.paths = self.traverse_csv_files()
         
         
     def process_file(self):
-        print('\n\nProcessing file ', self.path_index, ' of ', len(self.paths), '...')
-        self.curr_file_valid = True
-        # Read data from path
-        self.travelerRead()
-
-        if (self.curr_file_valid):
-            self.process_data()
-        
-        if (self.curr_file_valid):
-            self.format_trial()
+        log.debug('\n\nProcessing file %d of %d...', self.path_index, len(self.paths))
+        result = self.analyze_cached(metrics=True)
+        if (result.valid):
+            self.format_trial(result)
+        self.log_trial()
 
         
     def run(self):
-        self.path_index = 0
         # process and store data from all trial data files
-        for self.path in self.paths:
-            self.process_file()
-            self.path_index += 1
-    
-        self.aggregate_data()
+        self.load_dataset(self.filepath, self.paths)
+
+        for feature_file in self.args.features:
+            self.feature_files.append(feature_file)
+            self.process_features(feature_file)
+
+        if (self.args.export or self.args.export_all):
+            if (self.args.report):
+                self.export_report(self.export_specs(), self.args.report)
+            else:
+                self.export_plots(self.export_specs())
+            return
         # self.output_data()
 
         # prompt the user for plot options
@@ -176,7 +248,7 @@ class FlexPlotter(TravelerAnalysisBase):
     def process_features(self, filename):
         # read the data from the file
         if (filename == ''):
-            print('No file selected...')
+            log.info('No file selected...')
             return None
         data = self.csvReader(filename)
         
@@ -196,7 +268,7 @@ class FlexPlotter(TravelerAnalysisBase):
                     id_col.append('L' + str(row['location']) + 'T' + str(row['transect']) + 'F' + str(row['flag']))
                 data['id'] = id_col
             else:
-                print('Error reading file! Malformatted Feature CSV File: ', filename)
+                log.warning('Error reading file! Malformatted Feature CSV File: %s', filename)
                 return None
             
         # extract a dictionary of ID:data pairs
@@ -218,8 +290,14 @@ class FlexPlotter(TravelerAnalysisBase):
             # ! WTF IS THIS CODE DOING
 
         # output a vector matched to the order of the aggregated data
+        self.feature_raw_dict[name] = raw_dict
         self.feature_dict[name] = self.match_data(self.aggregated_data['trial_IDs'], raw_dict)
 
+    def rematch_features(self):
+        # re-align loaded feature vectors with the trial order of the active dataset
+        for name, raw_dict in self.feature_raw_dict.items():
+            self.feature_dict[name] = self.match_data(self.aggregated_data['trial_IDs'], raw_dict)
+
 
 
     def match_data(self, ref_vec, match_dict):
@@ -249,59 +327,125 @@ class FlexPlotter(TravelerAnalysisBase):
             - Average stiffness
             - Average stick-slip frequency
     """
-    def format_trial(self):
-        trial_ID = self.data_dict['trial_ID']
+    def format_trial(self, result):
+        trial_ID = result.trial_ID
+        filename = result.path.split('/')[-1]
         
         # get the location and transect from the trial ID, which is in form 'L#T#F#'
         location = int(trial_ID[1])
         transect = int(trial_ID[3])
         flag_number = int(trial_ID[5:])
 
-        force = self.data_dict['trimmed_force']
-        pos = self.data_dict['trimmed_pos']
-        time = self.data_dict['trimmed_time']
-        velocity = self.data_dict['velocity']
-        avg_force = self.data_dict['average_force']
-
-        stiffness, stick_slip, average_yield, max_drop, max_drop_slope, deformation, first_rupture_ratio, peak_force, total_depth, first_yield = self.calculate_metrics()
-        # print('Number of Stiffness Measurements: ', len(stiffness))
-        # print('Number of Stick-Slip Measurements: ', len(stick_slip))
+        metrics = result.metrics
+        # print('Number of Stiffness Measurements: ', len(metrics['stiffness']))
+        # print('Number of Stick-Slip Measurements: ', len(metrics['stick_slip']))
 
         # store the data in a dictionary
         trial_dict = {
-            'filename' : self.path.split('/')[-1],
+            'filename' : filename,
             'trial_ID': trial_ID,
             'location': location,
             'transect': transect,
             'flag_number': flag_number,
-            'mode': self.data_dict.get('mode'),
-            'force': force,
-            'pos': pos,
-            'time': time,
-            'velocity': velocity,
-            'avg_force': avg_force,
-            'stiffness': stiffness,
-            'stick_slip': stick_slip,
-            'average_yield': average_yield,
-            'max_drop': max_drop,
-            'max_drop_slope': max_drop_slope,
-            'max_drop_deformation': deformation
+            'mode': result.mode,
+            'force': result.force,
+            'pos': result.position,
+            'time': result.time,
+            'velocity': result.velocity,
+            'avg_force': result.average_force,
+            'stiffness': metrics['stiffness'],
+            'stick_slip': metrics['stick_slip'],
+            'average_yield': metrics['average_yield'],
+            'max_drop': metrics['max_drop'],
+            'max_drop_slope': metrics['max_drop_slope'],
+            'max_drop_deformation': metrics['max_drop_deformation']
         }
 
-        x = self.data_dict['smoothed_pos']
-        y = self.data_dict['smoothed_force']
-        cm_slope, _ = self.linear_regression(x, y, 0.01)
-        mm_slope, _ = self.linear_regression(x, y, 0.002)
+        metrics_row = [filename, trial_ID, result.average_force, np.mean(metrics['stiffness']), np.mean(metrics['stick_slip']),
+                       metrics['average_yield'], metrics['max_drop'], metrics['max_drop_slope'], metrics['max_drop_deformation'],
+                       metrics['first_rupture_ratio'], metrics['peak_force'], metrics['total_depth'], metrics['first_yield'],
+                       metrics['cm_slope'], metrics['mm_slope'], self.config.config_hash()]
+        self.add_trial(trial_dict, metrics_row)
 
-        self.csv_writer.writerow([self.path.split('/')[-1], trial_ID, avg_force, np.mean(stiffness), np.mean(stick_slip), average_yield, max_drop, max_drop_slope, deformation, first_rupture_ratio, peak_force, total_depth, first_yield, cm_slope, mm_slope])
+    def add_trial(self, trial_dict, metrics_row):
+        # adds a formatted trial to the dataset (also used to restore trials from a checkpoint)
+        self.csv_writer.writerow(metrics_row)
+        self.metrics_rows.append(metrics_row)
 
         # append the dictionary for the trial to the data vector
         self.data_vector.append(trial_dict)
 
-        
-
         # add trial to the filenames vector
-        self.filenames = np.append(self.filenames, self.path.split('/')[-1])
+        self.filenames = np.append(self.filenames, trial_dict['filename'])
+        self.last_trial = (trial_dict, metrics_row)
+
+
+    def build_dataset(self):
+        # runs the full analysis pipeline over self.paths
+        self.data_vector = []
+        self.filenames = np.array([])
+        self.metrics_rows = []
+
+        # an interrupted run is continued from its checkpoint with --resume (see checkpoint.py)
+        checkpoint = BatchCheckpoint('flex_plotter', self.paths, self.analysis_params(), self.args.resume)
+        self.path_index = 0
+        for self.path, trial in checkpoint.completed:
+            if (trial is not None):
+                self.add_trial(*trial)
+            self.path_index += 1
+
+        for self.path in self.paths[len(checkpoint.completed):]:
+            self.last_trial = None
+            self.process_file_isolated()
+            checkpoint.record(self.path, self.last_trial)
+            self.path_index += 1
+        self.save_registry()
+        checkpoint.finish()
+
+        self.aggregate_data()
+
+        return {
+            'data_vector': self.data_vector,
+            'aggregated_data': self.aggregated_data,
+            'filenames': list(self.filenames),
+            'paths': list(self.paths),
+            'metrics_rows': self.metrics_rows
+        }
+
+    def load_dataset(self, directory, paths, name=None):
+        # loads a processed dataset from the workspace, only processing the
+        # files if the dataset is not cached for the current parameters
+        if (name is None):
+            name = os.path.basename(os.path.normpath(directory))
+        self.paths = paths
+
+        built = []
+        def build():
+            built.append(True)
+            return self.build_dataset()
+
+        dataset = self.workspace.load(name, directory, paths, self.analysis_params(), build)
+
+        # cached datasets still contribute their rows to metrics.csv
+        if (not built):
+            for row in dataset['metrics_rows']:
+                self.csv_writer.writerow(row)
+
+        self.activate_dataset(dataset['name'])
+        return dataset
+
+    def activate_dataset(self, name):
+        dataset = self.workspace.switch(name)
+        self.data_vector = dataset['data_vector']
+        self.filenames = np.array(dataset['filenames'])
+        self.paths = dataset['paths']
+        self.metrics_rows = dataset['metrics_rows']
+        if (not dataset['aggregated_data']):
+            self.aggregate_data()
+            dataset['aggregated_data'] = self.aggregated_data
+        self.aggregated_data = dataset['aggregated_data']
+        self.rematch_features()
+        log.info('Active dataset: %s (%d trials)', name, len(self.data_vector))
 
     def aggregate_data(self):
         ## TAG WEIGHTS:
@@ -392,6 +536,10 @@ class FlexPlotter(TravelerAnalysisBase):
             return mode, x_axis, y_axis
 
     def create_plot(self):
+        self.build_plot()
+        self.fig.show()
+
+    def build_plot(self):
         # clear the figure
         self.fig.data = []
 
@@ -410,10 +558,8 @@ class FlexPlotter(TravelerAnalysisBase):
         elif (self.plot_mode == 2):
             self.plot_penetration_vs_shear(x_axis, x_data, y_axis, y_data)
 
-        self.fig.show()
-
     def plot_continuous(self, x_axis, x_data, y_axis, y_data):
-        print('\nPlotting continuous data...')
+        log.info('Plotting continuous data...')
         counter = 0
 
         vec = np.linspace(0, 1, len(self.aggregated_data['numericTags']))
@@ -465,9 +611,9 @@ class FlexPlotter(TravelerAnalysisBase):
                             ))
 
     def plot_aggregate(self, x_axis, x_data, y_axis, y_data):
-        print('\nPlotting aggregate data...')
+        log.info('Plotting aggregate data...')
 
-        print('Selected Axes: ', x_axis, ' vs. ', y_axis)
+        log.info('Selected Axes: %s vs. %s', x_axis, y_axis)
 
         # plotting a highlighted group (2 groups)
         if (self.highlight != 'None'):
@@ -538,7 +684,7 @@ class FlexPlotter(TravelerAnalysisBase):
                             )
     
     def plot_penetration_vs_shear(self, x_axis, x_data, y_axis, y_data):
-        print('\nPlotting penetration vs shear data...')
+        log.info('Plotting penetration vs shear data...')
 
         # loop through data_vector
         plot_x = []
@@ -649,10 +795,13 @@ class FlexPlotter(TravelerAnalysisBase):
                    'Change Vertical-Axis Variable', 
                    'Swap Axes', 
                    'Highlight Feature', 
-                   'Add Feature File'
+                   'Add Feature File',
+                   'Add Plot to Report'
                    ]
         if (self.plot_mode != 2):
             options.append('Add Force Dataset')
+        if (len(self.workspace.names()) > 1):
+            options.extend(['Switch Dataset', 'Union Datasets', 'Compare Datasets'])
         options.append('Quit')
         choice, index = pick(options, title)
 
@@ -674,20 +823,30 @@ class FlexPlotter(TravelerAnalysisBase):
                 self.user_y_axis_prompt_compare()
         elif (index == 3):
             # swap axes
-            print('Swapping Axes...')
+            log.info('Swapping Axes...')
             self.x_axis, self.y_axis = self.y_axis, self.x_axis
         elif (index == 4):
             # highlight feature
-            print('Highlighting Feature...')
+            log.info('Highlighting Feature...')
             self.highlight_feature()
         elif (index == 5):
             # prompt user for feature file(s)
             self.user_feature_prompt()  
-        elif (index == 6 and self.plot_mode != 2): # only give option if first time
+        elif (choice == 'Add Plot to Report'):
+            self.add_to_report()
+        elif (choice == 'Add Force Dataset'):
             # bring up trial multi selection
-            print('Adding force data...')
+            log.info('Adding force data...')
             self.add_directory()
+        elif (choice == 'Switch Dataset'):
+            self.switch_dataset_prompt()
+        elif (choice == 'Union Datasets'):
+            self.union_datasets_prompt()
+        elif (choice == 'Compare Datasets'):
+            self.compare_datasets_prompt()
         else:
+            if (self.report is not None):
+                self.report.write(os.path.join(self.save_folder(), 'report.html'), self.args.report_js)
             exit()
 
         return choice, index
@@ -703,40 +862,69 @@ class FlexPlotter(TravelerAnalysisBase):
             self.highlight = 'None'
 
     def add_directory(self):
-        # copy the current data_vector and aggregate_data
-        self.data_vector_2 = self.data_vector.copy()
-        self.aggregated_data_2 = self.aggregated_data.copy()
-
-        # clear old vectors so they can be filled again
-        self.data_vector.clear()
-        self.aggregated_data.clear()
+        previous = self.workspace.active
+        previous_mode = self.data_vector[0]['mode']
 
         new_dir = self.select_directory(override=True)
-        self.paths = self.traverse_csv_files(override=True, filepath=new_dir)
+        paths = self.traverse_csv_files(override=True, filepath=new_dir)
+        dataset = self.load_dataset(new_dir, paths)
 
-
-        self.path_index = 0
-        # process and store data from all trial data files
-        for self.path in self.paths:
-            self.process_file()
-            self.path_index += 1
-    
-        self.aggregate_data()
+        if (len(self.data_vector) == 0):
+            log.warning('WARNING: No valid trials found in %s... returning to previous dataset...', new_dir)
+            self.activate_dataset(previous)
+            return
 
         # append the new data to the old data if they are the same protocol
-        if (self.data_vector[0]['mode'] == self.data_vector_2[0]['mode']):
-            self.data_vector_2.extend(self.data_vector)
-            print('Additional force data is same protocol. Adding to previous dataset...')
+        if (self.data_vector[0]['mode'] == previous_mode):
+            log.info('Additional force data is same protocol. Adding to previous dataset...')
+            union = self.workspace.union([previous, dataset['name']])
+            self.activate_dataset(union['name'])
         else: # the two force datasets are different protocols 
-            # find the trial_ID intersection between the two datasets
-            self.intersection_IDs = list(set(self.aggregated_data['trial_IDs']) & set(self.aggregated_data_2['trial_IDs']))
-            
-            self.penetration_vs_shear = True
-            self.plot_mode = 2
-
-            print('Additional data is of different protocol. Adding to new dataset...')
-            x_axis = self.user_x_axis_prompt_compare()
-            y_axis = self.user_y_axis_prompt_compare()
+            log.info('Additional data is of different protocol. Adding to new dataset...')
+            self.compare_datasets(dataset['name'], previous)
+
+    def compare_datasets(self, x_name, y_name):
+        # plots the metrics of x_name against the metrics of y_name for the shared trial IDs
+        self.activate_dataset(x_name)
+        other = self.workspace.get(y_name)
+        self.comparison_dataset = y_name
+        self.data_vector_2 = other['data_vector']
+        self.aggregated_data_2 = other['aggregated_data']
+
+        # find the trial_ID intersection between the two datasets
+        self.intersection_IDs = list(set(self.aggregated_data['trial_IDs']) & set(self.aggregated_data_2['trial_IDs']))
+
+        self.penetration_vs_shear = True
+        self.plot_mode = 2
+
+        self.user_x_axis_prompt_compare()
+        self.user_y_axis_prompt_compare()
+
+    def switch_dataset_prompt(self):
+        title = 'Choose Dataset: '
+        name, index = pick(self.workspace.names(), title)
+        self.activate_dataset(name)
+        self.leave_comparison_mode()
+
+    def union_datasets_prompt(self):
+        title = 'Choose Datasets to Combine (space to select): '
+        selection = pick(self.workspace.names(), title, multiselect=True, min_selection_count=2)
+        union = self.workspace.union([name for name, index in selection])
+        self.activate_dataset(union['name'])
+        self.leave_comparison_mode()
+
+    def leave_comparison_mode(self):
+        # a single dataset cannot be plotted in comparison mode
+        if (self.plot_mode == 2):
+            self.penetration_vs_shear = False
+            self.plot_mode = 1
+            self.user_x_axis_prompt_aggregate()
+            self.user_y_axis_prompt_aggregate()
+
+    def compare_datasets_prompt(self):
+        title = 'Choose Two Datasets to Compare (horizontal-axis dataset first): '
+        selection = pick(self.workspace.names(), title, multiselect=True, min_selection_count=2)
+        self.compare_datasets(selection[0][0], selection[1][0])
 
     def parse_axis_choice(self):
         x_axis = self.x_axis
@@ -812,28 +1000,186 @@ class FlexPlotter(TravelerAnalysisBase):
         return data
 
     
-    def save_plot(self, fig_folder='figures/'):
+    def render_sources(self):
+        # files that the current figure depends on
+        sources = list(self.paths)
+        if (self.plot_mode == 2):
+            sources += self.workspace.get(self.comparison_dataset)['paths']
+        return sources + [f for f in self.feature_files if f != '']
+
+    def render_settings(self):
+        return {
+            'plot_mode': self.plot_mode,
+            'x_axis': self.x_axis,
+            'y_axis': self.y_axis,
+            'highlight': self.highlight,
+            'params': self.analysis_params(),
+            'scale': 4,
+            'width': 1080,
+            'height': 720
+        }
+
+    def plot_save_name(self):
+        if (self.highlight == 'None'):
+            return self.x_axis + '_vs_' + self.y_axis + '.png'
+        return self.x_axis + '_vs_' + self.y_axis + '_highlight_' + self.highlight + '.png'
+
+    def save_folder(self, fig_folder='figures/'):
         parent_path = self.filepath
         figure_path = parent_path.replace('data/', '')
         path = os.path.join(figure_path, fig_folder)
         if not os.path.exists(path):
             os.mkdir(path)
         self.save_path = path
-        plot_save_name = ''
-        if (self.highlight == 'None'):
-            plot_save_name = self.x_axis + '_vs_' + self.y_axis + '.png'
-        else:
-            plot_save_name = self.x_axis + '_vs_' + self.y_axis + '_highlight_' + self.highlight + '.png'
+        return path
+
+    def save_plot(self, fig_folder='figures/'):
+        path = self.save_folder(fig_folder)
+        plot_save_name = self.plot_save_name()
         # directory_path = '/home/qianlab/lassie-traveler/experiment_records/MH23_Data/'
         save_path_png = os.path.join(path, plot_save_name)
+
+        # skip the export if the figure was already saved from the same data and settings
+        manifest = RenderManifest(path)
+        sources = self.render_sources()
+        settings = self.render_settings()
+        if (manifest.is_fresh(plot_save_name, sources, settings)):
+            log.info('Figure is up to date: %s', save_path_png)
+            manifest.save()
+            return
         
-        print('Saving figure as file: ' + save_path_png)
+        log.info('Saving figure as file: %s', save_path_png)
         self.fig.write_image(save_path_png, scale=4, width=1080, height=720)
+        manifest.record(plot_save_name, sources, settings)
+        manifest.save()
         
+
+    ## Non-interactive export
+    def export_specs(self):
+        # list of plots to export: {'mode', 'x', 'y', 'highlight'}
+        if (self.args.export_all):
+            return [{'mode': 'Aggregate', 'x': x, 'y': y, 'highlight': 'None'}
+                    for x in self.aggregate_options for y in self.aggregate_options if x != y]
+
+        with open(self.args.export, 'r') as file:
+            return json.load(file)
+
+    def apply_spec(self, spec):
+        # sets the plot options as if they had been chosen in the menus
+        mode = spec.get('mode', 'Aggregate')
+        if (mode == 'Continuous'):
+            self.plot_mode = 0
+            options = self.continuous_options
+        else:
+            self.plot_mode = 1
+            options = self.aggregate_options
+
+        self.x_axis = spec['x']
+        self.y_axis = spec['y']
+        self.x_choice_idx = options.index(self.x_axis)
+        self.y_choice_idx = options.index(self.y_axis)
+
+        self.highlight = spec.get('highlight', 'None')
+        if (self.highlight != 'None' and self.highlight not in self.feature_dict):
+            log.warning('WARNING: Highlight feature %s is not loaded... ignoring...', self.highlight)
+            self.highlight = 'None'
+
+    def plot_title(self):
+        title = self.y_axis + ' vs. ' + self.x_axis
+        if (self.highlight != 'None'):
+            title += ' (highlight ' + self.highlight + ')'
+        return title
+
+    def add_to_report(self):
+        # collects the current figure; the report is written to figures/report.html on Quit
+        if (self.report is None):
+            self.report = HtmlReport(os.path.basename(os.path.normpath(self.filepath)))
+        self.report.add_figure(self.fig, self.plot_title())
+        log.info('Added plot to report (%d figures)', len(self.report.figures))
+
+    def export_report(self, specs, report_path):
+        start = time.perf_counter()
+        report = HtmlReport(os.path.basename(os.path.normpath(self.filepath)))
+        for spec in specs:
+            try:
+                self.apply_spec(spec)
+            except (KeyError, ValueError):
+                log.warning('WARNING: Invalid plot specification %s... skipping...', spec)
+                continue
+
+            self.fig = go.Figure()
+            self.build_plot()
+            report.add_figure(self.fig, self.plot_title())
+
+        report.write(report_path, self.args.report_js)
+        log.info('Exported report in %.1f s', time.perf_counter() - start)
+
+    def export_plots(self, specs):
+        start = time.perf_counter()
+        path = self.save_folder()
+        manifest = RenderManifest(path)
+        sources = self.render_sources()
+
+        tasks = []
+        up_to_date = 0
+        for spec in specs:
+            try:
+                self.apply_spec(spec)
+            except (KeyError, ValueError):
+                log.warning('WARNING: Invalid plot specification %s... skipping...', spec)
+                continue
+
+            name = self.plot_save_name()
+            settings = self.render_settings()
+            if (manifest.is_fresh(name, sources, settings)):
+                up_to_date += 1
+                continue
+
+            self.fig = go.Figure()
+            self.build_plot()
+            tasks.append((self.fig.to_dict(), os.path.join(path, name), name, settings))
+
+        log.info('Exporting %d of %d figures (%d up to date)...', len(tasks), len(specs), up_to_date)
+
+        # each worker exports its share of the figures through a single image export process
+        workers = max(1, min(self.args.jobs, len(tasks)))
+        chunks = [tasks[i::workers] for i in range(workers)]
+        if (workers > 1):
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                list(executor.map(export_images, chunks))
+        elif (len(tasks) > 0):
+            export_images(tasks)
+
+        for fig_dict, save_path, name, settings in tasks:
+            manifest.record(name, sources, settings)
+        manifest.save()
+
+        log.info('Exported %d figures in %.1f s', len(tasks), time.perf_counter() - start)
+
+
+def export_images(tasks):
+    # writes a list of (figure dict, path, name, settings) tasks as png images
+    figs = [go.Figure(task[0]) for task in tasks]
+    paths = [task[1] for task in tasks]
+
+    if hasattr(pio, 'write_images'):
+        # plotly >= 6.1 exports all figures through one kaleido session
+        pio.write_images(figs, paths, scale=4, width=1080, height=720)
+    else:
+        # older kaleido versions keep a single export process alive between calls
+        for fig, path in zip(figs, paths):
+            pio.write_image(fig, path, scale=4, width=1080, height=720)
+
+    return paths
+
     
 if __name__ == "__main__":
     plotter = FlexPlotter()
-    plotter.run()
+    if (plotter.args.profile):
+        profile_run(plotter, plotter.run, plotter.args.profile, plotter.args.cprofile)
+    else:
+        plotter.run()
 
 
 
@@ -1,3 +1,4 @@
+import io
 import os
 import re
 import argparse
@@ -15,10 +16,147 @@ from tkinter import filedialog
 
 from bisect import bisect_right
 
+from event_log import log, events, configure
+from trial_result import AnalysisConfig, TrialResult, TrialRecord, METRIC_NAMES
+from invalid_registry import InvalidRegistry
+from result_cache import ResultCache
+
+# columns of the data files used by the analysis (lowercase)
+DATA_COLUMNS = ['time', 'state flag', 'toe_position_x', 'toe_position_y', 'toeforce_x', 'toeforce_y']
+PREVALIDATE_SAMPLES = 64 # rows sampled from the position column by prevalidate()
+
+
+## Peak detection and trial metrics, as functions of the sorted, de-duplicated
+## curves (TravelerAnalysisBase.minmax_finder and calculate_metrics, and peak_sweep.py)
+def extrema_candidates(force, peak_distance):
+    # local maxima and minima at least peak_distance samples apart, with their prominences.
+    # find_peaks() applies the distance before the prominence, so the extrema for any
+    # prominence threshold are selected from these (see select_extrema)
+    pos_max, max_properties = find_peaks(force, distance=peak_distance, prominence=0)
+    pos_min, min_properties = find_peaks(-1.0 * force, distance=peak_distance, prominence=0)
+    return pos_max, max_properties['prominences'], pos_min, min_properties['prominences']
+
+
+def select_extrema(candidates, force, prominence_threshold):
+    pos_max, max_prominences, pos_min, min_prominences = candidates
+    pos_max = pos_max[max_prominences >= prominence_threshold]
+    pos_min = pos_min[min_prominences >= prominence_threshold]
+
+    # Insert a zero at the beginning of pos_min array
+    pos_min = np.insert(pos_min, 0, 0)
+
+    # add the maximum force value if not present in the array
+    max_force_idx = np.argmax(force)
+    if (max_force_idx not in pos_max):
+        pos_max = np.insert(pos_max, len(pos_max), max_force_idx)
+        pos_max = np.sort(pos_max)
+    return pos_max, pos_min
+
+
+def find_extrema(force, average_force, prominence_factor, peak_distance):
+    # indices of the local maxima and minima, with a prominence of at least prominence_factor * average_force
+    prominence_threshold = np.abs(prominence_factor * average_force)
+    return select_extrema(extrema_candidates(force, peak_distance), force, prominence_threshold)
+
+
+def trim_trailing_minima(unique_pos, pos_max, pos_min):
+    # drops the minima after the last maximum
+    trim_value = unique_pos[pos_max[-1]]
+    trim_num = 0
+    for min_ in pos_min:
+        if (unique_pos[min_] > trim_value):
+            trim_num += 1
+    return pos_min[0:-trim_num]
+
+
+def stick_slip_metrics(unique_pos, smoothed_force, max_indices, min_indices, on_outlier=None):
+    # the metrics of TravelerAnalysisBase.calculate_metrics(); on_outlier(slope) is called for
+    # the slopes left out as outliers
+
+    # local maxima positions and values
+    max_pos = unique_pos[max_indices]
+    max_force = smoothed_force[max_indices]
+
+    # local minima positions and values
+    min_pos = unique_pos[min_indices]
+    min_force = smoothed_force[min_indices]
+
+    slopes = []
+    stickSlip = []
+    average_yield = np.mean(max_force)
+
+    for min_idx in range(len(min_pos)):
+        # get the next maximum with a position greater than the current min,
+        # but less than the next min.
+        for max_idx in range(len(max_pos)):
+            # if the position of the max is greater than the current min and less than the next min:
+            # if (max_pos[max_idx] > min_pos[min_idx] and max_pos[max_idx] < min_pos[min_idx+1]):
+            if (max_pos[max_idx] > min_pos[min_idx] and 
+                ((min_idx == len(min_pos) - 1) or (max_pos[max_idx] < min_pos[min_idx+1]))):
+                # calculate the tear length and the slope
+                tear = (max_pos[max_idx] - min_pos[min_idx])
+                curr_slope = (max_force[max_idx] - min_force[min_idx]) / tear
+
+                if (curr_slope > 25000): # this is a safeguard against outliers
+                    if (on_outlier is not None):
+                        on_outlier(curr_slope)
+                else:
+                    slopes.append(curr_slope)
+                    stickSlip.append(tear)
+                break
+
+    # find the max and subsequent min that have the greatest difference.
+
+    max_drop = 0
+    max_drop_max_idx = -1
+    max_drop_min_idx = -1
+    for max_idx in range(len(max_pos)):
+        # get the subsequent min (if any)
+        for min_idx in range(len(min_pos)):
+            if (max_pos[max_idx] < min_pos[min_idx]):
+                # calculate the drop
+                drop = max_force[max_idx] - min_force[min_idx]
+                if (drop > max_drop):
+                    max_drop = drop
+                    max_drop_max_idx = max_idx
+                    max_drop_min_idx = min_idx
+                break
+    
+    # using the indices, calculate the magnitude of the force drop, the slope of the force drop,
+    # and the deformation of the drop. If the indices are -1, then return None for all values
+    if (max_drop == 0):
+        max_drop = None
+        max_drop_slope = None
+        # max_drop_deformation = None
+        max_force_val = 0
+        for max_idx in range (len(max_pos)):
+            if (max_force[max_idx] > max_force_val):
+                max_force_val = max_force[max_idx]
+                max_drop_max_idx = max_idx
+        max_drop_deformation = max_pos[max_drop_max_idx]
+
+    else:
+        max_drop_slope = -1.0 * (max_drop) / (max_pos[max_drop_max_idx] - min_pos[max_drop_min_idx])
+        max_drop_deformation = max_pos[max_drop_max_idx]
+
+    # get displacement of first maximum divided by total depth
+    first_max = max_pos[0]
+    total_depth = unique_pos[-1]
+    first_rupture_increment = max_drop_deformation / total_depth
+
+    # get greatest max force value and total depth
+    peak_force = max(max_force)
+    total_depth = unique_pos[-1]
+    first_yield = max_force[0]
+
+
+    return slopes, stickSlip, average_yield, max_drop, max_drop_slope, max_drop_deformation, first_rupture_increment, peak_force, total_depth, first_yield
+
 
 class TravelerAnalysisBase:
-    def __init__(self, _bypass_selection=False):
+    def __init__(self, _bypass_selection=False, _paths=None):
         ## Base Parameters:
+        self.config = AnalysisConfig() # analysis parameters (see trial_result.py)
         self.trimTrailingData = False
         self.showLeadingData = False
         
@@ -27,11 +165,20 @@ class TravelerAnalysisBase:
         self.path_index = 1
         self.groundHeight = 0
         self.extrusionAngle = 0
-        self.data_dict = {}
+        self.record = TrialRecord() # the trial being analyzed
         self.feature_files = [] # this is just used in flex_plotter.. but has to be present here for inheritance
+        self.artists = None # set to a fast_redraw.ArtistCache to update plots in place instead of clearing the axes
+        self.invalid_registry = None # set by open_registry() to skip the trials known to be invalid
+        self.result_cache = None # set by open_result_cache() to reuse the results of earlier runs
+        self.cached_rows = None # rows read for the current trial when its result came from the cache
 
         self.bypass_selection = _bypass_selection
-        self.user_selection()
+
+        # a list of paths skips the file/directory dialogs (used by worker processes)
+        if (_paths is not None):
+            self.paths = list(_paths)
+        else:
+            self.user_selection()
 
     def user_selection(self):
         root = tk.Tk()
@@ -52,7 +199,7 @@ class TravelerAnalysisBase:
 
         # if self.paths is empty, exit
         if (len(self.paths) == 0):
-            print('No files selected... exiting...')
+            log.error('No files selected... exiting...')
             exit()
 
 
@@ -63,21 +210,162 @@ class TravelerAnalysisBase:
 
             self.path_index += 1
             # self.fig.show()
-            self.ax.clear()
+            if (self.artists is None):
+                self.ax.clear()
 
         # plt.show()
 
     def process_file(self):
         # print('\n\nProcessing file ', self.path_index, ' of ', len(self.paths), '...')
-        self.curr_file_valid = True
+        self.analyze_file()
+        if (self.curr_file_valid):
+            self.plot_force()
+        self.end_trial()
+
+    def analyze_file(self, metrics=False):
+        # runs the analysis stages on self.path and returns their TrialResult (see trial_result.py)
+        self.begin_trial()
+        if (self.skip_known_invalid()):
+            self.record = TrialRecord()
+            return TrialResult.from_analysis(self)
+
         # Read data from path
         self.travelerRead()
-        
-        if (self.curr_file_valid == False):
-            return
-        
-        self.process_data()
-        self.plot_force()
+
+        if (self.curr_file_valid):
+            self.process_data()
+
+        trial_metrics = None
+        if (self.curr_file_valid and metrics):
+            trial_metrics = self.trial_metrics()
+        return TrialResult.from_analysis(self, trial_metrics)
+
+    # the trimming options are part of self.config
+    @property
+    def trimTrailingData(self):
+        return self.config.trim_trailing_data
+
+    @trimTrailingData.setter
+    def trimTrailingData(self, value):
+        self.config.trim_trailing_data = value
+
+    @property
+    def showLeadingData(self):
+        return self.config.show_leading_data
+
+    @showLeadingData.setter
+    def showLeadingData(self, value):
+        self.config.show_leading_data = value
+
+    def analysis_params(self):
+        # parameters that change the processed output, used to key the caches
+        return self.config.params()
+
+    def open_result_cache(self):
+        # reuses the TrialResults of earlier runs with the same configuration (see result_cache.py)
+        self.result_cache = ResultCache(self.config)
+
+    def analyze_cached(self, metrics=False):
+        # analyze_file() through the result cache, for callers that only use the returned TrialResult
+        if (self.result_cache is None):
+            return self.analyze_file(metrics)
+
+        result = self.result_cache.get(self.path, metrics)
+        if (result is None):
+            result = self.analyze_file(metrics)
+            self.result_cache.put(self.path, result)
+            return result
+
+        # the raw data columns are not cached, so the record only holds the trimmed and smoothed curves
+        self.begin_trial()
+        self.record = result.to_record()
+        self.cached_rows = result.rows
+        self.curr_file_valid = result.valid
+        self.invalid_stage = result.stage
+        self.invalid_reason = result.reason
+        return result
+
+    def open_registry(self, recheck=False):
+        # skips the trials found invalid by earlier runs (see invalid_registry.py); recheck analyzes them again
+        self.invalid_registry = InvalidRegistry(self.analysis_params(), recheck)
+
+    def skip_known_invalid(self):
+        if (self.invalid_registry is None):
+            return False
+        entry = self.invalid_registry.lookup(self.path)
+        if (entry is None):
+            return False
+        self.curr_file_valid = False
+        self.invalid_stage = entry['stage']
+        self.invalid_reason = entry['reason']
+        events.warn('known invalid trial', 'Known invalid trial (' + str(entry['reason']) + ')... skipping file...', self.path)
+        return True
+
+    def register_trial(self, path, valid, stage, reason):
+        # records the outcome of a trial in the invalid trial registry, if there is one
+        if (self.invalid_registry is not None):
+            self.invalid_registry.update(path, valid, stage, reason)
+
+    def save_registry(self):
+        if (self.invalid_registry is not None):
+            self.invalid_registry.save()
+
+    def trial_metrics(self):
+        # calculate_metrics() and the 1 cm and 2 mm slopes, by name
+        values = list(self.calculate_metrics())
+        x = self.record.smoothed_pos
+        y = self.record.smoothed_force
+        values.append(self.linear_regression(x, y, 0.01)[0])
+        values.append(self.linear_regression(x, y, 0.002)[0])
+        return dict(zip(METRIC_NAMES, values))
+
+    def begin_trial(self):
+        self.curr_file_valid = True
+        self.invalid_stage = None
+        self.invalid_reason = None
+        self.trial_logged = False
+        self.cached_rows = None
+
+    def trial_rows(self):
+        # number of data rows of the current trial (counted by the run that read the file for cached results)
+        if (self.cached_rows is not None):
+            return self.cached_rows
+        return len(self.record.time)
+
+    def invalidate(self, stage, reason, message=None):
+        # marks the current trial as invalid; the first reason is the one recorded for the trial
+        if (self.curr_file_valid):
+            self.invalid_stage = stage
+            self.invalid_reason = reason
+        self.curr_file_valid = False
+        events.warn(reason, message or ('WARNING: ' + reason + '... skipping file...'), getattr(self, 'path', None))
+
+    def end_trial(self):
+        # subclasses that keep working on the trial after process_file() log it themselves
+        self.log_trial()
+
+    def process_file_isolated(self):
+        # process_file() for batch runs: an error in one file is logged and the batch goes on
+        self.begin_trial()
+        try:
+            self.process_file()
+        except Exception as error:
+            self.trial_failed(error)
+
+    def trial_failed(self, error):
+        # marks the current trial invalid because of an unexpected error (traceback shown with --verbose)
+        log.debug('Error while processing %s:', self.path, exc_info=True)
+        logged = self.trial_logged
+        self.invalidate('error', 'error: ' + type(error).__name__,
+                        'ERROR: ' + type(error).__name__ + ': ' + str(error) + ' (' + str(self.path) + ')... skipping file...')
+        if (not logged):
+            self.log_trial()
+
+    def log_trial(self, **fields):
+        # records the status of the current trial in the event log (see event_log.py) and the invalid trial registry
+        self.trial_logged = True
+        self.register_trial(self.path, self.curr_file_valid, self.invalid_stage, self.invalid_reason)
+        events.trial(self.path, self.curr_file_valid, getattr(self, 'invalid_stage', None), getattr(self, 'invalid_reason', None), **fields)
 
     def select_file(self):
         root = tk.Tk()
@@ -98,7 +386,7 @@ class TravelerAnalysisBase:
         root.withdraw()  # Hide the main window
         dir = filedialog.askdirectory(title='Select Leg Data Directory (one or multiple)')
         if dir:
-            print(f"Selected directory: {dir}")
+            log.info(f"Selected directory: {dir}")
             # Add your file processing logic here, e.g., open the file and read its contents
             if not override:
                 self.directory = dir
@@ -118,8 +406,8 @@ class TravelerAnalysisBase:
                         # Print or process the CSV file
                         file_path = os.path.join(root, file)
                         paths.append(file_path)
-        print("Found {} CSV files in directory {}".format(len(paths), self.filepath))
-        print('Preparing to process files...')
+        log.info("Found {} CSV files in directory {}".format(len(paths), self.filepath))
+        log.info('Preparing to process files...')
         if not override:
             self.paths = paths
         return paths
@@ -128,11 +416,19 @@ class TravelerAnalysisBase:
         # get current filepath
         # filepath = self.paths[self.path_index]
         suptitle, notes, mode, version, flag_num, location, transect, trial_ID = self.parse_filename()
-        
-        with open(self.path, 'r') as file:
-            # Read the header and variable names
-            varNames = file.readline().strip().split(',')
-            varValues = file.readline().strip().split(',')
+        self.record = TrialRecord(trial_ID=trial_ID, version=version, flag_number=flag_num, location=location,
+                                  transect=transect, suptitle=suptitle, notes=notes, mode=mode)
+        if (self.curr_file_valid == False):
+            # DG trials are skipped before the file is read
+            return
+
+        with open(self.path, 'rb') as file:
+            raw = file.read()
+
+        # Read the header and variable names, and reject unusable files before parsing the data
+        varValues = self.prevalidate(raw, mode, version)
+        if (varValues is None):
+            return
 
         # Extract groundHeight value and store it in data.groundHeight
         self.groundHeight = float(varValues[-2]) / 100.0
@@ -145,62 +441,118 @@ class TravelerAnalysisBase:
         # print('Ground Height: ', self.groundHeight)
         # print('Extrusion Angle: ', self.extrusionAngle)
 
-        # Read the rest of the data using Pandas
-        data = pd.read_csv(self.path, skiprows=2)
+        # Read the rest of the data using Pandas (only the columns that are used)
+        data = pd.read_csv(io.BytesIO(raw), skiprows=2, usecols=lambda col: col.lower() in DATA_COLUMNS)
 
         # Convert column names to lowercase for consistency
         data.columns = [col.lower() for col in data.columns]
 
+        position_x = data['toe_position_x'].to_numpy()
         # Correct direction of position_y for plotting
-        data['toe_position_y'] = (-data['toe_position_y']) - self.groundHeight
+        position_y = (-data['toe_position_y'].to_numpy()) - self.groundHeight
+        force_x = data['toeforce_x'].to_numpy()
+        force_y = data['toeforce_y'].to_numpy()
 
-        extension = np.sqrt(data['toe_position_y']**2 + data['toe_position_x']**2)
+        extension = np.sqrt(position_y**2 + position_x**2)
 
         if (version >= 1): # new traveler data output configuration
-            data['toeforce_y'] = -data['toeforce_y']
-            data['toeforce_x'] = -data['toeforce_x']
+            force_y = -force_y
+            force_x = -force_x
 
         if (version == 2):
-            data['toe_position_x'] = -data['toe_position_x'] + (self.shear_length/2)
-            data['toeforce_x'] = -data['toeforce_x']
+            position_x = -position_x + (self.shear_length/2)
+            force_x = -force_x
 
         # !check the fuck out of this math
-        intrusion_force = math.sin(math.radians(self.extrusionAngle)) * data['toeforce_x'] + math.cos(math.radians(self.extrusionAngle)) * data['toeforce_y']
+        intrusion_force = math.sin(math.radians(self.extrusionAngle)) * force_x + math.cos(math.radians(self.extrusionAngle)) * force_y
         
 
-        # Extract required columns and assign them to the data dictionary
-        self.data_dict = {
-            'trial_ID' : trial_ID,
-            'version': version,
-            'flag_number': flag_num,
-            'location': location,
-            'transect': transect,
-            'suptitle': suptitle,
-            'notes': notes,
-            'mode': mode,
-            'start_index': 0,
-            'end_index': 0,
-            'time': data['time'].values,
-            'state': data['state flag'].values,
-            # 'normalized_time': [],
-            'position_x': data['toe_position_x'].values,
-            'position_y': data['toe_position_y'].values,
-            'extension': extension,
-            'force_x': data['toeforce_x'].values,
-            'force_y': data['toeforce_y'].values,
-            'intrusion_force': intrusion_force,
-            'trimmed_pos': [],
-            'trimmed_force': [],
-            'trimmed_time': [],
-            'max_indices': [],
-            'min_indices': [],
-            'smoothed_pos': [],
-            'smoothed_force': [],
-            'average_force': 0.0,
-            'stiffness': 0.0,
-            'groundHeight': self.groundHeight,
-            'extrusionAngle': self.extrusionAngle
-        }
+        # Extract required columns and assign them to the trial record
+        self.record = TrialRecord(
+            trial_ID=trial_ID,
+            version=version,
+            flag_number=flag_num,
+            location=location,
+            transect=transect,
+            suptitle=suptitle,
+            notes=notes,
+            mode=mode,
+            time=data['time'].to_numpy(),
+            state=data['state flag'].to_numpy(),
+            position_x=position_x,
+            position_y=position_y,
+            extension=extension,
+            force_x=force_x,
+            force_y=force_y,
+            intrusion_force=intrusion_force,
+            groundHeight=self.groundHeight,
+            extrusionAngle=self.extrusionAngle
+        )
+
+    def prevalidate(self, raw, mode, version):
+        """
+        Cheap checks of the raw file before the data is parsed: the metadata row, the
+        data columns, the row count and whether the intruder reached positive depth
+        (from a strided sample of the position column, and only if the sample does not
+        show it, from the whole column). Only trials that the full analysis would reject
+        (or fail on) are rejected. Returns the metadata row, or None if rejected.
+        """
+        lines = raw.split(b'\n', 3)
+        if (len(lines) < 4):
+            self.invalidate('prevalidate', 'too few rows', 'WARNING: No data rows... skipping file...')
+            return None
+
+        varValues = lines[1].decode(errors='replace').strip().split(',')
+        try:
+            ground_height = float(varValues[-2]) / 100.0
+            float(varValues[2])
+            float(varValues[7])
+        except (IndexError, ValueError):
+            self.invalidate('prevalidate', 'malformed metadata', 'WARNING: Malformed metadata row... skipping file...')
+            return None
+
+        columns = [col.lower() for col in lines[2].decode(errors='replace').strip().split(',')]
+        missing = [col for col in DATA_COLUMNS if col not in columns]
+        if (len(missing) > 0):
+            self.invalidate('prevalidate', 'missing columns', 'WARNING: Missing columns ' + ', '.join(missing) + '... skipping file...')
+            return None
+
+        # blank lines are counted too, so this never undercounts the rows pandas reads
+        body = lines[3]
+        rows = body.count(b'\n') + (0 if body.endswith(b'\n') else 1)
+        if (rows - 1 < self.config.min_trimmed_rows):
+            self.invalidate('prevalidate', 'too few rows', 'WARNING: Only {} data rows... skipping file...'.format(rows))
+            return None
+
+        if (version == 2): # mud shear data is trimmed by the state flag instead
+            return varValues
+
+        # same position as process_data(): depth below the ground for penetration, x for shear
+        if (mode == 0):
+            index, sign, offset = columns.index('toe_position_y'), -1.0, -ground_height
+        else:
+            index, sign, offset = columns.index('toe_position_x'), 1.0, 0.0
+
+        data_lines = body.split(b'\n')
+        stride = max(1, len(data_lines) // PREVALIDATE_SAMPLES)
+        for line in data_lines[::stride] + data_lines[-PREVALIDATE_SAMPLES:]:
+            try:
+                if (sign * float(line.split(b',')[index]) + offset >= 0):
+                    return varValues
+            except (IndexError, ValueError):
+                pass
+
+        # the sample never reached positive depth, so the whole column decides
+        position = pd.read_csv(io.BytesIO(raw), skiprows=2, usecols=[index]).iloc[:, 0].to_numpy(dtype=float)
+        if (len(position) > 0 and np.max(sign * position) + offset < 0):
+            self.invalidate('prevalidate', 'irregular distance', 'WARNING: Irregular Distance Detected... skipping file...')
+            return None
+        return varValues
+
+    @property
+    def data_dict(self):
+        # the trial record also supports the dict access of the former data_dict
+        return self.record
 
     def csvReader(self, filename):
         data = pd.read_csv(filename)
@@ -211,17 +563,17 @@ class TravelerAnalysisBase:
         return data
     
     def minmax_finder(self):
-        position = self.data_dict['trimmed_pos']
-        force = self.data_dict['trimmed_force']
-        time = self.data_dict['trimmed_time']
+        position = self.record.trimmed_pos
+        force = self.record.trimmed_force
+        time = self.record.trimmed_time
 
         if (len(position) == 0):
-            if self.data_dict['mode'] == 0: # penetration
-                position = self.data_dict['position_y']
-                force = self.data_dict['force_y']
+            if self.record.mode == 0: # penetration
+                position = self.record.position_y
+                force = self.record.force_y
             else: # shear
-                position = self.data_dict['position_x']
-                force = self.data_dict['force_x']
+                position = self.record.position_x
+                force = self.record.force_x
         
         # Sort the data based on pos values
         sorted_indices = np.argsort(position)
@@ -231,7 +583,7 @@ class TravelerAnalysisBase:
 
         # calculate the velocity of the intruder
         velocity = np.gradient(position, time)
-        self.data_dict['velocity'] = velocity
+        self.record.velocity = velocity
 
 
         # Remove duplicate pos values and correspondingly update the force values
@@ -242,9 +594,8 @@ class TravelerAnalysisBase:
 
         smoothed_force = unique_force
 
-        if (len(unique_force) < 12):
-            # print('WARNING: Irregular Distance Detected... skipping file...')
-            self.curr_file_valid = False
+        if (len(unique_force) < self.config.min_unique_points):
+            self.invalidate('minmax_finder', 'irregular distance', 'WARNING: Irregular Distance Detected... skipping file...')
         else:
             # Smooth the force data using Savitzky-Golay filter
             # smoothed_force = savgol_filter(unique_force, window_length=11, polyorder=3)
@@ -252,11 +603,10 @@ class TravelerAnalysisBase:
 
         # Calculate the average force for prominence threshold calculation
         average_force = np.trapz(unique_force, unique_pos) / unique_pos[-1]
-        if (average_force < 0 and self.data_dict['mode'] == 0):
-            # print('WARNING: Irregular Force Profile Detected... skipping file...')
-            self.curr_file_valid = False
+        if (average_force < 0 and self.record.mode == 0):
+            self.invalidate('minmax_finder', 'irregular force profile', 'WARNING: Irregular Force Profile Detected... skipping file...')
 
-        if (self.data_dict['version'] == 2): # for the mud shear, we use a different average force
+        if (self.record.version == 2): # for the mud shear, we use a different average force
             ## Calculate the average force from the shear data in the 85-95% position range
             pos_range = max(position) - min(position)
             lower_pos = 0.25 * pos_range
@@ -266,139 +616,39 @@ class TravelerAnalysisBase:
 
             average_force = np.trapz(force[lower_index:upper_index], position[lower_index:upper_index]) / (position[upper_index] - position[lower_index])
 
-        self.data_dict['average_force'] = average_force 
+        self.record.average_force = average_force 
         # print('Average Force: ', average_force)
-        prominence_threshold = np.abs(0.2 * average_force)
 
         # Find local maxima and minima pos values using the prominence threshold
-        pos_max, _ = find_peaks(smoothed_force, prominence=prominence_threshold, distance=10)
-        pos_min, _ = find_peaks(-1.0 * smoothed_force, prominence=prominence_threshold, distance=10)
-
-        # Insert a zero at the beginning of pos_min array
-        pos_min = np.insert(pos_min, 0, 0)
-
-        min_comp = np.insert(pos_min, 0, 0)
-        max_comp = np.insert(pos_max, 0, 0)
-        min_diff = np.average(np.subtract(pos_min, min_comp[:-1]))
-        max_diff = np.average(np.subtract(pos_max, max_comp[:-1]))
-
-
-        # add the last datapoint to the pos_min array
-        # pos_min = np.insert(pos_min, len(pos_min), len(unique_pos) - 1)
-
-        # add the maximum force value if not present in the array
-        max_force_idx = np.argmax(unique_force)
-        if (max_force_idx not in pos_max):
-            pos_max = np.insert(pos_max, len(pos_max), max_force_idx)
-            pos_max = np.sort(pos_max)
+        pos_max, pos_min = find_extrema(smoothed_force, average_force, self.config.prominence_factor, self.config.peak_distance)
 
         # # if the index of the last min is greater than the last max, trim
         # # the data to the last max.
         if (self.trimTrailingData and pos_min[-1] > pos_max[-1]):
             trim_value = unique_pos[pos_max[-1]]
-            trim_num = 0
-            for min_ in pos_min:
-                if (unique_pos[min_] > trim_value):
-                    trim_num += 1
-            pos_min = pos_min[0:-trim_num]
+            pos_min = trim_trailing_minima(unique_pos, pos_max, pos_min)
             range_end = self.find_closest_index(position, trim_value)
-            print('Trimming data after position: ', position[range_end])
-            self.data_dict['trimmed_pos'] = position[0:range_end]
-            self.data_dict['trimmed_force'] = force[0:range_end]
+            log.debug('Trimming data after position: %s', position[range_end])
+            self.record.trimmed_pos = position[0:range_end]
+            self.record.trimmed_force = force[0:range_end]
 
-        self.data_dict['max_indices'] = pos_max
-        self.data_dict['min_indices'] = pos_min
-        self.data_dict['smoothed_pos'] = unique_pos
-        self.data_dict['smoothed_force'] = smoothed_force
-        self.data_dict['smoothed_time'] = unique_time
+        self.record.max_indices = pos_max
+        self.record.min_indices = pos_min
+        self.record.smoothed_pos = unique_pos
+        self.record.smoothed_force = smoothed_force
+        self.record.smoothed_time = unique_time
 
         return pos_max, pos_min, unique_pos, smoothed_force, average_force
     
 
     def calculate_metrics(self):
-        max_indices = self.data_dict['max_indices']
-        min_indices = self.data_dict['min_indices']
-        unique_pos = self.data_dict['smoothed_pos']
-        smoothed_force = self.data_dict['smoothed_force']
-        
-        # local maxima positions and values
-        max_pos = unique_pos[max_indices]
-        print('number of max pos: ', len(max_pos))
-        max_force = smoothed_force[max_indices]
+        log.debug('number of max pos: %d', len(self.record.max_indices))
 
-        # local minima positions and values
-        min_pos = unique_pos[min_indices]
-        min_force = smoothed_force[min_indices]
+        def outlier(slope):
+            events.warn('outlier slope', 'Outlier Slope: {}'.format(slope), self.path)
 
-        slopes = []
-        stickSlip = []
-        average_yield = np.mean(max_force)
-
-        for min_idx in range(len(min_pos)):
-            # get the next maximum with a position greater than the current min,
-            # but less than the next min.
-            for max_idx in range(len(max_pos)):
-                # if the position of the max is greater than the current min and less than the next min:
-                # if (max_pos[max_idx] > min_pos[min_idx] and max_pos[max_idx] < min_pos[min_idx+1]):
-                if (max_pos[max_idx] > min_pos[min_idx] and 
-                    ((min_idx == len(min_pos) - 1) or (max_pos[max_idx] < min_pos[min_idx+1]))):
-                    # calculate the tear length and the slope
-                    tear = (max_pos[max_idx] - min_pos[min_idx])
-                    curr_slope = (max_force[max_idx] - min_force[min_idx]) / tear
-
-                    if (curr_slope > 25000): # this is a safeguard against outliers
-                        print('Outlier Slope: ', curr_slope) 
-                    else:
-                        slopes.append(curr_slope)
-                        stickSlip.append(tear)
-                    break
-
-        # find the max and subsequent min that have the greatest difference.
-
-        max_drop = 0
-        max_drop_max_idx = -1
-        max_drop_min_idx = -1
-        for max_idx in range(len(max_pos)):
-            # get the subsequent min (if any)
-            for min_idx in range(len(min_pos)):
-                if (max_pos[max_idx] < min_pos[min_idx]):
-                    # calculate the drop
-                    drop = max_force[max_idx] - min_force[min_idx]
-                    if (drop > max_drop):
-                        max_drop = drop
-                        max_drop_max_idx = max_idx
-                        max_drop_min_idx = min_idx
-                    break
-        
-        # using the indices, calculate the magnitude of the force drop, the slope of the force drop,
-        # and the deformation of the drop. If the indices are -1, then return None for all values
-        if (max_drop == 0):
-            max_drop = None
-            max_drop_slope = None
-            # max_drop_deformation = None
-            max_force_val = 0
-            for max_idx in range (len(max_pos)):
-                if (max_force[max_idx] > max_force_val):
-                    max_force_val = max_force[max_idx]
-                    max_drop_max_idx = max_idx
-            max_drop_deformation = max_pos[max_drop_max_idx]
-
-        else:
-            max_drop_slope = -1.0 * (max_drop) / (max_pos[max_drop_max_idx] - min_pos[max_drop_min_idx])
-            max_drop_deformation = max_pos[max_drop_max_idx]
-
-        # get displacement of first maximum divided by total depth
-        first_max = max_pos[0]
-        total_depth = unique_pos[-1]
-        first_rupture_increment = max_drop_deformation / total_depth
-
-        # get greatest max force value and total depth
-        peak_force = max(max_force)
-        total_depth = unique_pos[-1]
-        first_yield = max_force[0]
-
-
-        return slopes, stickSlip, average_yield, max_drop, max_drop_slope, max_drop_deformation, first_rupture_increment, peak_force, total_depth, first_yield
+        return stick_slip_metrics(self.record.smoothed_pos, self.record.smoothed_force,
+                                  self.record.max_indices, self.record.min_indices, outlier)
 
     def linear_regression(self, x, y, limit):
         # compute linear regression of x, y data on x domain [0, limit]
@@ -416,11 +666,10 @@ class TravelerAnalysisBase:
 
     def parse_filename(self):
         filename = self.path.split('/')[-1]
-        print('\t', filename)
+        log.debug('\t%s', filename)
 
         if 'DG' in filename or 'dg' in filename:
-            print('NOTICE: DG trial... skipping file...')
-            self.curr_file_valid = False
+            self.invalidate('parse_filename', 'DG trial', 'NOTICE: DG trial... skipping file...')
 
         filename_args = filename.split('_')
 
@@ -430,7 +679,7 @@ class TravelerAnalysisBase:
             version = 0
 
         if ('mud' in filename_args[0].lower()):
-            print('Mud Experiment Detected... Using Version 2...')
+            log.debug('Mud Experiment Detected... Using Version 2...')
             version = 2
 
         protocol = filename_args[3]
@@ -453,7 +702,7 @@ class TravelerAnalysisBase:
             protocol_string = 'Mud Shear'
             mode = 2
         else:
-            print('Protocol not recognized for file: ', filename)
+            log.warning('Protocol not recognized for file: %s', filename)
 
             protocol = input('Type \'P\' for Penetration, \'S\' for Shear: ')
             if (protocol == 'P' or protocol == 'p'):
@@ -463,7 +712,7 @@ class TravelerAnalysisBase:
                 mode = 1
             else:
                 protocol_string = input('Enter a protocol name for this trial: ')
-                print('Interpreting data as penetration...')
+                log.info('Interpreting data as penetration...')
 
         if ('extrude' in filename): # for John R. filename convention 'MH23_T2_F60_extrude1 _Thu_Aug_10_12_25_34_2023'
             location = ''
@@ -519,22 +768,23 @@ class TravelerAnalysisBase:
         pass
 
     def process_data(self):
+        # the raw arrays are read-only; the trimmed curves are slices of them
         pos_vector = []
         force_vector = []
         
         # select Penetration or Shear Data
-        if (self.data_dict.get('mode') == 0):
-            print('Penetration Trial')
-            pos_vector = self.data_dict['position_y']
-            force_vector = self.data_dict['force_y']
+        if (self.record.mode == 0):
+            log.debug('Penetration Trial')
+            pos_vector = self.record.position_y
+            force_vector = self.record.force_y
         else :
-            print('Shear Trial')
-            pos_vector = self.data_dict['position_x']
-            force_vector = self.data_dict['force_x']
+            log.debug('Shear Trial')
+            pos_vector = self.record.position_x
+            force_vector = self.record.force_x
 
 
-        if (self.data_dict['version'] == 2): # mud shear data analysis based on state flag
-            state_vector = self.data_dict['state']
+        if (self.record.version == 2): # mud shear data analysis based on state flag
+            state_vector = self.record.state
 
             # find first and last index where state is 3
             start_i = np.argmax(state_vector == 3)
@@ -548,11 +798,10 @@ class TravelerAnalysisBase:
             
             # return if intruder never reached positive depth 
             if (max_pos < 0):
-                print('WARNING: Irregular Distance Detected... skipping file...')
-                self.curr_file_valid = False
+                self.invalidate('process_data', 'irregular distance', 'WARNING: Irregular Distance Detected... skipping file...')
                 return
             rounded_max_pos = math.floor(max_pos * 1000)/1000.0 # round to mm
-            print('Rounded Max Position: ', rounded_max_pos)
+            log.debug('Rounded Max Position: %s', rounded_max_pos)
             end_i = np.argmax(pos_vector > rounded_max_pos)
             
             pos_ = pos_vector[0:end_i]
@@ -567,68 +816,70 @@ class TravelerAnalysisBase:
         # print('Range of i: [', start_i, ', ', end_i, ']')
 
         if (start_i >= end_i):
-            print('Ranging error: i_start >= end_i...')
-            print('   correcting i_start to 0... ')
+            events.warn('ranging error: start after end', 'Ranging error: i_start >= end_i... correcting i_start to 0...', self.path)
             start_i = 0
-            print('Plotting data from index ', start_i, ' to ', end_i)
-        if ((end_i - start_i) < 24):
-            print('Ranging error: trimmed data too short...')
-            self.curr_file_valid = False
+            log.debug('Plotting data from index %d to %d', start_i, end_i)
+        if ((end_i - start_i) < self.config.min_trimmed_rows):
+            self.invalidate('process_data', 'ranging error: trimmed data too short', 'Ranging error: trimmed data too short...')
             return
         
-        # normalize the positional data
-        pos_ = pos_ - pos_[start_i]
+        # position at crust contact, used to normalize the positional data
+        contact_pos = pos_vector[start_i]
+        self.record.contact_time = self.record.time[start_i]
 
         # shows the first 5mm before crust contact.
         if (self.showLeadingData):
             # find the index of position at -0.005m (5mm)
-            index = self.find_closest_index(pos_, -0.005)
+            index = self.find_closest_index(pos_vector[0:end_i] - contact_pos, -0.005)
             start_i = index
         
         # store the starting index
-        self.data_dict['start_index'] = start_i
-        self.data_dict['end_index'] = end_i
+        self.record.start_index = start_i
+        self.record.end_index = end_i
 
-        # trim the position data
-        pos_ = pos_[start_i:end_i]
+        # trim, then normalize the position data (only the trimmed window is copied)
+        pos_ = pos_vector[start_i:end_i] - contact_pos
 
         # trim the time data
-        time = self.data_dict['time'][start_i:end_i]
-        self.data_dict['trimmed_time'] = time
+        time = self.record.time[start_i:end_i]
+        self.record.trimmed_time = time
         # find the corresponding force range
         force_ = force_vector[start_i:end_i]
         # y_pos_ = data['position_y'][i_start:end_i] - data['position_y'][i_start]
 
         # pos, force = self.trim_data(pos_, force_) 
-        self.data_dict['trimmed_pos'] = pos_
-        self.data_dict['trimmed_force'] = force_
+        self.record.trimmed_pos = pos_
+        self.record.trimmed_force = force_
 
         max_indices, min_indices, smooth_pos, smooth_force, average_force = self.minmax_finder()
 
 
     def plot_force(self):
         # reinitialize vectors based on changes from minmax finder
-        pos = self.data_dict['trimmed_pos']
-        force = self.data_dict['trimmed_force']
-        time = self.data_dict['trimmed_time']
-        average_force = self.data_dict['average_force']
-        smooth_pos = self.data_dict['smoothed_pos']
-        smooth_force = self.data_dict['smoothed_force']
-        max_indices = self.data_dict['max_indices']
-        min_indices = self.data_dict['min_indices']
+        pos = self.record.trimmed_pos
+        force = self.record.trimmed_force
+        time = self.record.trimmed_time
+        average_force = self.record.average_force
+        smooth_pos = self.record.smoothed_pos
+        smooth_force = self.record.smoothed_force
+        max_indices = self.record.max_indices
+        min_indices = self.record.min_indices
         
-        if (average_force < 0 and self.data_dict['mode'] == 0):
-            print('WARNING: Irregular Force Profile Detected... skipping file...')
-            self.curr_file_valid = False
+        if (average_force < 0 and self.record.mode == 0 and self.curr_file_valid):
+            self.invalidate('plot_force', 'irregular force profile', 'WARNING: Irregular Force Profile Detected... skipping file...')
         
         if (self.curr_file_valid == False):
             return
 
+        if (self.artists is not None):
+            self.plot_force_fast()
+            return
+
         self.ax.plot(pos, force, '-', label="Raw Force", linewidth=2)
         self.ax.plot(smooth_pos[min_indices], smooth_force[min_indices], "v", label="Local Minima", markersize=10, markerfacecolor='r')
         self.ax.plot(smooth_pos[max_indices], smooth_force[max_indices], "^", label="Local Maxima", markersize=10, markerfacecolor='g')
 
-        if (self.data_dict.get('mode') == 0):
+        if (self.record.mode == 0):
             self.ax.set_xlabel('Vertical Depth (meters)', fontsize=18)
             self.ax.set_ylabel('Penetration Force (N)', fontsize=18)
             if (self.showLeadingData):
@@ -639,19 +890,55 @@ class TravelerAnalysisBase:
             self.ax.set_xlabel('Shear Length (meters)', fontsize=18)
             self.ax.set_ylabel('Shear Force (N)', fontsize=18)
         
-        self.fig.suptitle(self.data_dict.get("suptitle"), fontsize=24)
-        self.ax.set_title(self.data_dict.get("notes"), fontsize=18)
+        self.fig.suptitle(self.record.suptitle, fontsize=24)
+        self.ax.set_title(self.record.notes, fontsize=18)
         self.ax.legend()
         self.ax.tick_params(labelsize=18)
 
 
+    def plot_force_fast(self):
+        # same figure as plot_force(), updating the existing artists in place
+        pos = self.record.trimmed_pos
+        force = self.record.trimmed_force
+        smooth_pos = self.record.smoothed_pos
+        smooth_force = self.record.smoothed_force
+        max_indices = self.record.max_indices
+        min_indices = self.record.min_indices
+
+        self.artists.begin()
+        self.artists.line(self.ax, 'force', pos, force, '-', label="Raw Force", linewidth=2)
+        self.artists.line(self.ax, 'minima', smooth_pos[min_indices], smooth_force[min_indices], "v", label="Local Minima", markersize=10, markerfacecolor='r')
+        self.artists.line(self.ax, 'maxima', smooth_pos[max_indices], smooth_force[max_indices], "^", label="Local Maxima", markersize=10, markerfacecolor='g')
+
+        if (self.record.mode == 0):
+            self.artists.xlabel(self.ax, 'Vertical Depth (meters)', fontsize=18)
+            self.artists.ylabel(self.ax, 'Penetration Force (N)', fontsize=18)
+            if (self.showLeadingData):
+                self.artists.set_xlim(self.ax, -0.005, 0.03)
+            else:
+                self.artists.set_xlim(self.ax, 0, 0.03)
+        else:
+            self.artists.xlabel(self.ax, 'Shear Length (meters)', fontsize=18)
+            self.artists.ylabel(self.ax, 'Shear Force (N)', fontsize=18)
+            self.artists.free_xlim(self.ax)
+
+        self.artists.suptitle(self.record.suptitle, fontsize=24)
+        self.artists.title(self.ax, self.record.notes, fontsize=18)
+        self.artists.legend(self.ax)
+        self.artists.tick_params(self.ax, labelsize=18)
+        self.artists.finish()
+
+    def figure_folder(self, path, fig_folder='figures'):
+        # figures are saved in a sibling directory of the data directory
+        filename = path.split('/')[-1]
+        parent_path = path.rstrip(filename)
+        figure_path = parent_path.replace('data/', '')
+        return os.path.join(figure_path, fig_folder)
+
     def save_plot(self, fig_folder='figures'):
         filename = self.path.split('/')[-1]
-        parent_path = self.path.rstrip(filename)
-        figure_path = parent_path.replace('data/', '')
-        self.output_path = os.path.join(figure_path, fig_folder)
-        if not os.path.exists(self.output_path):
-            os.mkdir(self.output_path)
+        self.output_path = self.figure_folder(self.path, fig_folder)
+        os.makedirs(self.output_path, exist_ok=True)
         self.save_path = self.output_path
         png_save_name = filename.replace('.csv', '.png')
         
@@ -677,12 +964,13 @@ class TravelerAnalysisBase:
     # Function to remove any NaN or infinite values
     def trim_data(self, x, y):
         mask = (~pd.isna(x)) & (~pd.isna(y))
-        self.data_dict['trimmed_pos'] = x[mask]
-        self.data_dict['trimmed_force'] = y[mask]
+        self.record.trimmed_pos = x[mask]
+        self.record.trimmed_force = y[mask]
         return x[mask], y[mask]
     
 
 if __name__ == "__main__":
+    configure()
     player = TravelerAnalysisBase()
     # player.play()
     player.run()
\ No newline at end of file
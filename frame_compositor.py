@@ -0,0 +1,211 @@
+import time
+import queue
+import threading
+import subprocess
+import cv2
+import numpy as np
+from matplotlib.colors import to_rgb
+from event_log import log
+
+
+"""
+    Class: FrameCompositor
+    Description:
+        Fast renderer for synchronized trial videos. The figure (force curve,
+        labels, title) is rasterized once with matplotlib; each output frame
+        is then a copy of that background with the video frame resized into
+        the video pane and the tracking dot drawn with OpenCV.
+
+        The video image and tracking dot artists are hidden while the
+        background is rendered, and the positions of all data points are
+        converted to pixel coordinates once with ax.transData.
+
+        Frames are in BGR order (as decoded by OpenCV) and have even
+        dimensions so they can be encoded as yuv420p.
+"""
+
+class FrameCompositor:
+    def __init__(self, fig, ax, video_ax, video_img, tracking_dot, x_data, y_data):
+        video_img.set_visible(False)
+        tracking_dot.set_visible(False)
+        fig.canvas.draw()
+        background = np.asarray(fig.canvas.buffer_rgba())[:, :, :3]
+        video_img.set_visible(True)
+        tracking_dot.set_visible(True)
+
+        height, width = background.shape[:2]
+        self.height = height - height % 2
+        self.width = width - width % 2
+        self.background = cv2.cvtColor(np.ascontiguousarray(background[:self.height, :self.width]), cv2.COLOR_RGB2BGR)
+
+        # pixel rectangle of the video image (display coordinates have the origin at the bottom left)
+        x0, x1, y0, y1 = video_img.get_extent()
+        corners = video_ax.transData.transform([(x0, y0), (x1, y1)])
+        left, right = np.sort(np.round(corners[:, 0]).astype(int))
+        top, bottom = np.sort(np.round(height - corners[:, 1]).astype(int))
+        self.pane = (max(left, 0), min(right, self.width), max(top, 0), min(bottom, self.height))
+
+        # tracking dot pixel positions for every data point, clipped to the force axes like matplotlib does
+        points = ax.transData.transform(np.column_stack([x_data, y_data]))
+        self.dot_x = np.round(points[:, 0]).astype(int)
+        self.dot_y = np.round(height - points[:, 1]).astype(int)
+        bbox = ax.get_window_extent()
+        self.dot_visible = ((points[:, 0] >= bbox.x0) & (points[:, 0] <= bbox.x1) &
+                            (points[:, 1] >= bbox.y0) & (points[:, 1] <= bbox.y1) &
+                            np.all(np.isfinite(points), axis=1))
+
+        # markersize is the marker diameter in points (the edge is drawn in the same color)
+        diameter = tracking_dot.get_markersize() + tracking_dot.get_markeredgewidth()
+        self.dot_radius = max(1, int(round(diameter / 2 * fig.dpi / 72)))
+        r, g, b = [int(round(255 * c)) for c in to_rgb(tracking_dot.get_markerfacecolor())]
+        self.dot_color = (b, g, r)
+
+    def compose(self, frame, data_index):
+        # frame is a BGR video frame, data_index the data point under the tracking dot
+        out = self.background.copy()
+        left, right, top, bottom = self.pane
+        if (right > left and bottom > top):
+            out[top:bottom, left:right] = cv2.resize(frame, (right - left, bottom - top), interpolation=cv2.INTER_AREA)
+
+        if (self.dot_visible[data_index]):
+            cv2.circle(out, (int(self.dot_x[data_index]), int(self.dot_y[data_index])), self.dot_radius, self.dot_color, -1, cv2.LINE_AA)
+        return out
+
+
+"""
+    Class: FFmpegWriter
+    Description:
+        Pipes raw BGR frames into an ffmpeg subprocess that encodes them as an
+        h264 .mp4 (the same codec and pixel format matplotlib's ffmpeg writer uses).
+"""
+
+class FFmpegWriter:
+    def __init__(self, path, width, height, fps, threads=None):
+        command = ['ffmpeg', '-y', '-loglevel', 'error',
+                   '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', str(width) + 'x' + str(height),
+                   '-framerate', str(fps), '-i', '-',
+                   '-an', '-vcodec', 'h264', '-pix_fmt', 'yuv420p']
+        if (threads is not None):
+            command.extend(['-threads', str(threads)])
+        command.append(path)
+
+        self.path = path
+        self.frames = 0
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def write(self, frame):
+        self.process.stdin.write(np.ascontiguousarray(frame).data)
+        self.frames += 1
+
+    def close(self):
+        self.process.stdin.close()
+        return self.process.wait()
+
+
+"""
+    Class: FramePipeline
+    Description:
+        Runs the decode, composite and encode stages of the fast renderer on
+        three threads connected by bounded queues:
+
+            source (iterator of decoded frames) -> transform -> sink
+
+        OpenCV and the ffmpeg pipe release the GIL, so the stages overlap.
+        The busy time of every stage (excluding time spent waiting on the
+        queues) is recorded so the slowest stage can be identified.
+"""
+
+class FramePipeline:
+    def __init__(self, source, transform, sink, queue_size=8):
+        self.source = source
+        self.transform = transform
+        self.sink = sink
+        self.queue_size = queue_size
+        self.stop = threading.Event()
+        self.errors = []
+        self.timings = {'decode': 0.0, 'composite': 0.0, 'encode': 0.0}
+        self.frames = 0
+
+    def put(self, q, item):
+        # gives up if another stage failed, so no thread blocks forever on a full queue
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(self, q):
+        while not self.stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return None
+
+    def decode_stage(self, out_q):
+        iterator = iter(self.source)
+        while True:
+            start = time.perf_counter()
+            item = next(iterator, None)
+            self.timings['decode'] += time.perf_counter() - start
+            if (item is None or not self.put(out_q, item)):
+                break
+        self.put(out_q, None)
+
+    def composite_stage(self, in_q, out_q):
+        while True:
+            item = self.get(in_q)
+            if (item is None):
+                break
+            start = time.perf_counter()
+            result = self.transform(item)
+            self.timings['composite'] += time.perf_counter() - start
+            if not self.put(out_q, result):
+                break
+        self.put(out_q, None)
+
+    def encode_stage(self, in_q):
+        while True:
+            item = self.get(in_q)
+            if (item is None):
+                break
+            start = time.perf_counter()
+            self.sink(item)
+            self.timings['encode'] += time.perf_counter() - start
+            self.frames += 1
+
+    def guarded(self, stage, *args):
+        try:
+            stage(*args)
+        except Exception as e:
+            self.errors.append(e)
+            self.stop.set()
+
+    def run(self):
+        start = time.perf_counter()
+        decoded = queue.Queue(maxsize=self.queue_size)
+        composited = queue.Queue(maxsize=self.queue_size)
+        threads = [
+            threading.Thread(target=self.guarded, args=(self.decode_stage, decoded), name='decode'),
+            threading.Thread(target=self.guarded, args=(self.composite_stage, decoded, composited), name='composite'),
+            threading.Thread(target=self.guarded, args=(self.encode_stage, composited), name='encode')
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.perf_counter() - start
+
+        if (len(self.errors) > 0):
+            raise self.errors[0]
+        return self.frames
+
+    def print_timings(self):
+        log.info('Pipeline: %d frames in %.1f s (%.0f frames/s)', self.frames, self.elapsed, self.frames / max(self.elapsed, 1e-9))
+        bottleneck = max(self.timings, key=self.timings.get)
+        for stage, busy in self.timings.items():
+            log.info('  {:<10} {:6.1f} s busy ({:5.1f} ms/frame, {:3.0f}% of wall time){}'.format(
+                stage, busy, 1000 * busy / max(self.frames, 1), 100 * busy / max(self.elapsed, 1e-9),
+                '  <- bottleneck' if stage == bottleneck else ''))
@@ -0,0 +1,140 @@
+import os
+import json
+import shutil
+import subprocess
+import cv2
+import numpy as np
+from event_log import log, events
+
+
+"""
+    Class: FrameIndex
+    Description:
+        Per-video index of frame timestamps and keyframes, built once and
+        cached as a sidecar file next to the video (<video>.frames.npz).
+
+            - timestamps: presentation time (seconds from the start of the
+              stream) of every frame, in display order
+            - keyframes: frame numbers of the keyframes, used to seek to the
+              keyframe before a target frame and only decode from there
+
+        The index is read with ffprobe when it is installed. Otherwise the
+        timestamps are assumed to follow the constant frame rate reported by
+        OpenCV and seeking is left to OpenCV.
+
+        The sidecar is rebuilt when the size or modification time of the
+        video changes.
+"""
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = '.frames.npz'
+
+
+class FrameIndex:
+    def __init__(self, timestamps, keyframes, fps, source='constant fps'):
+        self.timestamps = np.asarray(timestamps, dtype=float)
+        self.keyframes = np.asarray(keyframes, dtype=int)
+        self.fps = fps
+        self.source = source
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @classmethod
+    def load(cls, video_file, cap=None):
+        # returns the cached index of video_file, building (and caching) it if needed
+        stat = os.stat(video_file)
+        fingerprint = np.array([INDEX_VERSION, stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+        path = video_file + INDEX_SUFFIX
+
+        if os.path.exists(path):
+            try:
+                with np.load(path) as cached:
+                    if np.array_equal(cached['fingerprint'], fingerprint):
+                        return cls(cached['timestamps'], cached['keyframes'], float(cached['fps']), str(cached['source']))
+            except (OSError, ValueError, KeyError):
+                log.warning('WARNING: Could not read frame index %s... rebuilding...', path)
+
+        index = cls.build(video_file, cap)
+        try:
+            tmp_path = path + '.tmp.npz'
+            np.savez(tmp_path, fingerprint=fingerprint, timestamps=index.timestamps,
+                     keyframes=index.keyframes, fps=index.fps, source=index.source)
+            os.replace(tmp_path, path)
+        except OSError:
+            log.warning('WARNING: Could not write frame index %s', path)
+        return index
+
+    @classmethod
+    def build(cls, video_file, cap=None):
+        release = cap is None
+        if (cap is None):
+            cap = cv2.VideoCapture(video_file)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if (release):
+            cap.release()
+
+        if (shutil.which('ffprobe') is not None):
+            index = cls.probe(video_file, fps)
+            if (index is not None):
+                return index
+
+        log.info('Building constant frame rate index for %s', video_file)
+        return cls(np.arange(frame_count) / fps, [], fps)
+
+    @classmethod
+    def probe(cls, video_file, fps):
+        # reads the packet timestamps and keyframe flags of the first video stream
+        command = ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+                   '-show_entries', 'packet=pts_time,flags', '-of', 'json', video_file]
+        try:
+            output = subprocess.run(command, capture_output=True, check=True).stdout
+            packets = json.loads(output).get('packets', [])
+        except (OSError, subprocess.CalledProcessError, ValueError):
+            events.warn('ffprobe failed', 'WARNING: ffprobe failed for ' + video_file + '... assuming a constant frame rate...', video_file)
+            return None
+
+        packets = [p for p in packets if p.get('pts_time') not in (None, 'N/A')]
+        if (len(packets) == 0):
+            return None
+
+        # packets are in decode order; frames are numbered in presentation order
+        pts = np.array([float(p['pts_time']) for p in packets])
+        is_key = np.array(['K' in p.get('flags', '') for p in packets])
+        order = np.argsort(pts, kind='stable')
+        pts = pts[order]
+        keyframes = np.flatnonzero(is_key[order])
+
+        log.info('Built frame index for %s (%d frames, %d keyframes)', video_file, len(pts), len(keyframes))
+        return cls(pts - pts[0], keyframes, fps, 'ffprobe')
+
+    def data_indices(self, data_time, bias=0.0):
+        # index of the last data sample at or before each frame time (+ bias), clipped at 0
+        indices = np.searchsorted(data_time, self.timestamps + bias, side='right') - 1
+        return np.clip(indices, 0, None)
+
+    def frame_at(self, t):
+        # number of the frame shown at time t (seconds)
+        return max(0, int(np.searchsorted(self.timestamps, t, side='right')) - 1)
+
+    def seek(self, cap, frame):
+        """
+        Positions cap so the next read() returns the given frame. With a known
+        keyframe list, cap is positioned on the keyframe at or before the frame
+        and the frames in between are grabbed without being retrieved.
+        """
+        frame = int(min(max(frame, 0), max(len(self) - 1, 0)))
+        if (frame == 0):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            return frame
+
+        if (len(self.keyframes) > 0):
+            keyframe = int(self.keyframes[max(0, np.searchsorted(self.keyframes, frame, side='right') - 1)])
+            cap.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+            for i in range(frame - keyframe):
+                cap.grab()
+        else:
+            # OpenCV seeks to the preceding keyframe and decodes forward itself
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame)
+        return frame
@@ -0,0 +1,247 @@
+import os
+import json
+import base64
+import hashlib
+import numpy as np
+import plotly.graph_objects as go
+from plotly.offline import get_plotlyjs, get_plotlyjs_version
+from event_log import log
+
+
+"""
+    Class: HtmlReport
+    Description:
+        Collects many Plotly figures into one compact HTML report.
+
+            - plotly.js is included once, either inline or as a plotly.min.js
+              file next to the report
+            - numeric arrays in the figures are stored once as base64-encoded
+              typed arrays and shared between figures (e.g. the same trial
+              curve or metric vector used in several plots)
+            - repeated non-numeric arrays (trial labels, filenames) are also
+              stored once
+            - each figure is only drawn when it scrolls into view
+
+        Usage:
+            report = HtmlReport('MH23 Campaign')
+            report.add_figure(fig, 'Average Force vs. Flag Number')
+            report.write('figures/report.html')
+"""
+
+# arrays shorter than this are left inline in the figure json
+MIN_ARRAY_LENGTH = 8
+
+TYPED_ARRAYS = {
+    'float64': 'Float64Array',
+    'float32': 'Float32Array',
+    'int32': 'Int32Array',
+}
+
+
+class HtmlReport:
+    def __init__(self, title='Traveler Report', float_dtype='float64'):
+        self.title = title
+        self.float_dtype = float_dtype
+        self.figures = []       # (title, figure json)
+        self.arrays = []        # [typed array name, base64 data] or [None, json value]
+        self.array_index = {}   # hash -> index into self.arrays
+
+    def add_figure(self, fig, title=None):
+        if isinstance(fig, go.Figure):
+            fig = fig.to_plotly_json()
+        spec = {
+            'data': [self.pool(trace) for trace in fig.get('data', [])],
+            'layout': self.pool(fig.get('layout', {}))
+        }
+        if (title is None):
+            title = fig.get('layout', {}).get('title', {}).get('text', '')
+        self.figures.append((title, spec))
+
+    def pool(self, value):
+        # recursively replaces long arrays with references into the shared array pool
+        if isinstance(value, dict):
+            if ('bdata' in value and 'dtype' in value):
+                # plotly >= 6 already encodes numpy arrays as base64 typed array specs,
+                # which plotly.js decodes itself, so these only need to be shared
+                return self.add_object(value)
+            pooled = {k: self.pool(v) for k, v in value.items()}
+            if ('template' in pooled):
+                # every figure carries the same (large) layout template
+                pooled['template'] = self.add_object(pooled['template'])
+            return pooled
+        if isinstance(value, (list, tuple, np.ndarray)):
+            if (len(value) >= MIN_ARRAY_LENGTH):
+                ref = self.add_array(value)
+                if (ref is not None):
+                    return ref
+            return [self.pool(v) for v in value]
+        if isinstance(value, np.generic):
+            value = value.item()
+        if isinstance(value, float) and not np.isfinite(value):
+            return None
+        return value
+
+    def add_object(self, value):
+        encoded = json.dumps(value, sort_keys=True)
+        key = hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+        if (key not in self.array_index):
+            self.array_index[key] = len(self.arrays)
+            self.arrays.append([None, value])
+        return {'__array__': self.array_index[key]}
+
+    def add_array(self, value):
+        array = self.numeric_array(value)
+        if (array is not None):
+            data = array.tobytes()
+            kind = TYPED_ARRAYS[str(array.dtype)]
+            key = hashlib.sha1(kind.encode('utf-8') + data).hexdigest()
+            entry = [kind, base64.b64encode(data).decode('ascii')]
+        else:
+            # only flat arrays of strings and numbers are pooled as json
+            if not all(isinstance(v, (str, int, float, type(None))) for v in value):
+                return None
+            value = [self.pool(v) for v in value]
+            encoded = json.dumps(value)
+            key = hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+            entry = [None, value]
+
+        if (key not in self.array_index):
+            self.array_index[key] = len(self.arrays)
+            self.arrays.append(entry)
+        return {'__array__': self.array_index[key]}
+
+    def numeric_array(self, value):
+        # converts a flat numeric sequence (None -> NaN) to a float or int32 array
+        if isinstance(value, np.ndarray):
+            if (value.ndim != 1 or value.dtype.kind not in 'iufb'):
+                return None
+            array = value
+        else:
+            if not all(isinstance(v, (int, float, np.number, type(None))) and not isinstance(v, bool) for v in value):
+                return None
+            array = np.array([np.nan if v is None else v for v in value])
+
+        if (array.dtype.kind in 'iub' and array.size > 0
+                and array.min() >= np.iinfo(np.int32).min and array.max() <= np.iinfo(np.int32).max):
+            return array.astype(np.int32)
+        return array.astype(self.float_dtype)
+
+    def write(self, path, include_plotlyjs='inline'):
+        """
+        Writes the report. include_plotlyjs is 'inline' (single self-contained file),
+        'directory' (plotly.min.js written next to the report) or 'cdn'.
+        """
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+
+        if (include_plotlyjs == 'inline'):
+            plotly_script = '<script type="text/javascript">' + get_plotlyjs() + '</script>'
+        elif (include_plotlyjs == 'directory'):
+            js_path = os.path.join(folder, 'plotly.min.js')
+            if not os.path.exists(js_path):
+                with open(js_path, 'w', encoding='utf-8') as file:
+                    file.write(get_plotlyjs())
+            plotly_script = '<script src="plotly.min.js"></script>'
+        else:
+            # plotly-latest is frozen at 1.58, which can not read the typed arrays of current figures
+            plotly_script = '<script src="https://cdn.plot.ly/plotly-{}.min.js"></script>'.format(get_plotlyjs_version())
+
+        sections = []
+        for i, (title, spec) in enumerate(self.figures):
+            sections.append('<section><h2>' + html_escape(title) + '</h2><div class="figure" data-index="' + str(i) + '"></div></section>')
+
+        html = REPORT_TEMPLATE.format(
+            title=html_escape(self.title),
+            plotly_script=plotly_script,
+            sections='\n'.join(sections),
+            arrays=script_json(self.arrays),
+            figures=script_json([spec for title, spec in self.figures]))
+
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(html)
+        log.info('Saved report with %d figures as file: %s', len(self.figures), path)
+        return path
+
+
+def html_escape(text):
+    return str(text).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def script_json(value):
+    # json that is safe to embed in a <script> element
+    encoded = json.dumps(value, separators=(',', ':'))
+    return encoded.replace('</', '<\\/')
+
+
+REPORT_TEMPLATE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+  body {{ font-family: Arial, sans-serif; margin: 2em; }}
+  .figure {{ width: 100%; min-height: 600px; }}
+</style>
+{plotly_script}
+</head>
+<body>
+<h1>{title}</h1>
+{sections}
+<script type="application/json" id="report-arrays">{arrays}</script>
+<script type="application/json" id="report-figures">{figures}</script>
+<script type="text/javascript">
+(function() {{
+  var arrays = JSON.parse(document.getElementById('report-arrays').textContent);
+  var figures = JSON.parse(document.getElementById('report-figures').textContent);
+  var decoded = {{}};
+
+  function decode(index) {{
+    if (!(index in decoded)) {{
+      var entry = arrays[index];
+      if (entry[0] === null) {{
+        decoded[index] = entry[1];
+      }} else {{
+        var binary = atob(entry[1]);
+        var bytes = new Uint8Array(binary.length);
+        for (var i = 0; i < binary.length; i++) {{ bytes[i] = binary.charCodeAt(i); }}
+        decoded[index] = new window[entry[0]](bytes.buffer);
+      }}
+    }}
+    return decoded[index];
+  }}
+
+  function restore(value) {{
+    if (Array.isArray(value)) {{ return value.map(restore); }}
+    if (value !== null && typeof value === 'object') {{
+      if ('__array__' in value) {{ return decode(value.__array__); }}
+      var out = {{}};
+      for (var key in value) {{ out[key] = restore(value[key]); }}
+      return out;
+    }}
+    return value;
+  }}
+
+  function draw(div) {{
+    var spec = figures[parseInt(div.getAttribute('data-index'))];
+    Plotly.newPlot(div, restore(spec.data), restore(spec.layout), {{responsive: true}});
+  }}
+
+  var divs = document.querySelectorAll('.figure');
+  if ('IntersectionObserver' in window) {{
+    var observer = new IntersectionObserver(function(entries) {{
+      entries.forEach(function(entry) {{
+        if (entry.isIntersecting) {{
+          observer.unobserve(entry.target);
+          draw(entry.target);
+        }}
+      }});
+    }}, {{rootMargin: '200px'}});
+    divs.forEach(function(div) {{ observer.observe(div); }});
+  }} else {{
+    divs.forEach(draw);
+  }}
+}})();
+</script>
+</body>
+</html>
+'''
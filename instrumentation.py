@@ -0,0 +1,206 @@
+import io
+import os
+import csv
+import json
+import time
+import pstats
+import cProfile
+from event_log import log
+
+
+"""
+    Class: PipelineProfiler
+    Description:
+        Per-stage timing of the analysis pipeline. instrument() wraps the
+        stage methods of a plotter instance (travelerRead, process_data,
+        minmax_finder, plot_force, save_plot, ...) so every call records its
+        wall and CPU time. Stages call each other (process_data calls
+        minmax_finder), so both the inclusive time and the exclusive time
+        (excluding the stages called from inside) are kept.
+
+        Each top-level call of process_file is one trial; the rows and bytes
+        read for the trial are recorded with its stage times.
+
+        Usage:
+            profiler = PipelineProfiler()
+            profiler.instrument(plotter)
+            with profiler.batch(use_cprofile=False):
+                plotter.run()
+            profiler.report()
+            profiler.export('profile')   # profile.json and profile.csv
+"""
+
+STAGES = ['process_file', 'travelerRead', 'parse_filename', 'prevalidate', 'process_data', 'minmax_finder',
+          'calculate_metrics', 'format_trial', 'aggregate_data', 'plot_force', 'save_plot',
+          'open_video', 'estimate_bias', 'render_composite', 'extract_clip']
+TRIAL_STAGE = 'process_file'
+
+
+class PipelineProfiler:
+    def __init__(self, stages=STAGES):
+        self.stages = stages
+        self.totals = {} # stage -> [calls, wall, cpu, exclusive wall, exclusive cpu]
+        self.trials = []
+        self.trial = None
+        self.stack = [] # [stage, child wall, child cpu] of the calls in progress
+        self.batch_wall = 0.0
+        self.batch_cpu = 0.0
+        self.profile = None
+
+    def instrument(self, obj):
+        # replaces the stage methods of obj (an instance) with timed wrappers
+        for stage in self.stages:
+            method = getattr(obj, stage, None)
+            if (method is not None and callable(method)):
+                setattr(obj, stage, self.wrap(obj, stage, method))
+        return obj
+
+    def wrap(self, obj, stage, method):
+        def timed(*args, **kwargs):
+            top_level_trial = (stage == TRIAL_STAGE and self.trial is None)
+            if (top_level_trial):
+                self.begin_trial(getattr(obj, 'path', ''))
+
+            self.stack.append([stage, 0.0, 0.0])
+            wall_start = time.perf_counter()
+            cpu_start = time.process_time()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                wall = time.perf_counter() - wall_start
+                cpu = time.process_time() - cpu_start
+                frame = self.stack.pop()
+                self.record(stage, wall, cpu, wall - frame[1], cpu - frame[2])
+                if (len(self.stack) > 0):
+                    self.stack[-1][1] += wall
+                    self.stack[-1][2] += cpu
+                if (top_level_trial):
+                    self.end_trial(obj)
+        return timed
+
+    def record(self, stage, wall, cpu, exclusive_wall, exclusive_cpu):
+        totals = self.totals.setdefault(stage, [0, 0.0, 0.0, 0.0, 0.0])
+        totals[0] += 1
+        totals[1] += wall
+        totals[2] += cpu
+        totals[3] += exclusive_wall
+        totals[4] += exclusive_cpu
+        if (self.trial is not None):
+            self.trial['stages'][stage] = self.trial['stages'].get(stage, 0.0) + exclusive_wall
+
+    def begin_trial(self, path):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        self.trial = {'path': path, 'bytes': size, 'rows': 0, 'stages': {}}
+
+    def end_trial(self, obj):
+        self.trial['rows'] = obj.trial_rows() if hasattr(obj, 'trial_rows') else 0
+        self.trial['valid'] = bool(getattr(obj, 'curr_file_valid', True))
+        self.trials.append(self.trial)
+        self.trial = None
+
+    def batch(self, use_cprofile=False):
+        return ProfiledBatch(self, use_cprofile)
+
+    ## Reports
+    def stage_rows(self):
+        rows = []
+        for stage, (calls, wall, cpu, exclusive_wall, exclusive_cpu) in self.totals.items():
+            rows.append({
+                'stage': stage,
+                'calls': calls,
+                'wall_s': wall,
+                'cpu_s': cpu,
+                'exclusive_wall_s': exclusive_wall,
+                'exclusive_cpu_s': exclusive_cpu,
+                'ms_per_call': 1000 * wall / calls,
+                'percent_of_batch': 100 * exclusive_wall / self.batch_wall if self.batch_wall > 0 else 0.0
+            })
+        return sorted(rows, key=lambda row: -row['exclusive_wall_s'])
+
+    def report(self, top=25):
+        num_rows = sum(trial['rows'] for trial in self.trials)
+        num_bytes = sum(trial['bytes'] for trial in self.trials)
+        log.info('Profile: {} trials, {} rows, {:.1f} MB read in {:.2f} s wall ({:.2f} s CPU)'.format(
+            len(self.trials), num_rows, num_bytes / 1e6, self.batch_wall, self.batch_cpu))
+        log.info('  {:<18} {:>7} {:>10} {:>10} {:>10} {:>10} {:>7}'.format('stage', 'calls', 'wall s', 'cpu s', 'excl. s', 'ms/call', '% batch'))
+        for row in self.stage_rows():
+            log.info('  {:<18} {:>7} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.2f} {:>6.1f}%'.format(
+                row['stage'], row['calls'], row['wall_s'], row['cpu_s'], row['exclusive_wall_s'], row['ms_per_call'], row['percent_of_batch']))
+
+        if (self.profile is not None):
+            stream = io.StringIO()
+            pstats.Stats(self.profile, stream=stream).sort_stats('cumulative').print_stats(top)
+            log.info('cProfile (top %d by cumulative time):\n%s', top, stream.getvalue())
+
+    def export(self, base_path):
+        # writes <base>.json (stage totals and per-trial times), <base>.csv (one row per trial)
+        # and <base>.prof (cProfile statistics, if collected)
+        folder = os.path.dirname(os.path.abspath(base_path))
+        os.makedirs(folder, exist_ok=True)
+
+        with open(base_path + '.json', 'w') as file:
+            json.dump({
+                'batch': {'wall_s': self.batch_wall, 'cpu_s': self.batch_cpu, 'trials': len(self.trials)},
+                'stages': self.stage_rows(),
+                'trials': self.trials
+            }, file, indent=1)
+
+        stages = [row['stage'] for row in self.stage_rows()]
+        with open(base_path + '.csv', 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['path', 'valid', 'rows', 'bytes'] + [stage + '_s' for stage in stages])
+            for trial in self.trials:
+                writer.writerow([trial['path'], trial.get('valid', True), trial['rows'], trial['bytes']] +
+                                [trial['stages'].get(stage, 0.0) for stage in stages])
+
+        if (self.profile is not None):
+            self.profile.dump_stats(base_path + '.prof')
+        log.info('Saved timing report as files: %s.json, %s.csv', base_path, base_path)
+
+
+class ProfiledBatch:
+    # context manager timing a whole batch (optionally under cProfile)
+    def __init__(self, profiler, use_cprofile):
+        self.profiler = profiler
+        self.use_cprofile = use_cprofile
+
+    def __enter__(self):
+        if (self.use_cprofile):
+            self.profiler.profile = cProfile.Profile()
+            self.profiler.profile.enable()
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        return self.profiler
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.batch_wall += time.perf_counter() - self.wall_start
+        self.profiler.batch_cpu += time.process_time() - self.cpu_start
+        if (self.profiler.profile is not None):
+            self.profiler.profile.disable()
+        return False
+
+
+def add_profile_arguments(parser):
+    parser.add_argument(
+        '--profile', action='store', nargs='?', const='profile', default=None, metavar='BASE',
+        help='Times every pipeline stage and writes BASE.json and BASE.csv (defaults to profile.*)'
+    )
+    parser.add_argument(
+        '--cprofile', action='store_true', help='With --profile, also runs the batch under cProfile (BASE.prof)'
+    )
+
+
+def profile_run(obj, run, base_path, use_cprofile=False):
+    # runs run() with the stages of obj instrumented and writes the timing report, even if the run exits early
+    profiler = PipelineProfiler()
+    profiler.instrument(obj)
+    try:
+        with profiler.batch(use_cprofile):
+            run()
+    finally:
+        profiler.report()
+        profiler.export(base_path)
+    return profiler
@@ -0,0 +1,109 @@
+import os
+import json
+import hashlib
+from event_log import log
+
+
+"""
+    Class: InvalidRegistry
+    Description:
+        Persistent record of the trials found invalid by the analysis, so later
+        runs skip them without reading the file again. Each data directory has
+        its own registry, stored as .traveler_cache/invalid_trials.json inside
+        it. An entry holds the stage and reason the trial was rejected with,
+        and is keyed by
+
+            - the file name, size and modification time (the fingerprint)
+            - a hash of the analysis parameters (and REGISTRY_VERSION)
+
+        so an entry is ignored once the file or the parameters change. Only
+        rejections caused by the data are recorded (e.g. a missing video file
+        is not). With recheck=True, known invalid trials are analyzed again and
+        their entries updated; trials that turn out valid are removed.
+"""
+
+REGISTRY_VERSION = 1
+REGISTRY_FOLDER = '.traveler_cache'
+REGISTRY_NAME = 'invalid_trials.json'
+# stages whose rejections only depend on the data file and the analysis parameters
+REGISTERED_STAGES = ['parse_filename', 'prevalidate', 'travelerRead', 'process_data', 'minmax_finder', 'plot_force']
+
+
+def params_hash(params):
+    text = json.dumps([REGISTRY_VERSION, params], sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+class InvalidRegistry:
+    def __init__(self, params, recheck=False):
+        self.config_hash = params_hash(params)
+        self.recheck = recheck
+        self.folders = {} # registry file -> entries
+        self.changed = set()
+
+    def registry_file(self, path):
+        return os.path.join(os.path.dirname(os.path.abspath(path)), REGISTRY_FOLDER, REGISTRY_NAME)
+
+    def entries(self, path):
+        registry_file = self.registry_file(path)
+        if (registry_file not in self.folders):
+            entries = {}
+            if os.path.exists(registry_file):
+                try:
+                    with open(registry_file, 'r') as file:
+                        entries = json.load(file)
+                except (OSError, ValueError):
+                    log.warning('WARNING: Could not read invalid trial registry %s... re-checking all trials...', registry_file)
+            self.folders[registry_file] = entries
+        return registry_file, self.folders[registry_file]
+
+    def key(self, path):
+        return os.path.basename(path) + '|' + self.config_hash
+
+    def fingerprint(self, path):
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def lookup(self, path):
+        # returns the entry {'stage', 'reason', ...} of a known invalid trial, or None
+        if (self.recheck):
+            return None
+        entry = self.entries(path)[1].get(self.key(path))
+        if (entry is None):
+            return None
+        try:
+            if (entry['fingerprint'] != self.fingerprint(path)):
+                return None
+        except OSError:
+            return None
+        return entry
+
+    def update(self, path, valid, stage, reason):
+        # records the outcome of analyzing a trial
+        registry_file, entries = self.entries(path)
+        key = self.key(path)
+        if (valid or stage not in REGISTERED_STAGES):
+            if (key in entries):
+                del entries[key]
+                self.changed.add(registry_file)
+            return
+
+        try:
+            entry = {'fingerprint': self.fingerprint(path), 'stage': stage, 'reason': reason}
+        except OSError:
+            return
+        if (entries.get(key) != entry):
+            entries[key] = entry
+            self.changed.add(registry_file)
+
+    def save(self):
+        for registry_file in self.changed:
+            try:
+                os.makedirs(os.path.dirname(registry_file), exist_ok=True)
+                tmp_path = registry_file + '.tmp'
+                with open(tmp_path, 'w') as file:
+                    json.dump(self.folders[registry_file], file, indent=1, sort_keys=True)
+                os.replace(tmp_path, registry_file)
+            except OSError:
+                log.warning('WARNING: Could not write invalid trial registry %s', registry_file)
+        self.changed = set()
@@ -30,7 +30,7 @@ class MudPlotter(TravelerAnalysisBase):
             self.path_index += 1
 
     def process_file(self):
-        print('\n\nProcessing file ', self.path_index, ' of ', len(self.paths), '...')
+        log.info('Processing file %d of %d...', self.path_index, len(self.paths))
         self.curr_file_valid = True
         # Read data from path
         self.travelerRead()
@@ -151,6 +151,7 @@ class MudAnalyzer(TravelerAnalysisBase):
         print("estimated clay ratio = ", clay_ratio)
 
 if __name__ == "__main__":
+    configure()
     test_ = MudAnalyzer()
     test_.run()
     # test_.test_computation(3, 0.2)
\ No newline at end of file
@@ -0,0 +1,142 @@
+import os
+import json
+import cv2
+import numpy as np
+from event_log import log
+
+
+"""
+    Estimates the time offset (bias) between a trial video and its data file.
+
+    A motion-energy signal (mean absolute difference between consecutive
+    downscaled grayscale frames) is computed in one pass over the part of the
+    video that can overlap the data. It is cross-correlated with the speed of
+    the intruder over the whole data recording, which includes the approach
+    and retraction; the penetration itself is often close to constant speed
+    and would give a flat correlation on its own.
+
+    The bias follows the convention of video_sync.py: the data point shown
+    with a video frame at time t is the one at time t + bias.
+
+    Results are cached next to the video as <video>.offset.json, keyed by the
+    size and modification time of the video and data files and the search range.
+"""
+
+OFFSET_VERSION = 1
+OFFSET_SUFFIX = '.offset.json'
+ENERGY_WIDTH = 64 # width of the downscaled frames used for the motion energy
+MIN_SCORE = 0.3 # minimum correlation for an estimate to be used
+
+
+def motion_energy(cap, video_index, start_frame, end_frame, width=ENERGY_WIDTH):
+    # returns (frame times, motion energy) for the frames in [start_frame, end_frame)
+    start_frame = video_index.seek(cap, start_frame)
+    end_frame = min(end_frame, len(video_index))
+
+    energy = []
+    previous = None
+    for frame_number in range(start_frame, end_frame):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        height = max(1, int(round(frame.shape[0] * width / frame.shape[1])))
+        gray = cv2.cvtColor(cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY).astype(np.float32)
+        energy.append(0.0 if previous is None else float(np.mean(np.abs(gray - previous))))
+        previous = gray
+
+    times = np.array(video_index.timestamps[start_frame:start_frame + len(energy)], dtype=float)
+    if (len(energy) > 1):
+        # the difference of two frames is the motion halfway between them; the first frame has no predecessor
+        times[1:] = (times[1:] + times[:-1]) / 2
+        energy[0] = energy[1]
+    return times, np.array(energy)
+
+
+def data_speed(time, position, dt):
+    # intruder speed resampled on a uniform time grid with spacing dt
+    order = np.argsort(time, kind='stable')
+    time = np.asarray(time, dtype=float)[order]
+    position = np.asarray(position, dtype=float)[order]
+    grid = np.arange(time[0], time[-1], dt)
+    return grid, np.abs(np.gradient(np.interp(grid, time, position), dt))
+
+
+def smooth(values, window=3):
+    if (len(values) < window):
+        return values
+    return np.convolve(values, np.ones(window) / window, mode='same')
+
+
+def estimate_offset(data_time, data_position, energy_time, energy, bias_range=(-1.0, 2.0), step=None):
+    """
+    Returns (bias, score): the bias in bias_range that maximizes the Pearson
+    correlation between the data speed at t and the motion energy at t - bias,
+    and that correlation.
+    """
+    if (len(energy) < 3):
+        return None, 0.0
+    if (step is None):
+        step = float(np.median(np.diff(energy_time)))
+
+    grid, speed = data_speed(data_time, data_position, step)
+    speed = smooth(speed)
+    energy = smooth(energy)
+
+    # only compare times that are inside the video for every candidate bias
+    biases = np.arange(bias_range[0], bias_range[1] + step / 2, step)
+    mask = (grid - biases[-1] >= energy_time[0]) & (grid - biases[0] <= energy_time[-1])
+    if (np.count_nonzero(mask) < 3):
+        return None, 0.0
+    grid = grid[mask]
+    speed = speed[mask]
+
+    # motion energy at t - bias for every (bias, t) pair
+    shifted = np.interp(grid[None, :] - biases[:, None], energy_time, energy)
+
+    speed = speed - speed.mean()
+    shifted = shifted - shifted.mean(axis=1, keepdims=True)
+    denominator = np.sqrt(np.sum(shifted ** 2, axis=1) * np.sum(speed ** 2))
+    scores = np.divide(shifted @ speed, denominator, out=np.zeros(len(biases)), where=denominator > 0)
+
+    best = int(np.argmax(scores))
+    bias = biases[best]
+    if (0 < best < len(biases) - 1):
+        # refine the peak to a fraction of a frame with a parabola through the neighbouring scores
+        left, center, right = scores[best - 1:best + 2]
+        curvature = left - 2 * center + right
+        if (curvature < 0):
+            bias += step * 0.5 * (left - right) / curvature
+    return float(bias), float(scores[best])
+
+
+def offset_key(video_file, data_file, bias_range):
+    key = [OFFSET_VERSION, list(bias_range)]
+    for path in [video_file, data_file]:
+        stat = os.stat(path)
+        key.append([os.path.basename(path), stat.st_size, stat.st_mtime_ns])
+    return key
+
+
+def load_offset(video_file, data_file, bias_range, estimate_fn):
+    # returns the cached (bias, score) for the video, or runs estimate_fn() and caches the result
+    path = video_file + OFFSET_SUFFIX
+    key = offset_key(video_file, data_file, bias_range)
+
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as file:
+                cached = json.load(file)
+            if (cached.get('key') == key):
+                return cached['bias'], cached['score']
+        except (OSError, ValueError, KeyError):
+            log.warning('WARNING: Could not read offset cache %s... re-estimating...', path)
+
+    bias, score = estimate_fn()
+    try:
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump({'key': key, 'bias': bias, 'score': score}, file)
+        os.replace(tmp_path, path)
+    except OSError:
+        log.warning('WARNING: Could not write offset cache %s', path)
+    return bias, score
@@ -0,0 +1,148 @@
+import os
+import csv
+import time
+import argparse
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from force_analysis import extrema_candidates, select_extrema, trim_trailing_minima, stick_slip_metrics
+from trial_analysis import TrialAnalyzer
+from trial_result import AnalysisConfig
+from event_log import log, events, configure, add_logging_arguments
+
+
+"""
+    Sensitivity of the trial metrics to the peak detection parameters.
+
+        python peak_sweep.py <dir> --factors 0.1 0.2 0.3 --distances 5 10 20 -j 4
+
+    Each trial is analyzed once (read, trimmed, sorted and de-duplicated, see
+    trial_analysis.py); the local extrema and metrics are then evaluated on
+    its curves for every (prominence factor, peak distance) of the grid.
+    find_peaks() runs once per distance, and each prominence factor selects
+    from those candidates. The trials are spread over the worker processes.
+    Trial results are cached (see result_cache.py), so trials analyzed before
+    with the same configuration are not read again.
+
+    The output is a tidy table with one row per trial, grid point and metric:
+
+        filename, trial_ID, prominence_factor, peak_distance, metric, value
+
+    The metrics are named as in metrics.csv, plus the number of local maxima
+    and minima found. The row at (0.2, 10) matches metrics.csv.
+"""
+
+DEFAULT_FACTORS = [0.05, 0.1, 0.15, 0.2, 0.25, 0.3, 0.35, 0.4, 0.45, 0.5]
+DEFAULT_DISTANCES = [2, 4, 6, 8, 10, 12, 14, 16, 18, 20]
+SWEEP_METRICS = ['n_maxima', 'n_minima', 'avg_stiffness', 'avg_stick_slip', 'avg_yield', 'max_drop', 'max_drop_slope',
+                 'deformation', 'first_rupture_displacement_ratio', 'peak_force', 'max_depth', 'first_yield']
+HEADER = ['filename', 'trial_ID', 'prominence_factor', 'peak_distance', 'metric', 'value']
+
+
+def _mean(values):
+    return np.mean(values) if len(values) > 0 else np.nan
+
+
+def sweep_trial(result, factors, distances, trim_trailing_data=False):
+    # rows of the tidy table for one valid TrialResult
+    unique_pos = result.smoothed_pos
+    force = result.smoothed_force
+    filename = os.path.basename(result.path)
+
+    rows = []
+    for distance in distances:
+        candidates = extrema_candidates(force, distance)
+        for factor in factors:
+            pos_max, pos_min = select_extrema(candidates, force, np.abs(factor * result.average_force))
+            if (trim_trailing_data and pos_min[-1] > pos_max[-1]):
+                pos_min = trim_trailing_minima(unique_pos, pos_max, pos_min)
+
+            slopes, stick_slip, *values = stick_slip_metrics(unique_pos, force, pos_max, pos_min)
+            values = [len(pos_max), len(pos_min), _mean(slopes), _mean(stick_slip)] + values
+            for metric, value in zip(SWEEP_METRICS, values):
+                rows.append([filename, result.trial_ID, factor, distance, metric, value])
+    return rows
+
+
+## Parallel sweep (see run_sweep)
+sweep_analyzer = None
+sweep_grid = None
+
+def init_sweep_worker(config, factors, distances):
+    global sweep_analyzer, sweep_grid
+    sweep_analyzer = TrialAnalyzer(config, cache=True)
+    sweep_grid = (factors, distances)
+
+def sweep_path(path):
+    result = sweep_analyzer.analyze(path)
+    rows = []
+    if (result.valid):
+        rows = sweep_trial(result, *sweep_grid, sweep_analyzer.config.trim_trailing_data)
+    # the warning counts of the worker are merged into the summary of the main process
+    return rows, events.drain()
+
+
+def run_sweep(paths, output, config=None, factors=DEFAULT_FACTORS, distances=DEFAULT_DISTANCES, jobs=1, chunksize=4):
+    # writes the tidy table of the sweep over paths to output, returning the number of rows
+    # the trials are only analyzed up to the sorted, de-duplicated curves
+    params = config.params() if config is not None else {}
+    config = AnalysisConfig(metrics=False, **params)
+    count = 0
+    with open(output, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(HEADER)
+
+        if (jobs <= 1 or len(paths) <= 1):
+            init_sweep_worker(config, factors, distances)
+            for path in paths:
+                rows, _ = sweep_path(path)
+                writer.writerows(rows)
+                count += len(rows)
+            return count
+
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=context, initializer=init_sweep_worker,
+                                 initargs=(config, factors, distances)) as executor:
+            for rows, worker_events in executor.map(sweep_path, paths, chunksize=chunksize):
+                events.merge(worker_events)
+                writer.writerows(rows)
+                count += len(rows)
+    return count
+
+
+def init_argparse() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        usage="%(prog)s DIR [OPTIONS]",
+        description="Evaluates the trial metrics over a grid of peak detection parameters (prominence factor and peak distance)."
+    )
+    parser.add_argument('dir', help='Directory with the trial data files (searched recursively)')
+    parser.add_argument('--factors', action='store', type=float, nargs='+', default=DEFAULT_FACTORS, help='Prominence factors (fractions of the average force) to evaluate')
+    parser.add_argument('--distances', action='store', type=int, nargs='+', default=DEFAULT_DISTANCES, help='Minimum distances between local extrema (samples) to evaluate')
+    parser.add_argument('--trim-trailing', action='store_true', help='Trims the data after the last local maximum')
+    parser.add_argument('--show-leading', action='store_true', help='Keeps the 5 mm before crust contact')
+    parser.add_argument('-o', '--output', action='store', default=None, help='Output .csv file (defaults to peak_sweep.csv in the figures folder next to the data)')
+    parser.add_argument('-j', '--jobs', action='store', type=int, default=1, help='Number of worker processes')
+    add_logging_arguments(parser)
+    return parser
+
+
+if __name__ == "__main__":
+    args = init_argparse().parse_args()
+    configure(args.quiet, args.verbose, args.events)
+
+    config = AnalysisConfig(trim_trailing_data=args.trim_trailing, show_leading_data=args.show_leading)
+    analyzer = TrialAnalyzer(config)
+    paths = analyzer.traverse_csv_files(override=True, filepath=args.dir)
+
+    # the table is kept out of the data folders, where later runs would read it as a trial
+    output = args.output
+    if (output is None):
+        folder = analyzer.figure_folder(paths[0]) if len(paths) > 0 else os.path.dirname(os.path.normpath(args.dir))
+        os.makedirs(folder, exist_ok=True)
+        output = os.path.join(folder, 'peak_sweep.csv')
+
+    start = time.perf_counter()
+    count = run_sweep(paths, output, config, args.factors, args.distances, args.jobs)
+    log.info('Saved %d rows (%d files x %d grid points) to %s in %.1f s', count, len(paths),
+             len(args.factors) * len(args.distances), output, time.perf_counter() - start)
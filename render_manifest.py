@@ -0,0 +1,82 @@
+import os
+import json
+import hashlib
+from event_log import log
+
+
+"""
+    Class: RenderManifest
+    Description:
+        Records, for every figure written to a figures/ directory, the content
+        hash of the source .csv file(s) it was made from and the render settings
+        (x-axis limit, compound mode, axis choices, ...). A figure is stale if it
+        is missing, or if its sources or settings differ from the recorded ones,
+        so re-running a batch only regenerates the stale figures.
+
+        The manifest is stored as render_manifest.json in the figures directory.
+        Source hashes are memoized by (size, modification time) in the manifest
+        so unchanged files are not re-hashed on every run.
+"""
+
+MANIFEST_NAME = 'render_manifest.json'
+
+
+class RenderManifest:
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = os.path.join(folder, MANIFEST_NAME)
+        self.outputs = {}
+        self.hashes = {}
+        self.changed = False
+
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as file:
+                    contents = json.load(file)
+                self.outputs = contents.get('outputs', {})
+                self.hashes = contents.get('hashes', {})
+            except (OSError, ValueError):
+                log.warning('WARNING: Could not read render manifest %s... regenerating all figures...', self.path)
+
+    def file_hash(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        memo = self.hashes.get(path)
+        if (memo is not None and memo[0] == stat.st_size and memo[1] == stat.st_mtime_ns):
+            return memo[2]
+
+        sha = hashlib.sha1()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+
+        self.hashes[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        self.changed = True
+        return digest
+
+    def signature(self, sources, settings):
+        return {
+            'sources': {os.path.basename(source): self.file_hash(source) for source in sources},
+            'settings': json.loads(json.dumps(settings, default=str))
+        }
+
+    def is_fresh(self, output, sources, settings):
+        # output is a file name inside the figures directory
+        if not os.path.exists(os.path.join(self.folder, output)):
+            return False
+        return self.outputs.get(output) == self.signature(sources, settings)
+
+    def record(self, output, sources, settings):
+        self.outputs[output] = self.signature(sources, settings)
+        self.changed = True
+
+    def save(self):
+        if (not self.changed):
+            return
+        os.makedirs(self.folder, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump({'outputs': self.outputs, 'hashes': self.hashes}, file, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self.changed = False
@@ -0,0 +1,224 @@
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from summary_stats import load_metrics_table
+
+
+"""
+    Bootstrap confidence intervals and permutation tests for trial metrics.
+
+    Each chunk of resamples is drawn as a single (resamples x samples) index
+    matrix and evaluated with one vectorized reduction along axis 1. Chunks are
+    seeded from a numpy SeedSequence by chunk number, so the results for a given
+    seed are identical whether the chunks run serially or across a process pool.
+"""
+
+STATISTICS = {
+    'mean': np.mean,
+    'median': np.median,
+    'std': lambda x, axis: np.std(x, axis=axis, ddof=1),
+}
+
+
+def _clean(values):
+    values = np.asarray(values, dtype=float)
+    return values[np.isfinite(values)]
+
+
+def _check_sample(values, name):
+    # resampling fewer than two values gives a NaN estimate and a meaningless p-value
+    if (len(values) < 2):
+        raise ValueError('{} has {} finite value(s); at least 2 are needed'.format(name, len(values)))
+
+
+def _bootstrap_chunk(values, statistic, size, seed):
+    rng = np.random.default_rng(seed)
+    idx = rng.integers(0, len(values), size=(size, len(values)))
+    return STATISTICS[statistic](values[idx], axis=1)
+
+
+def _bootstrap_difference_chunk(a, b, statistic, size, seed):
+    rng = np.random.default_rng(seed)
+    idx_a = rng.integers(0, len(a), size=(size, len(a)))
+    idx_b = rng.integers(0, len(b), size=(size, len(b)))
+    stat = STATISTICS[statistic]
+    return stat(a[idx_a], axis=1) - stat(b[idx_b], axis=1)
+
+
+def _permutation_chunk(pooled, n_a, statistic, size, seed):
+    rng = np.random.default_rng(seed)
+    # each row of the index matrix is an independent permutation of the pooled samples
+    idx = np.argsort(rng.random((size, len(pooled))), axis=1)
+    shuffled = pooled[idx]
+    stat = STATISTICS[statistic]
+    return stat(shuffled[:, :n_a], axis=1) - stat(shuffled[:, n_a:], axis=1)
+
+
+def run_chunks(func, args, n_resamples, seed=None, chunk_size=10000, workers=1):
+    """
+    Evaluates func(*args, size, seed) over chunks of at most chunk_size resamples
+    and concatenates the results in chunk order.
+    """
+    num_chunks = int(np.ceil(n_resamples / chunk_size))
+    sizes = [chunk_size] * (num_chunks - 1) + [n_resamples - chunk_size * (num_chunks - 1)]
+    seeds = np.random.SeedSequence(seed).spawn(num_chunks)
+
+    if (workers > 1 and num_chunks > 1):
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(func, *args, size, s) for size, s in zip(sizes, seeds)]
+            results = [f.result() for f in futures]
+    else:
+        results = [func(*args, size, s) for size, s in zip(sizes, seeds)]
+
+    return np.concatenate(results)
+
+
+def bootstrap_ci(values, statistic='mean', n_resamples=10000, confidence=0.95, seed=None, chunk_size=10000, workers=1):
+    # percentile bootstrap confidence interval of a statistic of one sample
+    start = time.perf_counter()
+    values = _clean(values)
+    _check_sample(values, 'Sample')
+
+    dist = run_chunks(_bootstrap_chunk, (values, statistic), n_resamples, seed, chunk_size, workers)
+    alpha = (1.0 - confidence) / 2.0
+    ci_low, ci_high = np.quantile(dist, [alpha, 1.0 - alpha])
+
+    return {
+        'statistic': statistic,
+        'n': len(values),
+        'estimate': float(STATISTICS[statistic](values, axis=0)),
+        'ci_low': float(ci_low),
+        'ci_high': float(ci_high),
+        'confidence': confidence,
+        'n_resamples': n_resamples,
+        'runtime': time.perf_counter() - start
+    }
+
+
+def bootstrap_difference(a, b, statistic='mean', n_resamples=10000, confidence=0.95, seed=None, chunk_size=10000, workers=1):
+    # percentile bootstrap confidence interval of statistic(a) - statistic(b)
+    start = time.perf_counter()
+    a = _clean(a)
+    b = _clean(b)
+    _check_sample(a, 'Sample a')
+    _check_sample(b, 'Sample b')
+
+    dist = run_chunks(_bootstrap_difference_chunk, (a, b, statistic), n_resamples, seed, chunk_size, workers)
+    alpha = (1.0 - confidence) / 2.0
+    ci_low, ci_high = np.quantile(dist, [alpha, 1.0 - alpha])
+    stat = STATISTICS[statistic]
+
+    return {
+        'statistic': statistic,
+        'n_a': len(a),
+        'n_b': len(b),
+        'estimate': float(stat(a, axis=0) - stat(b, axis=0)),
+        'ci_low': float(ci_low),
+        'ci_high': float(ci_high),
+        'confidence': confidence,
+        'n_resamples': n_resamples,
+        'runtime': time.perf_counter() - start
+    }
+
+
+def permutation_test(a, b, statistic='mean', n_resamples=10000, alternative='two-sided', seed=None, chunk_size=10000, workers=1):
+    # Monte Carlo permutation test of the difference statistic(a) - statistic(b)
+    start = time.perf_counter()
+    a = _clean(a)
+    b = _clean(b)
+    _check_sample(a, 'Sample a')
+    _check_sample(b, 'Sample b')
+    pooled = np.concatenate([a, b])
+    stat = STATISTICS[statistic]
+    observed = stat(a, axis=0) - stat(b, axis=0)
+
+    dist = run_chunks(_permutation_chunk, (pooled, len(a), statistic), n_resamples, seed, chunk_size, workers)
+
+    if (alternative == 'greater'):
+        extreme = np.count_nonzero(dist >= observed)
+    elif (alternative == 'less'):
+        extreme = np.count_nonzero(dist <= observed)
+    else:
+        extreme = np.count_nonzero(np.abs(dist) >= np.abs(observed))
+
+    return {
+        'statistic': statistic,
+        'n_a': len(a),
+        'n_b': len(b),
+        'observed': float(observed),
+        # add one so the observed arrangement counts as one of the permutations
+        'p_value': (extreme + 1) / (n_resamples + 1),
+        'alternative': alternative,
+        'n_resamples': n_resamples,
+        'runtime': time.perf_counter() - start
+    }
+
+
+def group_values(table, metric, group_col, group):
+    # values of metric for the trials in group, matched with the type of the group column
+    # (groups given on the command line are strings, e.g. '2' for location 2)
+    column = table[group_col]
+    available = ', '.join(str(g) for g in sorted(column.dropna().unique()))
+    if (pd.api.types.is_numeric_dtype(column)):
+        try:
+            value = float(group)
+        except ValueError:
+            raise ValueError('Group {!r} is not a number, but {} is numeric (groups: {})'.format(group, group_col, available))
+        mask = (column == value).fillna(False).astype(bool)
+    else:
+        mask = column.astype(str) == str(group)
+
+    if (not mask.any()):
+        raise ValueError('No trials with {} = {} (groups: {})'.format(group_col, group, available))
+    return table.loc[mask, metric].values
+
+
+def compare_groups(table, metric, group_col, group_a, group_b, **kwargs):
+    # bootstrap CI of the difference and permutation test between two groups of a metrics table
+    a = group_values(table, metric, group_col, group_a)
+    b = group_values(table, metric, group_col, group_b)
+
+    ci_kwargs = dict(kwargs)
+    test_kwargs = dict(kwargs)
+    ci_kwargs.pop('alternative', None)
+    test_kwargs.pop('confidence', None)
+    return bootstrap_difference(a, b, **ci_kwargs), permutation_test(a, b, **test_kwargs)
+
+
+def init_argparse() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        usage="%(prog)s METRICS_CSV -m METRIC -g GROUP -a A -b B [OPTIONS]",
+        description="Bootstrap confidence interval and permutation test for the \
+                    difference of a metric between two groups of trials."
+    )
+    parser.add_argument('metrics', help='metrics.csv produced by flex_plotter_px.py')
+    parser.add_argument('-f', '--features', action='append', default=[], help='Feature .csv file to join on trial ID (repeatable)')
+    parser.add_argument('-m', '--metric', action='store', required=True, help='Metric column to compare')
+    parser.add_argument('-g', '--group', action='store', default='location', help='Column that defines the groups')
+    parser.add_argument('-a', action='store', required=True, help='First group')
+    parser.add_argument('-b', action='store', required=True, help='Second group')
+    parser.add_argument('-s', '--statistic', action='store', default='mean', choices=list(STATISTICS.keys()))
+    parser.add_argument('-n', '--resamples', action='store', type=int, default=10000)
+    parser.add_argument('--confidence', action='store', type=float, default=0.95)
+    parser.add_argument('--alternative', action='store', default='two-sided', choices=['two-sided', 'greater', 'less'])
+    parser.add_argument('--seed', action='store', type=int, default=None)
+    parser.add_argument('--chunk-size', action='store', type=int, default=10000, help='Resamples drawn per index matrix')
+    parser.add_argument('-j', '--jobs', action='store', type=int, default=1, help='Number of worker processes')
+    return parser
+
+
+if __name__ == "__main__":
+    args = init_argparse().parse_args()
+    table = load_metrics_table(args.metrics, args.features)
+
+    ci, test = compare_groups(table, args.metric, args.group, args.a, args.b,
+                              statistic=args.statistic, n_resamples=args.resamples, confidence=args.confidence,
+                              alternative=args.alternative, seed=args.seed, chunk_size=args.chunk_size, workers=args.jobs)
+
+    print('Comparing ', args.metric, ' (', args.statistic, ') for ', args.group, ' ', args.a, ' (n=', ci['n_a'], ') vs ', args.b, ' (n=', ci['n_b'], ')', sep='')
+    print('Difference: {:.6g}'.format(ci['estimate']))
+    print('{:.0f}% bootstrap CI: [{:.6g}, {:.6g}]  ({} resamples, {:.2f} s)'.format(100 * args.confidence, ci['ci_low'], ci['ci_high'], ci['n_resamples'], ci['runtime']))
+    print('Permutation test ({}): p = {:.6g}  ({} resamples, {:.2f} s)'.format(test['alternative'], test['p_value'], test['n_resamples'], test['runtime']))
@@ -0,0 +1,64 @@
+import os
+import pickle
+from event_log import log
+
+
+"""
+    Class: ResultCache
+    Description:
+        Per-trial cache of TrialResults (see trial_result.py), keyed by the
+        hash of the analysis configuration (AnalysisConfig.config_hash()).
+        Each result is pickled to
+
+            <data directory>/.traveler_cache/results_<config hash>/<file name>.pkl
+
+        together with the size and modification time of the data file, and is
+        reused as long as the file is unchanged. Results of every configuration
+        used so far are kept, so re-running with a previously used
+        configuration skips the analysis, and adding files to a dataset only
+        analyzes the new files.
+"""
+
+RESULT_CACHE_FOLDER = '.traveler_cache'
+
+
+class ResultCache:
+    def __init__(self, config):
+        self.config_hash = config.config_hash()
+
+    def cache_file(self, path):
+        folder = os.path.join(os.path.dirname(os.path.abspath(path)), RESULT_CACHE_FOLDER, 'results_' + self.config_hash)
+        return os.path.join(folder, os.path.basename(path) + '.pkl')
+
+    def fingerprint(self, path):
+        stat = os.stat(path)
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def get(self, path, metrics=False):
+        # returns the cached TrialResult of path, or None
+        cache_file = self.cache_file(path)
+        if (not os.path.exists(cache_file)):
+            return None
+        try:
+            with open(cache_file, 'rb') as file:
+                fingerprint, result = pickle.load(file)
+            if (fingerprint != self.fingerprint(path)):
+                return None
+        except Exception:
+            return None
+
+        # results cached without metrics can not be used when they are needed
+        if (metrics and result.valid and result.metrics is None):
+            return None
+        return result
+
+    def put(self, path, result):
+        cache_file = self.cache_file(path)
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            tmp_path = cache_file + '.tmp'
+            with open(tmp_path, 'wb') as file:
+                pickle.dump((self.fingerprint(path), result), file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_file)
+        except OSError:
+            log.warning('WARNING: Could not write cached result %s', cache_file)
@@ -0,0 +1,153 @@
+import os
+import pandas as pd
+import numpy as np
+
+from scipy.stats import norm
+
+
+"""
+    Grouped summary statistics for the per-trial metrics table.
+
+    The metrics table is the metrics.csv written by flex_plotter_px.py (one row
+    per trial), optionally joined with feature files such as EPS measurements.
+    grouped_summary() computes count, mean, std, standard error and confidence
+    intervals for every metric column and every requested grouping, using one
+    groupby aggregation per grouping rather than one computation per variable.
+
+    The result is a tidy table with the columns:
+        grouping, group, metric, count, mean, std, sem, ci, ci_low, ci_high
+"""
+
+DEFAULT_GROUPINGS = ['location', 'transect', 'protocol']
+
+
+def _integer_field(parts, index):
+    # the digits of one field as nullable integers, so groups are labelled '2' rather than '2.0'
+    digits = parts.str.get(index).str.extract(r'(\d+)', expand=False)
+    return pd.to_numeric(digits, errors='coerce').astype('Int64')
+
+
+def add_trial_fields(table):
+    # derive location, transect, protocol and flag columns from the filename, following
+    # the <identifier>_<location>_<transect>_<protocol>_<flag>_<timestamp>.csv convention.
+    # Fields missing from shorter file names are left empty.
+    parts = table['filename'].astype(str).str.split('_')
+    table['location'] = _integer_field(parts, 1)
+    table['transect'] = _integer_field(parts, 2)
+    table['protocol'] = parts.str.get(3).str.replace(r'\d+', '', regex=True)
+    table['flag'] = _integer_field(parts, 4)
+    return table
+
+
+def read_feature_file(filename):
+    # reads a feature file using the same conventions as FlexPlotter.process_features():
+    # an 'id' column (or location, transect and flag columns) and a 'data' or 'tags' column
+    data = pd.read_csv(filename)
+    data.columns = [col.lower() for col in data.columns]
+
+    if ('id' not in data.columns):
+        if ('location' in data.columns and 'transect' in data.columns and 'flag' in data.columns):
+            data['id'] = 'L' + data['location'].astype(str) + 'T' + data['transect'].astype(str) + 'F' + data['flag'].astype(str)
+        else:
+            raise ValueError('Malformatted Feature CSV File: ' + filename)
+
+    col = 'tags' if 'tags' in data.columns else 'data'
+    name = os.path.splitext(os.path.basename(filename))[0]
+
+    # multiple entries per id are collapsed to one row, so the join does not duplicate
+    # the metric rows of a trial: numeric values are averaged, tags are joined with ';'
+    grouped = data[['id', col]].dropna().groupby('id', sort=False)[col]
+    if (pd.api.types.is_numeric_dtype(data[col])):
+        values = grouped.mean()
+    else:
+        values = grouped.agg(lambda tags: ';'.join(pd.unique(tags.astype(str))))
+    return values.rename(name).rename_axis('trial_ID').reset_index()
+
+
+def load_metrics_table(metrics_file, feature_files=()):
+    # the config hash is an identifier, even if it happens to be all digits
+    table = pd.read_csv(metrics_file, dtype={'config_hash': str})
+    table = add_trial_fields(table)
+
+    for feature_file in feature_files:
+        features = read_feature_file(feature_file)
+        table = table.merge(features, on='trial_ID', how='left', validate='many_to_one')
+
+    return table
+
+
+def numeric_columns(table, exclude=()):
+    exclude = set(exclude) | {'location', 'transect', 'flag'}
+    return [col for col in table.columns if col not in exclude and pd.api.types.is_numeric_dtype(table[col])]
+
+
+def grouped_summary(table, groupings=DEFAULT_GROUPINGS, metrics=None, confidence=0.95, ddof=1):
+    """
+    Computes grouped count, mean, std, sem and a normal-approximation confidence
+    interval for every metric. Each grouping is either a column name or a list
+    of column names (e.g. ['location', 'transect']).
+    """
+    if (metrics is None):
+        metrics = numeric_columns(table)
+    z = norm.ppf(0.5 + confidence / 2.0)
+
+    summaries = []
+    for grouping in groupings:
+        keys = [grouping] if isinstance(grouping, str) else list(grouping)
+
+        grouped = table.groupby(keys, dropna=True)[metrics]
+        count = grouped.count()
+        mean = grouped.mean()
+        std = grouped.std(ddof=ddof)
+
+        # wide (group x metric) frames -> long format with one row per group and metric.
+        # The three frames share the same index and columns so the rows line up.
+        stats = count.reset_index().melt(id_vars=keys, var_name='metric', value_name='count')
+        stats['mean'] = mean.reset_index().melt(id_vars=keys, value_name='mean')['mean'].values
+        stats['std'] = std.reset_index().melt(id_vars=keys, value_name='std')['std'].values
+
+        if (len(keys) == 1):
+            stats['group'] = stats[keys[0]].astype(str)
+        else:
+            stats['group'] = stats[keys].astype(str).agg('/'.join, axis=1)
+        stats['grouping'] = '/'.join(keys)
+        summaries.append(stats.drop(columns=keys))
+
+    summary = pd.concat(summaries, ignore_index=True)
+    summary['sem'] = summary['std'] / np.sqrt(summary['count'])
+    summary['ci'] = z * summary['sem']
+    summary['ci_low'] = summary['mean'] - summary['ci']
+    summary['ci_high'] = summary['mean'] + summary['ci']
+
+    return summary[['grouping', 'group', 'metric', 'count', 'mean', 'std', 'sem', 'ci', 'ci_low', 'ci_high']]
+
+
+def summary_for(summary, grouping, metric):
+    # selects the rows of a single grouping and metric, indexed by group
+    rows = summary[(summary['grouping'] == grouping) & (summary['metric'] == metric)]
+    return rows.set_index('group')
+
+
+def plot_grouped(ax, summary, grouping, x_metric, y_metric, error='ci', x_scale=1.0, y_scale=1.0, labels=None):
+    """
+    Scatter plot of the group means of y_metric vs x_metric with error bars.
+    error is one of 'ci', 'sem' or 'std'.
+    """
+    x_rows = summary_for(summary, grouping, x_metric)
+    y_rows = summary_for(summary, grouping, y_metric)
+    groups = [g for g in x_rows.index if g in y_rows.index]
+
+    for group in groups:
+        x = x_rows.loc[group, 'mean'] * x_scale
+        y = y_rows.loc[group, 'mean'] * y_scale
+        x_err = x_rows.loc[group, error] * x_scale
+        y_err = y_rows.loc[group, error] * y_scale
+
+        label = group
+        if (labels is not None and group in labels):
+            label = labels[group]
+
+        ax.scatter(x, y, marker='o', s=100, label=label)
+        ax.errorbar(x, y, yerr=y_err, xerr=x_err)
+
+    return groups
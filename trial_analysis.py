@@ -0,0 +1,88 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from force_analysis import TravelerAnalysisBase
+from event_log import events
+from trial_result import AnalysisConfig, TrialResult, TrialRecord, METRIC_NAMES
+
+
+"""
+    Headless trial analysis.
+
+        result = analyze_trial('data/MH23_L2_T1_P_F0_Fri_Aug_11_11_47_00_2023.csv')
+        if (result.valid):
+            print(result.trial_ID, result.average_force, result.metrics['peak_force'])
+
+        for result in analyze_many(paths, AnalysisConfig(metrics=False), jobs=4):
+            ...
+
+        config = AnalysisConfig(prominence_factor=0.3, peak_distance=5)
+        results = list(analyze_many(paths, config, cache=True))
+
+    No file dialogs are opened and no figures are created; each call returns
+    an immutable TrialResult (see trial_result.py). analyze_many() yields the
+    results in the order of the paths, so only the results the caller keeps
+    stay in memory. A trial that raises an error is returned as an invalid
+    result with stage 'error'. With cache=True, results are stored by the
+    hash of the config (see result_cache.py), and trials analyzed before with
+    the same config are not analyzed again.
+"""
+
+
+"""
+    Class: TrialAnalyzer
+    Description:
+        TravelerAnalysisBase without the GUI: the file is set per call instead
+        of selected in a dialog, and there is no figure to plot on.
+"""
+
+class TrialAnalyzer(TravelerAnalysisBase):
+    def __init__(self, config=None, cache=False):
+        super().__init__(_bypass_selection=True, _paths=[])
+        self.config = config if config is not None else AnalysisConfig()
+        if (cache):
+            self.open_result_cache()
+
+    def analyze(self, path):
+        # an error in one trial returns an invalid result (stage 'error') instead of stopping the batch
+        self.path = path
+        self.record = TrialRecord()
+        self.begin_trial()
+        try:
+            result = self.analyze_cached(self.config.metrics)
+        except Exception as error:
+            self.trial_failed(error)
+            return TrialResult.from_analysis(self)
+        self.log_trial()
+        return result
+
+
+def analyze_trial(path, config=None, cache=False):
+    return TrialAnalyzer(config, cache).analyze(path)
+
+
+## Parallel analysis (see analyze_many)
+worker_analyzer = None
+
+def init_analysis_worker(config, cache):
+    global worker_analyzer
+    worker_analyzer = TrialAnalyzer(config, cache)
+
+def analyze_path(path):
+    # the warning counts of the worker are merged into the summary of the main process
+    return worker_analyzer.analyze(path), events.drain()
+
+
+def analyze_many(paths, config=None, jobs=1, chunksize=8, cache=False):
+    # yields the TrialResult of every path, in order, analyzing them on jobs worker processes
+    if (jobs <= 1 or len(paths) <= 1):
+        analyzer = TrialAnalyzer(config, cache)
+        for path in paths:
+            yield analyzer.analyze(path)
+        return
+
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context,
+                             initializer=init_analysis_worker, initargs=(config, cache)) as executor:
+        for result, worker_events in executor.map(analyze_path, paths, chunksize=chunksize):
+            events.merge(worker_events)
+            yield result
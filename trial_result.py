@@ -0,0 +1,305 @@
+import json
+import hashlib
+import numpy as np
+
+
+"""
+    Class: AnalysisConfig
+    Description:
+        Parameters of the trial analysis (see trial_analysis.py).
+
+            - trim_trailing_data: trims the data after the last local maximum
+            - show_leading_data: keeps the 5 mm before crust contact
+            - prominence_factor: peak prominence threshold for the local
+              extrema, as a fraction of the average force
+            - peak_distance: minimum number of samples between local extrema
+            - min_trimmed_rows: trials with fewer rows in the trimmed window
+              are invalid
+            - min_unique_points: trials with fewer distinct positions are
+              invalid
+            - metrics: also computes the trial metrics (stiffness, yield, ...)
+
+        config_hash() identifies the parameters that change the analysis
+        output; it keys the result cache and is written with the
+        outputs (e.g. the config_hash column of metrics.csv).
+"""
+
+CONFIG_VERSION = 1
+ANALYSIS_PARAMS = ('trim_trailing_data', 'show_leading_data', 'prominence_factor', 'peak_distance',
+                   'min_trimmed_rows', 'min_unique_points')
+
+
+class AnalysisConfig:
+    __slots__ = ANALYSIS_PARAMS + ('metrics',)
+
+    def __init__(self, trim_trailing_data=False, show_leading_data=False, prominence_factor=0.2, peak_distance=10,
+                 min_trimmed_rows=24, min_unique_points=12, metrics=True):
+        self.trim_trailing_data = trim_trailing_data
+        self.show_leading_data = show_leading_data
+        self.prominence_factor = prominence_factor
+        self.peak_distance = peak_distance
+        self.min_trimmed_rows = min_trimmed_rows
+        self.min_unique_points = min_unique_points
+        self.metrics = metrics
+
+    def __repr__(self):
+        return 'AnalysisConfig({})'.format(', '.join(name + '=' + repr(getattr(self, name)) for name in self.__slots__))
+
+    def params(self):
+        # parameters that change the analysis output
+        return {name: getattr(self, name) for name in ANALYSIS_PARAMS}
+
+    def config_hash(self):
+        text = json.dumps([CONFIG_VERSION, self.params()], sort_keys=True)
+        return hashlib.sha1(text.encode()).hexdigest()[:12]
+
+    def update(self, **params):
+        for name, value in params.items():
+            if (value is not None):
+                setattr(self, name, value)
+        return self
+
+
+def add_analysis_arguments(parser):
+    defaults = AnalysisConfig()
+    parser.add_argument(
+        '--prominence-factor', action='store', type=float, default=defaults.prominence_factor, help='Peak prominence threshold as a fraction of the average force (defaults to {})'.format(defaults.prominence_factor)
+    )
+    parser.add_argument(
+        '--peak-distance', action='store', type=int, default=defaults.peak_distance, help='Minimum samples between local extrema (defaults to {})'.format(defaults.peak_distance)
+    )
+    parser.add_argument(
+        '--min-trimmed-rows', action='store', type=int, default=defaults.min_trimmed_rows, help='Trials with fewer rows after trimming are invalid (defaults to {})'.format(defaults.min_trimmed_rows)
+    )
+    parser.add_argument(
+        '--min-unique-points', action='store', type=int, default=defaults.min_unique_points, help='Trials with fewer distinct positions are invalid (defaults to {})'.format(defaults.min_unique_points)
+    )
+
+
+def analysis_arguments(args):
+    # the analysis parameters given on the command line, for AnalysisConfig.update()
+    return {
+        'prominence_factor': args.prominence_factor,
+        'peak_distance': args.peak_distance,
+        'min_trimmed_rows': args.min_trimmed_rows,
+        'min_unique_points': args.min_unique_points
+    }
+
+
+"""
+    Class: TrialResult
+    Description:
+        Immutable result of analyzing one trial: the trial metadata, the
+        trimmed and smoothed curves, the local extrema and (optionally) the
+        trial metrics. It holds no reference to the analysis object, figures
+        or GUI state, so results can be kept, pickled and sent between
+        processes.
+
+        Curves are numpy arrays (the trimmed and smoothed curves are empty for
+        invalid trials). metrics is a dict with the keys in METRIC_NAMES, or
+        None if the metrics were not computed.
+"""
+
+METRIC_NAMES = ['stiffness', 'stick_slip', 'average_yield', 'max_drop', 'max_drop_slope', 'max_drop_deformation',
+                'first_rupture_ratio', 'peak_force', 'total_depth', 'first_yield', 'cm_slope', 'mm_slope']
+
+EMPTY = np.empty(0)
+EMPTY.flags.writeable = False
+
+
+class TrialResult:
+    __slots__ = (
+        # trial status and number of data rows read
+        'path', 'valid', 'stage', 'reason', 'rows',
+        # metadata from the file name and header
+        'trial_ID', 'version', 'flag_number', 'location', 'transect', 'suptitle', 'notes', 'mode',
+        'ground_height', 'extrusion_angle',
+        # trimming window
+        'start_index', 'end_index', 'contact_time',
+        # trimmed curves
+        'time', 'position', 'force', 'velocity',
+        # sorted, de-duplicated curves and their local extrema
+        'smoothed_pos', 'smoothed_force', 'smoothed_time', 'max_indices', 'min_indices', 'average_force',
+        'metrics'
+    )
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            object.__setattr__(self, name, fields.get(name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('TrialResult is immutable')
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name in self.__slots__:
+            object.__setattr__(self, name, state.get(name))
+
+    def __repr__(self):
+        status = 'valid' if self.valid else 'invalid: ' + str(self.reason)
+        return 'TrialResult({}, {})'.format(self.trial_ID, status)
+
+    @classmethod
+    def from_analysis(cls, analysis, metrics=None):
+        # packs the record of a TravelerAnalysisBase after process_data() into a result
+        record = analysis.record
+        valid = bool(analysis.curr_file_valid)
+
+        def curve(values):
+            if (values is None or len(values) == 0):
+                return EMPTY
+            return np.asarray(values)
+
+        return cls(
+            path=analysis.path,
+            valid=valid,
+            stage=getattr(analysis, 'invalid_stage', None),
+            reason=getattr(analysis, 'invalid_reason', None),
+            rows=len(record.time),
+            trial_ID=record.trial_ID,
+            version=record.version,
+            flag_number=record.flag_number,
+            location=record.location,
+            transect=record.transect,
+            suptitle=record.suptitle,
+            notes=record.notes,
+            mode=record.mode,
+            ground_height=record.groundHeight,
+            extrusion_angle=record.extrusionAngle,
+            start_index=record.start_index,
+            end_index=record.end_index,
+            contact_time=record.contact_time,
+            time=curve(record.trimmed_time),
+            position=curve(record.trimmed_pos),
+            force=curve(record.trimmed_force),
+            velocity=curve(record.velocity),
+            smoothed_pos=curve(record.smoothed_pos),
+            smoothed_force=curve(record.smoothed_force),
+            smoothed_time=curve(record.smoothed_time),
+            max_indices=curve(record.max_indices),
+            min_indices=curve(record.min_indices),
+            average_force=record.average_force,
+            metrics=metrics if valid else None
+        )
+
+    def to_record(self):
+        # the TrialRecord the result was packed from, without the raw data columns
+        return TrialRecord(
+            trial_ID=self.trial_ID,
+            version=self.version,
+            flag_number=self.flag_number,
+            location=self.location,
+            transect=self.transect,
+            suptitle=self.suptitle,
+            notes=self.notes,
+            mode=self.mode,
+            groundHeight=self.ground_height,
+            extrusionAngle=self.extrusion_angle,
+            start_index=self.start_index,
+            end_index=self.end_index,
+            contact_time=self.contact_time,
+            trimmed_time=self.time,
+            trimmed_pos=self.position,
+            trimmed_force=self.force,
+            velocity=self.velocity,
+            smoothed_pos=self.smoothed_pos,
+            smoothed_force=self.smoothed_force,
+            smoothed_time=self.smoothed_time,
+            max_indices=self.max_indices,
+            min_indices=self.min_indices,
+            average_force=self.average_force
+        )
+
+
+"""
+    Class: TrialRecord
+    Description:
+        Working record of the trial being analyzed (TravelerAnalysisBase.record).
+        Each field is a slot; the curves are numpy arrays, and the trimmed
+        curves are slices (views) of the raw arrays where possible. Fields that
+        are not computed yet are empty arrays, so an analysis stage can not add
+        fields ad hoc.
+
+        Arrays are stored as read-only views, so the stages (and the
+        TrialResult, caches and worker processes that share them) can not
+        change them, while the arrays passed in stay writeable for their
+        owner. Stages that need other units scale a copy at render time,
+        e.g. ax.plot(100 * record.trimmed_pos, ...).
+
+        The record can also be used like the data_dict it replaces:
+        record['trimmed_pos'], record.get('mode') and record['velocity'] = ...
+"""
+
+RECORD_DEFAULTS = {
+    'start_index': 0,
+    'end_index': 0,
+    'average_force': 0.0,
+    'stiffness': 0.0,
+}
+
+
+class TrialRecord:
+    __slots__ = (
+        # metadata from the file name and header
+        'trial_ID', 'version', 'flag_number', 'location', 'transect', 'suptitle', 'notes', 'mode',
+        'groundHeight', 'extrusionAngle',
+        # raw data
+        'time', 'state', 'position_x', 'position_y', 'extension', 'force_x', 'force_y', 'intrusion_force',
+        # trimming window
+        'start_index', 'end_index', 'contact_time',
+        'trimmed_pos', 'trimmed_force', 'trimmed_time', 'velocity',
+        # sorted, de-duplicated curves and their local extrema
+        'smoothed_pos', 'smoothed_force', 'smoothed_time', 'max_indices', 'min_indices',
+        'average_force', 'stiffness'
+    )
+    METADATA = ('trial_ID', 'version', 'flag_number', 'location', 'transect', 'suptitle', 'notes', 'mode',
+                'groundHeight', 'extrusionAngle', 'contact_time')
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            if (name in fields):
+                value = fields[name]
+            elif (name in RECORD_DEFAULTS):
+                value = RECORD_DEFAULTS[name]
+            elif (name in self.METADATA):
+                value = None
+            else:
+                value = EMPTY
+            setattr(self, name, value)
+
+    def __setattr__(self, name, value):
+        # a read-only view, so the array the caller passed in stays writeable
+        if (isinstance(value, np.ndarray) and value.flags.writeable):
+            value = value.view()
+            value.flags.writeable = False
+        object.__setattr__(self, name, value)
+
+    def __getitem__(self, key):
+        if (key not in self.__slots__):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if (key not in self.__slots__):
+            raise KeyError('TrialRecord has no field ' + repr(key))
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def get(self, key, default=None):
+        if (key not in self.__slots__):
+            return default
+        return getattr(self, key)
+
+    def nbytes(self):
+        # memory held by the arrays of the record (views count towards the array they view)
+        arrays = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if (isinstance(value, np.ndarray)):
+                base = value if value.base is None else value.base
+                arrays[id(base)] = base.nbytes if isinstance(base, np.ndarray) else value.nbytes
+        return sum(arrays.values())
@@ -0,0 +1,106 @@
+import os
+import shutil
+import tempfile
+import subprocess
+import numpy as np
+from event_log import log, events
+
+
+"""
+    Cuts the segment of a trial video between two times without re-encoding it.
+
+        - stream copy: the clip starts on the keyframe at or before the start
+          time, so it may include up to one GOP of lead-in, and nothing is
+          re-encoded
+        - exact: only the frames between the start time and the next keyframe
+          are re-encoded; the rest of the clip is stream copied from that
+          keyframe and the two parts are joined with ffmpeg's concat demuxer.
+          Exact clips contain the video stream only.
+
+    Exact cuts need the keyframe times of the video (see frame_index.py). When
+    they are not known, a stream copy is made instead.
+"""
+
+# encoder used to re-encode the first GOP of an exact clip, by OpenCV fourcc
+ENCODERS = {
+    'avc1': 'libx264',
+    'h264': 'libx264',
+    'hev1': 'libx265',
+    'hvc1': 'libx265',
+    'hevc': 'libx265',
+}
+
+
+def run_ffmpeg(arguments):
+    command = ['ffmpeg', '-y', '-loglevel', 'error'] + arguments
+    result = subprocess.run(command, capture_output=True)
+    if (result.returncode != 0):
+        log.error('ERROR: ffmpeg failed: %s', result.stderr.decode(errors='replace').strip())
+        return False
+    return True
+
+
+def stream_copy(video_file, out_file, start, end):
+    # input seeking with -c copy starts the clip on the keyframe at or before start
+    return run_ffmpeg(['-ss', '{:.6f}'.format(max(start, 0)), '-i', video_file,
+                       '-t', '{:.6f}'.format(end - start), '-map', '0', '-c', 'copy',
+                       '-avoid_negative_ts', 'make_zero', out_file])
+
+
+def reencode(video_file, out_file, start, end, encoder, threads=None):
+    arguments = ['-ss', '{:.6f}'.format(max(start, 0)), '-i', video_file,
+                 '-t', '{:.6f}'.format(end - start), '-map', '0:v:0', '-an',
+                 '-c:v', encoder, '-crf', '18', '-pix_fmt', 'yuv420p']
+    if (threads is not None):
+        arguments.extend(['-threads', str(threads)])
+    return run_ffmpeg(arguments + [out_file])
+
+
+def cut_clip(video_file, out_file, start, end, keyframe_times=None, exact=False, fourcc='avc1', fps=30.0, threads=None):
+    """
+    Writes the [start, end] segment (seconds) of video_file to out_file. Returns
+    the method used ('copy', 'exact' or 'reencode'), or None if ffmpeg failed.
+    """
+    start = max(start, 0.0)
+    if (end <= start):
+        events.warn('empty clip window', 'WARNING: Empty clip window [{}, {}]... skipping clip...'.format(start, end), video_file)
+        return None
+
+    if (not exact or keyframe_times is None or len(keyframe_times) == 0):
+        if (exact):
+            events.warn('keyframes unknown', 'WARNING: Keyframes are unknown (ffprobe is not installed)... using a stream copy...', video_file)
+        return 'copy' if stream_copy(video_file, out_file, start, end) else None
+
+    encoder = ENCODERS.get(fourcc.lower(), 'libx264')
+    half_frame = 0.5 / fps
+    keyframe_times = np.asarray(keyframe_times, dtype=float)
+    following = keyframe_times[keyframe_times >= start - half_frame]
+
+    if (len(following) > 0 and following[0] <= start + half_frame):
+        # the clip already starts on a keyframe
+        return 'copy' if stream_copy(video_file, out_file, following[0], end) else None
+    if (len(following) == 0 or following[0] >= end):
+        # no keyframe inside the clip, so the whole (short) clip is re-encoded
+        return 'reencode' if reencode(video_file, out_file, start, end, encoder, threads) else None
+
+    keyframe = following[0]
+    folder = tempfile.mkdtemp(prefix='clip_', dir=os.path.dirname(os.path.abspath(out_file)))
+    try:
+        head = os.path.join(folder, 'head.mp4')
+        tail = os.path.join(folder, 'tail.mp4')
+        if not reencode(video_file, head, start, keyframe, encoder, threads):
+            return None
+        # seeking slightly past the keyframe still lands on it, and avoids rounding back to the previous one
+        if not run_ffmpeg(['-ss', '{:.6f}'.format(keyframe + half_frame / 2), '-i', video_file,
+                           '-t', '{:.6f}'.format(end - keyframe), '-map', '0:v:0', '-an', '-c', 'copy',
+                           '-avoid_negative_ts', 'make_zero', tail]):
+            return None
+
+        list_file = os.path.join(folder, 'parts.txt')
+        with open(list_file, 'w') as file:
+            file.write("file 'head.mp4'\nfile 'tail.mp4'\n")
+        if not run_ffmpeg(['-f', 'concat', '-safe', '0', '-i', list_file, '-c', 'copy', out_file]):
+            return None
+        return 'exact'
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
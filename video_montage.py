@@ -0,0 +1,110 @@
+import math
+import queue
+import threading
+import cv2
+import numpy as np
+
+
+"""
+    Class: TrialStream
+    Description:
+        Decodes one trial video on its own thread for the montage renderer
+        and resamples it onto the montage timeline: for every output time it
+        queues the video frame shown at that time and the data index of the
+        tracking dot. Frames are decoded strictly forward and the queue is
+        bounded, so memory use does not depend on the length of the videos.
+
+        Times before the first or after the last frame of the video show the
+        first or last frame.
+"""
+
+class TrialStream:
+    def __init__(self, cap, video_index, frame_data_index, video_times, flip=False, queue_size=8):
+        self.cap = cap
+        self.video_index = video_index
+        self.frame_data_index = frame_data_index
+        self.flip = flip
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stop = threading.Event()
+
+        # frame shown at each output time
+        last_frame = max(len(video_index) - 1, 0)
+        self.targets = np.clip(np.searchsorted(video_index.timestamps, video_times, side='right') - 1, 0, last_frame)
+        self.thread = threading.Thread(target=self.decode, name='decode')
+
+    def start(self):
+        self.thread.start()
+
+    def put(self, item):
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def decode(self):
+        try:
+            current = self.video_index.seek(self.cap, int(self.targets[0])) - 1
+            frame = None
+            for target in self.targets:
+                # frames between two output times are grabbed but not retrieved
+                while (current < target - 1 and self.cap.grab()):
+                    current += 1
+                if (current < target or frame is None):
+                    ret, decoded = self.cap.read()
+                    if ret:
+                        current += 1
+                        frame = cv2.flip(decoded, 0) if self.flip else decoded
+                    elif (frame is None):
+                        break
+                data_index = int(self.frame_data_index[min(current, len(self.frame_data_index) - 1)])
+                if not self.put((frame, data_index)):
+                    return
+        finally:
+            # also ends the montage if decoding fails
+            self.put(None)
+
+    def get(self):
+        return self.queue.get()
+
+    def close(self):
+        self.stop.set()
+        self.thread.join()
+        self.cap.release()
+
+
+def grid_shape(num_tiles, columns=None):
+    # (rows, columns) of a grid that is as close to square as possible
+    if (columns is None):
+        columns = int(math.ceil(math.sqrt(num_tiles)))
+    rows = int(math.ceil(num_tiles / columns))
+    return rows, columns
+
+
+def render_montage(compositors, streams, writer, columns=None):
+    """
+    Composites the next frame of every stream into a grid of tiles and writes
+    it until the shortest stream ends. All compositors have the same size.
+    Returns the number of frames written.
+    """
+    rows, columns = grid_shape(len(streams), columns)
+    height, width = compositors[0].height, compositors[0].width
+    canvas = np.full((rows * height, columns * width, 3), 255, dtype=np.uint8)
+
+    for stream in streams:
+        stream.start()
+    try:
+        while True:
+            items = [stream.get() for stream in streams]
+            if any(item is None for item in items):
+                break
+            for i, (compositor, (frame, data_index)) in enumerate(zip(compositors, items)):
+                row, column = divmod(i, columns)
+                canvas[row * height:(row + 1) * height, column * width:(column + 1) * width] = compositor.compose(frame, data_index)
+            writer.write(canvas)
+    finally:
+        for stream in streams:
+            stream.close()
+    return writer.frames
@@ -2,13 +2,31 @@ import cv2
 import time
 import argparse
 import textwrap
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from force_analysis import *
 from matplotlib.animation import FuncAnimation
+from frame_compositor import FrameCompositor, FFmpegWriter, FramePipeline
+from frame_index import FrameIndex
+from video_clips import cut_clip
+from video_montage import TrialStream, render_montage, grid_shape
+from offset_estimator import motion_energy, estimate_offset, load_offset, MIN_SCORE
+from render_manifest import RenderManifest
+from instrumentation import add_profile_arguments, profile_run
+from event_log import log, events, configure, add_logging_arguments
+from trial_result import add_analysis_arguments, analysis_arguments
 
 class VideoPlayer(TravelerAnalysisBase):
-    def __init__(self):
-        parser = self.init_argparse()
-        self.args = parser.parse_args()
+    def __init__(self, args=None, paths=None):
+        if (args is None):
+            parser = self.init_argparse()
+            args = parser.parse_args()
+        self.args = args
+        configure(self.args.quiet, self.args.verbose, self.args.events)
+        if (self.args.profile and self.args.jobs > 1):
+            # stages are only timed in this process
+            log.info('NOTICE: --profile generates the videos with a single process')
+            self.args.jobs = 1
 
         if (self.args.batch):
             self.mode = 'b'
@@ -17,9 +35,11 @@ class VideoPlayer(TravelerAnalysisBase):
             self.mode = 's'
             bypass_selection = True
 
-        super().__init__(_bypass_selection=bypass_selection)
+        super().__init__(_bypass_selection=bypass_selection, _paths=paths)
         
         self.showLeadingData = True
+        self.config.update(**analysis_arguments(self.args))
+        self.open_registry(self.args.recheck)
 
         # overwrite the axes definition in the base class
         if (self.args.column):
@@ -42,6 +62,9 @@ class VideoPlayer(TravelerAnalysisBase):
         self.end_time = 0
         self.start_index = 0
         self.frame_index = 0
+        self.video_index = None # frame timestamps and keyframes (see frame_index.py)
+        self.frame_data_index = None # data index shown with each video frame
+        self.video_frame = 0 # number of the next frame read from the video
         self.frames_to_pass = 0
         self.frames_to_preview = 0
         self.frames_to_play = 0
@@ -49,6 +72,17 @@ class VideoPlayer(TravelerAnalysisBase):
 
         self.generic_labels = True
 
+        # batch bookkeeping
+        self.manifests = {}
+        self.video_written = None # output file of the last processed trial
+        self.video_seconds = 0 # seconds of source video in the last output
+        self.ffmpeg_threads = None
+        if (self.args.jobs > 1):
+            # split the cores between the worker processes
+            self.ffmpeg_threads = self.args.ffmpeg_threads or max(1, (os.cpu_count() or 1) // self.args.jobs)
+        elif (self.args.ffmpeg_threads):
+            self.ffmpeg_threads = self.args.ffmpeg_threads
+
     def init_argparse(self) -> argparse.ArgumentParser:
         parser = argparse.ArgumentParser(
             usage="%(prog)s [OPTIONS]",
@@ -76,28 +110,134 @@ class VideoPlayer(TravelerAnalysisBase):
         parser.add_argument(
             '-c','--column', action='store_true', help='Stacks the force curve above the video (defaults to side-by-side)'
         )
+        parser.add_argument(
+            '-f','--fast', action='store_true', help='Composites the video frames onto a pre-rendered force curve instead of redrawing the figure for every frame'
+        )
+        parser.add_argument(
+            '-p','--pipeline', action='store_true', help='With --fast, decodes, composites and encodes frames on separate threads and prints per-stage timings'
+        )
+        parser.add_argument(
+            '--clip', action='store_true', help='Cuts the trial segment out of the video without re-encoding it (saved as <name>_clip.mp4)'
+        )
+        parser.add_argument(
+            '--exact', action='store_true', help='With --clip, re-encodes the frames before the first keyframe so the clip starts exactly at the trial start (needs ffprobe)'
+        )
+        parser.add_argument(
+            '-m','--montage', action='store_true', help='Renders all selected trials side by side in one video, aligned on their contact times'
+        )
+        parser.add_argument(
+            '--columns', action='store', type=int, default=None, help='Number of columns of the montage grid (defaults to a square grid)'
+        )
+        parser.add_argument(
+            '--tile-dpi', action='store', type=int, default=50, help='Resolution of each montage tile (defaults to 50 dpi)'
+        )
+        parser.add_argument(
+            '-o','--output', action='store', default=None, help='Output file of the montage (defaults to generatedVideos/montage.mp4)'
+        )
+        parser.add_argument(
+            '-a','--auto-bias', action='store_true', help='Estimates the video/data time offset from the motion in the video instead of using the default bias'
+        )
+        parser.add_argument(
+            '--bias-range', action='store', type=float, nargs=2, default=[-1.0, 2.0], metavar=('MIN', 'MAX'), help='Range of offsets (seconds) searched by --auto-bias (defaults to -1 2)'
+        )
+        parser.add_argument(
+            '-d','--dir', action='store', default=None, help='Data directory to process in batch mode (skips the directory dialog)'
+        )
+        parser.add_argument(
+            '-j','--jobs', action='store', type=int, default=1, help='Number of trials to generate in parallel in batch mode (defaults to 1)'
+        )
+        parser.add_argument(
+            '--ffmpeg-threads', action='store', type=int, default=None, help='Threads per ffmpeg encoder (defaults to the number of cores divided by --jobs)'
+        )
+        parser.add_argument(
+            '--recheck', action='store_true', help='Analyzes the trials found invalid by earlier runs again instead of skipping them'
+        )
+        add_analysis_arguments(parser)
+        add_profile_arguments(parser)
+        add_logging_arguments(parser)
         
 
         return parser
 
-    def process_file(self):
-        super().process_file()
-        if (self.curr_file_valid == False):
-            return
-        self.fig.tight_layout(pad=2.0)
-        self.tracking_dot, = self.ax.plot([], [], 'ro', markersize=12)
-        video_file = self.path.replace('.csv', '.mp4').replace('data', 'videos')
+    def user_selection(self):
+        if (self.args.dir):
+            self.filepath = self.args.dir
+            self.paths = self.traverse_csv_files()
+        else:
+            super().user_selection()
+
+    def video_files(self, path):
+        # (video file, generated video file) for a data file
+        video_file = path.replace('.csv', '.mp4').replace('data', 'videos')
         video_save_file = video_file.replace('videos', 'generatedVideos')
-        if (self.args.column):
+        if (self.args.clip):
+            video_save_file = video_save_file.replace('.mp4', '_clip.mp4')
+        elif (self.args.column):
             video_save_file = video_save_file.replace('.mp4', '_column.mp4')
         else:
             video_save_file = video_save_file.replace('.mp4', '_row.mp4')
+        return video_file, video_save_file
+
+    def process_file(self):
+        self.video_written = None
+        super().process_file()
+        if (self.curr_file_valid):
+            self.generate_video()
+        self.log_trial(video=self.video_written)
+
+    def end_trial(self):
+        # trials are logged once their video is generated (see process_file)
+        pass
+
+    def generate_video(self):
+        self.fig.tight_layout(pad=2.0)
+        self.tracking_dot, = self.ax.plot([], [], 'ro', markersize=12)
+        video_save_file = self.video_files(self.path)[1]
+
+        if (self.open_video()):
+            # make the generatedVideos directory if it does not exist
+            if (not os.path.exists(video_save_file.replace(video_save_file.split('/')[-1], ''))):
+                os.makedirs(video_save_file.replace(video_save_file.split('/')[-1], ''))
+
+            if (self.args.clip):
+                self.extract_clip(video_save_file)
+                self.cap.release()
+                return
+            if (self.args.fast):
+                self.render_composite(video_save_file)
+                self.cap.release()
+                self.video_written = video_save_file
+                return
+            # Animate the figure
+            num_frames = 2 * self.frames_to_play + self.frames_to_preview
+            if (self.FPS > 60):
+                self.duty_cycle = 4
+            else:
+                self.duty_cycle = 1
+            ani = FuncAnimation(self.fig, self.update, frames=num_frames, init_func=self.init, interval=1, cache_frame_data=False)
+            # saves the animation in our desktop
+            extra_args = None
+            if (self.ffmpeg_threads is not None):
+                extra_args = ['-threads', str(self.ffmpeg_threads)]
+            ani.save(video_save_file, writer = 'ffmpeg', fps = int(self.FPS), extra_args=extra_args)
+            # play the animation
+            log.info('Processing Complete!')
+            self.video_written = video_save_file
+
+        if (self.cap is not None):
+            self.cap.release()
 
-        if (self.data_dict['version'] == 0): # for WS video files that are .avi format
+    def open_video(self):
+        # opens the video of the current trial, sets the bias and maps its frames to the data
+        self.cap = None
+        video_file = self.video_files(self.path)[0]
+
+        if (self.record.version == 0): # for WS video files that are .avi format
             video_file = video_file.replace('.mp4', '_rotated.mp4')
-        print('Video file: ', video_file)
+        log.debug('Video file: %s', video_file)
 
         if ('WS' in video_file):
+            self.flip = False
             self.bias = 0.33
         else:
             self.flip = True
@@ -105,45 +245,62 @@ class VideoPlayer(TravelerAnalysisBase):
             
         # exit if the video file does not exist
         if (not os.path.exists(video_file)):
-            print('ERROR: Video file does not exist!')
-            return
-        
-        # make the generatedVideos directory if it does not exist
-        if (not os.path.exists(video_save_file.replace(video_save_file.split('/')[-1], ''))):
-            os.makedirs(video_save_file.replace(video_save_file.split('/')[-1], ''))
+            self.invalidate('open_video', 'missing video file', 'ERROR: Video file does not exist!')
+            return False
 
+        self.video_file = video_file
         self.cap = cv2.VideoCapture(video_file)
 
         if (self.cap.isOpened() == False):
-            print("Error opening the video file")
+            self.invalidate('open_video', 'unreadable video file', 'Error opening the video file')
+            return False
+
+        log.debug('Video File opened!')
+        self.FPS = int(self.cap.get(5)) # get the video FPS
+        self.frames_to_preview = 0
+        log.debug('Video FPS: %s', self.FPS)
+        if (self.args.auto_bias):
+            self.estimate_bias()
+        self.setup()
+        self.video_seconds = self.frames_to_play / self.FPS
+        return True
+
+    def estimate_bias(self):
+        # replaces the default bias with one estimated from the motion in the video (see offset_estimator.py)
+        self.video_index = FrameIndex.load(self.video_file, self.cap)
+        data_time = self.record.time
+        if (self.record.mode == 0):
+            position = self.record.position_y
         else:
-            print('Video File opened!')
-            self.FPS = int(self.cap.get(5)) # get the video FPS
-            self.frames_to_preview = 0
-            print('Video FPS: ', self.FPS )
-            self.setup()
-            # Animate the figure
-            num_frames = 2 * self.frames_to_play + self.frames_to_preview
-            if (self.FPS > 60):
-                self.duty_cycle = 4
-            else:
-                self.duty_cycle = 1
-            ani = FuncAnimation(self.fig, self.update, frames=num_frames, init_func=self.init, interval=1, cache_frame_data=False)
-            # saves the animation in our desktop
-            ani.save(video_save_file, writer = 'ffmpeg', fps = int(self.FPS))
-            # play the animation
-            print('Processing Complete!')
+            position = self.record.position_x
+        low, high = self.args.bias_range
 
-        self.cap.release()
+        def estimate():
+            # only the part of the video that can overlap the data is decoded
+            start_frame = self.video_index.frame_at(data_time[0] - high)
+            end_frame = self.video_index.frame_at(data_time[-1] - low) + 1
+            energy_time, energy = motion_energy(self.cap, self.video_index, start_frame, end_frame)
+            return estimate_offset(data_time, position, energy_time, energy, (low, high))
+
+        bias, score = load_offset(self.video_file, self.path, (low, high), estimate)
+        if (bias is None or score < MIN_SCORE):
+            events.warn('video offset not estimated', 'WARNING: Could not estimate the video offset (correlation {:.2f})... using the default bias of {:.2f} s'.format(score, self.bias), self.path)
+            return
+        log.info('Estimated video offset: {:.3f} s (correlation {:.2f})'.format(bias, score))
+        self.bias = bias
 
     def setup(self):
         # get start time of plot
-        # end_index = self.data_dict['end_index']
-        self.start_time = self.data_dict['trimmed_time'][0]
-        self.end_time = self.data_dict['trimmed_time'][-1]
+        # end_index = self.record.end_index
+        self.start_time = self.record.trimmed_time[0]
+        self.end_time = self.record.trimmed_time[-1]
+
+        # map every video frame to the data point shown with it
+        self.video_index = FrameIndex.load(self.video_file, self.cap)
+        self.frame_data_index = self.video_index.data_indices(self.record.trimmed_time, self.bias)
 
         # adjust the frames to pass to preview some of the video
-        self.frames_to_pass = int((self.start_time - self.bias) * self.FPS)
+        self.frames_to_pass = self.video_index.frame_at(self.start_time - self.bias)
         
         self.frames_to_play = int((self.end_time - self.start_time) * self.FPS)
         self.frame_count = int(self.cap.get(7))
@@ -158,20 +315,34 @@ class VideoPlayer(TravelerAnalysisBase):
             self.ax.set_title('Force vs. Depth',fontsize=18)
             self.fig.suptitle('')
 
-    def init(self):
-        for i in range(self.frames_to_pass):
-            self.cap.read()
+    def read_first_frame(self):
+        # seek to the start of the trial and read the first frame to show
+        self.video_frame = self.video_index.seek(self.cap, self.frames_to_pass)
 
         ret, frame = self.cap.read()
+        self.video_frame += 1
         if self.flip:
             frame = cv2.flip(frame, 0)
+        return frame
+
+    def data_index_at(self, frame_number):
+        # index of the data point shown with the given video frame
+        frame_number = min(frame_number, len(self.frame_data_index) - 1)
+        return int(self.frame_data_index[frame_number])
+
+    def frame_time(self, frame_number):
+        frame_number = min(frame_number, len(self.video_index) - 1)
+        return self.video_index.timestamps[frame_number] + self.bias
+
+    def init(self):
+        frame = self.read_first_frame()
         # window_name = 'image'   
         # cv2.imshow(window_name, frame)
         self.video_img = self.video_ax.imshow(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
         self.video_ax.axis('off')
 
-        x_data = self.data_dict['trimmed_pos'][0]
-        y_data = self.data_dict['trimmed_force'][0]
+        x_data = self.record.trimmed_pos[0]
+        y_data = self.record.trimmed_force[0]
         self.tracking_dot.set_data(x_data, y_data)
         self.preview_counter = 0
 
@@ -181,8 +352,9 @@ class VideoPlayer(TravelerAnalysisBase):
             if (i % self.duty_cycle == 0):
                 ret, frame = self.cap.read()
                 if not ret:
-                    print('frame reading error!')
+                    events.warn('frame reading error', 'frame reading error!', self.path)
                     return
+                self.video_frame += 1
                 
                 # flip the frame vertically
                 if self.flip:
@@ -191,34 +363,292 @@ class VideoPlayer(TravelerAnalysisBase):
                 # Display the video frame with the plot
                 self.video_img.set_array(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
             else:
-                self.cap.read()
+                self.cap.grab()
+                self.video_frame += 1
 
             # Update the plot
             # get the time of the video
-            curr_time = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000 + self.bias
-            data_index = bisect_right(self.data_dict['trimmed_time'], curr_time) - 1
-            if (data_index < 0):
-                data_index = 0
-            x_data = self.data_dict['trimmed_pos'][data_index]
-            y_data = self.data_dict['trimmed_force'][data_index]
+            curr_time = self.frame_time(self.video_frame - 1)
+            data_index = self.data_index_at(self.video_frame - 1)
+            x_data = self.record.trimmed_pos[data_index]
+            y_data = self.record.trimmed_force[data_index]
             self.tracking_dot.set_data(x_data, y_data)
 
             if (i % 30 == 0) :
-                print('Data Updated to: [', x_data, ', ', y_data, ']')
-                print('Video Frame: ', int(self.cap.get(cv2.CAP_PROP_POS_FRAMES)))
-                print('Time: ', curr_time)
-                print('Data Index: ', data_index)
+                log.debug('Data Updated to: [%s, %s] Video Frame: %d Time: %s Data Index: %d',
+                          x_data, y_data, self.video_frame - 1, curr_time, data_index)
         
         self.frame_index += 1
 
+    def extract_clip(self, video_save_file):
+        # cuts the video segment that matches the processed trial window
+        start = max(self.start_time - self.bias, 0.0)
+        end = self.end_time - self.bias
+        self.video_seconds = end - start
+        keyframe_times = self.video_index.timestamps[self.video_index.keyframes]
+        fourcc = int(self.cap.get(cv2.CAP_PROP_FOURCC))
+        fourcc = ''.join(chr((fourcc >> (8 * i)) & 0xFF) for i in range(4))
+
+        method = cut_clip(self.video_file, video_save_file, start, end, keyframe_times, self.args.exact,
+                          fourcc, self.video_index.fps, self.ffmpeg_threads)
+        if (method is not None):
+            log.info('Saved clip [{:.2f} s, {:.2f} s] ({}) as file: {}'.format(start, end, method, video_save_file))
+            self.video_written = video_save_file
+
+    def render_composite(self, video_save_file):
+        # renders the force curve once and composites every video frame and the tracking dot onto it
+        start = time.perf_counter()
+        frame = self.read_first_frame()
+        self.video_ax.clear()
+        self.video_img = self.video_ax.imshow(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        self.video_ax.axis('off')
+
+        compositor = FrameCompositor(self.fig, self.ax, self.video_ax, self.video_img, self.tracking_dot,
+                                     self.record.trimmed_pos, self.record.trimmed_force)
+
+        # the animation shows every video frame for two output frames (half speed), and
+        # only every other frame above 60 FPS; the same result at a lower output frame rate
+        frame_step = 2 if self.FPS > 60 else 1
+        writer = FFmpegWriter(video_save_file, compositor.width, compositor.height, self.FPS / (2 * frame_step), self.ffmpeg_threads)
+
+        frames = self.decoded_frames(frame, frame_step)
+        if (self.args.pipeline):
+            pipeline = FramePipeline(frames, lambda item: compositor.compose(*item), writer.write)
+            pipeline.run()
+            writer.close()
+            pipeline.print_timings()
+            return
+
+        for frame, data_index in frames:
+            writer.write(compositor.compose(frame, data_index))
+
+        writer.close()
+        elapsed = time.perf_counter() - start
+        log.info('Processing Complete! {} frames in {:.1f} s ({:.0f} frames/s)'.format(writer.frames, elapsed, writer.frames / max(elapsed, 1e-9)))
+
+    def decoded_frames(self, first_frame, frame_step):
+        # yields (BGR frame, data index) for every output frame of the trial
+        yield first_frame, self.data_index_at(self.video_frame - 1)
+        for i in range(1, self.frames_to_play):
+            if (i % frame_step != 0):
+                # skipped frames are grabbed but not retrieved
+                if not self.cap.grab():
+                    break
+                self.video_frame += 1
+                continue
+
+            ret, frame = self.cap.read()
+            if not ret:
+                events.warn('frame reading error', 'frame reading error!', self.path)
+                break
+            self.video_frame += 1
+            if self.flip:
+                frame = cv2.flip(frame, 0)
+
+            data_index = self.data_index_at(self.video_frame - 1)
+            if (i % 300 == 0):
+                log.debug('Video Frame: %d Data Index: %d', self.video_frame - 1, data_index)
+            yield frame, data_index
+
+    def run(self):
+        if (self.args.montage):
+            self.run_montage()
+            return
+
+        start = time.perf_counter()
+        paths = self.plan_videos(self.paths)
+
+        if (self.args.jobs > 1 and len(paths) > 1):
+            self.run_parallel(paths)
+        else:
+            for self.path in paths:
+                self.process_file()
+                self.finish_video(self.path, self.video_written, self.video_seconds)
+                self.path_index += 1
+                self.ax.clear()
+
+        for manifest in self.manifests.values():
+            manifest.save()
+        self.save_registry()
+        self.print_summary(len(paths), time.perf_counter() - start)
+
+    def run_parallel(self, paths):
+        # each worker process generates whole videos; the manifests are only updated here
+        log.info('Generating %d videos with %d worker processes (%s ffmpeg threads each)...', len(paths), self.args.jobs, self.ffmpeg_threads)
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.args.jobs, mp_context=context,
+                                 initializer=init_video_worker, initargs=(self.args,)) as executor:
+            for path, video_written, video_seconds, worker_events, status in executor.map(render_video, paths):
+                events.merge(worker_events)
+                self.register_trial(path, *status)
+                self.finish_video(path, video_written, video_seconds)
+                self.path_index += 1
+
+    ## Incremental generation (see render_manifest.py)
+    def render_settings(self):
+        return {
+            'column': self.args.column,
+            'fast': self.args.fast,
+            'clip': self.args.clip and ('exact' if self.args.exact else 'copy'),
+            'auto_bias': self.args.auto_bias and list(self.args.bias_range),
+            'config': self.config.config_hash()
+        }
+
+    def video_sources(self, path):
+        # the data file and whichever of its video files exist
+        video_file, video_save_file = self.video_files(path)
+        candidates = [video_file, video_file.replace('.mp4', '_rotated.mp4')]
+        return [path] + [f for f in candidates if os.path.exists(f)]
+
+    def get_manifest(self, video_save_file):
+        folder = os.path.dirname(video_save_file)
+        if (folder not in self.manifests):
+            self.manifests[folder] = RenderManifest(folder)
+        return self.manifests[folder]
+
+    def plan_videos(self, paths):
+        # returns the trials whose generated video is missing or out of date
+        self.generated = []
+        self.failed = []
+        self.up_to_date = 0
+        self.missing_video = 0
+        settings = self.render_settings()
+
+        stale = []
+        for path in paths:
+            sources = self.video_sources(path)
+            if (len(sources) == 1):
+                self.missing_video += 1
+                continue
+            video_save_file = self.video_files(path)[1]
+            if (self.get_manifest(video_save_file).is_fresh(os.path.basename(video_save_file), sources, settings)):
+                self.up_to_date += 1
+                continue
+            stale.append(path)
+
+        if (len(paths) > 1):
+            log.info('%d of %d videos to generate (%d up to date, %d without a video file)', len(stale), len(paths), self.up_to_date, self.missing_video)
+        return stale
+
+    def finish_video(self, path, video_written, video_seconds):
+        if (video_written is None):
+            self.failed.append(path)
+            return
+        self.generated.append(video_seconds)
+        self.get_manifest(video_written).record(os.path.basename(video_written), self.video_sources(path), self.render_settings())
+
+    def print_summary(self, num_planned, elapsed):
+        video_seconds = sum(self.generated)
+        log.info('\nGenerated {} of {} videos in {:.1f} s'.format(len(self.generated), num_planned, elapsed))
+        log.info('  up to date: %d, failed or invalid: %d, without a video file: %d', self.up_to_date, len(self.failed), self.missing_video)
+        if (len(self.generated) > 0 and elapsed > 0):
+            log.info('  throughput: {:.1f} videos/hour, {:.2f}x real time ({:.1f} s of trial video)'.format(
+                3600 * len(self.generated) / elapsed, video_seconds / elapsed, video_seconds))
+
+    ## Montage of several trials
+    def prepare_tile(self):
+        # analyzes the current trial and renders its montage tile background; returns None if unavailable
+        self.ax.clear()
+        self.curr_file_valid = True
+        TravelerAnalysisBase.process_file(self)
+        if (self.curr_file_valid == False):
+            return None
+        self.fig.tight_layout(pad=2.0)
+        self.tracking_dot, = self.ax.plot([], [], 'ro', markersize=12)
+        if (not self.open_video()):
+            return None
+        self.ax.set_title(self.record.trial_ID, fontsize=18)
+
+        frame = self.read_first_frame()
+        self.video_ax.clear()
+        self.video_img = self.video_ax.imshow(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        self.video_ax.axis('off')
+        compositor = FrameCompositor(self.fig, self.ax, self.video_ax, self.video_img, self.tracking_dot,
+                                     self.record.trimmed_pos, self.record.trimmed_force)
+
+        # the trial window relative to the contact time, and the contact time in the video
+        contact_time = self.record.contact_time
+        return {
+            'compositor': compositor,
+            'cap': self.cap,
+            'video_index': self.video_index,
+            'frame_data_index': self.frame_data_index,
+            'flip': self.flip,
+            'video_contact_time': contact_time - self.bias,
+            'window': (self.start_time - contact_time, self.end_time - contact_time)
+        }
+
+    def run_montage(self):
+        start = time.perf_counter()
+        self.fig.set_dpi(self.args.tile_dpi)
+
+        tiles = []
+        for self.path in self.paths:
+            tile = self.prepare_tile()
+            self.log_trial()
+            if (tile is not None):
+                tiles.append(tile)
+            self.path_index += 1
+        self.save_registry()
+        if (len(tiles) == 0):
+            log.error('No trials with videos to show... exiting...')
+            return
+
+        # common timeline (seconds from contact) covering every trial window, one output
+        # frame per video frame of the first trial at half speed like the other renderers
+        window_start = min(tile['window'][0] for tile in tiles)
+        window_end = max(tile['window'][1] for tile in tiles)
+        fps = tiles[0]['video_index'].fps
+        timeline = np.arange(window_start, window_end, 1.0 / fps)
+
+        streams = [TrialStream(tile['cap'], tile['video_index'], tile['frame_data_index'],
+                               tile['video_contact_time'] + timeline, tile['flip']) for tile in tiles]
+        compositors = [tile['compositor'] for tile in tiles]
+
+        output = self.args.output
+        if (output is None):
+            output = os.path.join(os.path.dirname(self.video_files(self.paths[0])[1]), 'montage.mp4')
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+
+        rows, columns = grid_shape(len(tiles), self.args.columns)
+        log.info('Rendering montage of %d trials (%dx%d grid, %d frames)...', len(tiles), rows, columns, len(timeline))
+        writer = FFmpegWriter(output, columns * compositors[0].width, rows * compositors[0].height, fps / 2, self.ffmpeg_threads)
+        frames = render_montage(compositors, streams, writer, columns)
+        writer.close()
+
+        elapsed = time.perf_counter() - start
+        log.info('Saved montage as file: %s', output)
+        log.info('Processing Complete! {} frames in {:.1f} s ({:.0f} frames/s)'.format(frames, elapsed, frames / max(elapsed, 1e-9)))
+
     def grab_frame(cap):
         ret,frame = cap.read()
         if not ret:
-            print('frame reading error!')
+            events.warn('frame reading error', 'WARNING: Frame reading error!')
             return
         return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
 
         
+def init_video_worker(args):
+    global video_player
+    plt.switch_backend('Agg')
+    video_player = VideoPlayer(args=args, paths=[])
+    if (video_player.ffmpeg_threads is not None):
+        cv2.setNumThreads(video_player.ffmpeg_threads)
+
+def render_video(path):
+    # generates the video of one trial, returning (path, output file or None, seconds of video, events, trial status)
+    player = video_player
+    player.path = path
+    player.process_file()
+    player.ax.clear()
+    # the invalid trial registry is updated by the main process
+    status = (player.curr_file_valid, player.invalid_stage, player.invalid_reason)
+    return path, player.video_written, player.video_seconds, events.drain(), status
+
+
 if __name__ == "__main__":
     player = VideoPlayer()
-    player.run()
+    if (player.args.profile):
+        profile_run(player, player.run, player.args.profile, player.args.cprofile)
+    else:
+        player.run()
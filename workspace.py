@@ -0,0 +1,125 @@
+import os
+import json
+import hashlib
+
+
+"""
+    Class: DatasetWorkspace
+    Description:
+        Holds any number of named, processed datasets so that plotters can
+        switch between, union, or compare them without re-running the
+        analysis pipeline.
+
+        Each dataset is a dictionary with the following keys:
+            - name
+            - directory
+            - key (hash of the directory contents and analysis parameters)
+            - params (analysis parameters used to produce the data)
+            - data_vector (list of per-trial dictionaries)
+            - aggregated_data
+            - filenames
+            - paths (source .csv files)
+            - metrics_rows (rows written to metrics.csv)
+
+        Datasets are cached in memory, keyed by the dataset key, and reused as
+        long as none of their files (or the parameters) change. They are not
+        written to disk: rebuilding a dataset reads the per-trial results of
+        earlier runs from the result cache (see result_cache.py).
+"""
+
+CACHE_VERSION = 2
+
+
+class DatasetWorkspace:
+    def __init__(self):
+        self.datasets = {}      # name -> dataset
+        self.memory_cache = {}  # key -> dataset
+        self.active = None
+
+    def names(self):
+        return list(self.datasets.keys())
+
+    def get(self, name):
+        return self.datasets[name]
+
+    def switch(self, name):
+        self.active = name
+        return self.datasets[name]
+
+    def dataset_key(self, directory, paths, params):
+        # the key depends on every file in the dataset (path, size and modification
+        # time) so edited or added trials invalidate the cached dataset
+        files = []
+        for path in paths:
+            stat = os.stat(path)
+            files.append([os.path.relpath(path, directory), stat.st_size, stat.st_mtime_ns])
+
+        description = {
+            'version': CACHE_VERSION,
+            'directory': os.path.abspath(directory),
+            'params': params,
+            'files': files
+        }
+        encoded = json.dumps(description, sort_keys=True, default=str).encode('utf-8')
+        return hashlib.sha1(encoded).hexdigest()
+
+    def load(self, name, directory, paths, params, build_fn):
+        """
+        Returns the dataset for (directory, params), building it with build_fn()
+        only if it is not already cached in memory. build_fn must
+        return a dictionary with the data_vector, aggregated_data, filenames,
+        paths and metrics_rows keys.
+        """
+        key = self.dataset_key(directory, paths, params)
+
+        dataset = self.memory_cache.get(key)
+        if (dataset is None):
+            dataset = build_fn()
+            dataset['directory'] = directory
+            dataset['key'] = key
+            dataset['params'] = params
+
+        self.memory_cache[key] = dataset
+        return self.add(name, dataset)
+
+    def add(self, name, dataset):
+        # avoid clobbering a different dataset that happens to have the same name
+        base_name = name
+        counter = 2
+        while (name in self.datasets and self.datasets[name].get('key') != dataset.get('key')):
+            name = base_name + ' (' + str(counter) + ')'
+            counter += 1
+
+        dataset = dict(dataset)
+        dataset['name'] = name
+        self.datasets[name] = dataset
+        self.active = name
+        return dataset
+
+    def union(self, names, name=None):
+        # concatenates the per-trial data of several datasets. The aggregated data is
+        # left empty so the caller can re-aggregate the combined data vector.
+        if (name is None):
+            name = ' + '.join(names)
+
+        data_vector = []
+        filenames = []
+        paths = []
+        metrics_rows = []
+        for n in names:
+            data_vector.extend(self.datasets[n]['data_vector'])
+            filenames.extend(self.datasets[n]['filenames'])
+            paths.extend(self.datasets[n]['paths'])
+            metrics_rows.extend(self.datasets[n]['metrics_rows'])
+
+        dataset = {
+            'directory': self.datasets[names[0]]['directory'],
+            'key': 'union:' + ','.join(self.datasets[n]['key'] for n in names),
+            'params': self.datasets[names[0]]['params'],
+            'data_vector': data_vector,
+            'aggregated_data': {},
+            'filenames': filenames,
+            'paths': paths,
+            'metrics_rows': metrics_rows
+        }
+        return self.add(name, dataset)